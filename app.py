@@ -1,18 +1,41 @@
+import hashlib
+import math
 import os
-from flask import Flask, request, jsonify
-from werkzeug.utils import secure_filename
-from backend.fileutils import allowed_file, temp_filepath
-from backend.speech_recognizer import recognize_from_file, RecognitionError
-from backend.command_parser import parse_command, ROOMS_MAP
+from flask import Flask, g, request, jsonify
+from backend.fileutils import allowed_file
+from backend.speech_recognizer import (
+    recognize_from_bytes, transcribe_batch, RecognitionError, RecognitionTimeout, RecognizerBusy, init_recognizer,
+    recognizer_status,
+)
+from backend.recognition_workers import RecognitionWorkers
+from backend.keyword_spotter import FastPathStats, recognize_command
+from backend.intent_engine import IntentEngine
+from backend.models.online_trainer import OnlineTrainer
+from backend.command_log import CommandLog
+from backend.telemetry import TimeSeriesStore
+from backend.sensor_ingest import STATE_METRICS, SensorIngest, process_memory
+from backend.scenes import SCENES, compile_plan, invalid_commands, scene_list
+from backend.scheduler import Scheduler
+from backend.metrics import METRICS, SamplingProfiler, top_functions
+from backend import command_parser
+from backend.command_parser import normalize, ROOMS_MAP
+from backend.cache import LRUCache
 from dotenv import load_dotenv
 from flask_cors import CORS
 from flask import Response
 import json
-import queue
+import sqlite3
 import threading
+import time
 from backend import db
+from backend.db import DEFAULT_HOME
+from backend.households import Household, Households, HomeError, valid_home
+from backend.broadcast import BroadcastScheduler
+from backend.cluster import ClusterNode, ClusterError
+from backend.pubsub import RESYNC, SubscriptionClosed
 import random
 from flask import url_for
+from werkzeug.test import EnvironBuilder
 from flask import send_from_directory
 
 load_dotenv()
@@ -22,115 +45,368 @@ app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024
 
 db.init_db()
 
-ROOMS = ["зал", "кухня", "комната", "ванная"]
+# "thread": Whisper replicas inside this process; "process": separate worker
+# processes behind a bounded queue (see backend/recognition_workers.py).
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "thread")
+WHISPER_DEADLINE = float(os.getenv("WHISPER_DEADLINE", "30"))
+RECOGNITION_WORKERS = None
 
-for room in ROOMS:
-    dev = db.get_device_by_room_and_type(room, "thermometer")
-    if not dev:
-        db.create_device(name=f"thermometer:{room}", room=room, type_="thermometer", is_on=True)
+if WHISPER_BACKEND == "process":
+    RECOGNITION_WORKERS = RecognitionWorkers(
+        workers=int(os.getenv("WHISPER_PROCESSES", "2")),
+        max_queue=int(os.getenv("WHISPER_QUEUE", "8")),
+    )
+    RECOGNITION_WORKERS.start()
+elif os.getenv("WHISPER_PRELOAD", "1") != "0":
+    init_recognizer(background=True)
 
-for room in ROOMS:
-    dev = db.get_device_by_room_and_type(room, "light")
-    if not dev:
-        is_on = bool(random.getrandbits(1))
-        db.create_device(name=f"light:{room}", room=room, type_="light", is_on=is_on)
+INTENT_CACHE = LRUCache(
+    maxsize=int(os.getenv("INTENT_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("INTENT_CACHE_TTL", "3600")),
+)
+# Rules first; the command classifier covers phrasings the patterns miss
+# (backend/intent_engine.py). Loaded from the newest artifact in the background.
+INTENT_ENGINE = IntentEngine(
+    mode=os.getenv("INTENT_ENGINE", "fallback"),
+    min_confidence=float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", "0.5")),
+    top_k=int(os.getenv("CLASSIFIER_TOP_K", "3")),
+    max_delay=float(os.getenv("CLASSIFIER_BATCH_MS", "2")) / 1000,
+)
+# Executed commands are logged; rule matches and explicit corrections become
+# training rows for the background trainer, which publishes new classifier
+# versions and swaps them in (backend/models/online_trainer.py).
+COMMAND_LOG = CommandLog()
+COMMAND_LOG.start()
+CLASSIFIER_TRAINING = os.getenv("CLASSIFIER_TRAINING", "1") != "0" and INTENT_ENGINE.mode != "rules"
+INTENT_ENGINE.start(bootstrap=not CLASSIFIER_TRAINING)
+TRAINER = None
+if CLASSIFIER_TRAINING:
+    TRAINER = OnlineTrainer(
+        INTENT_ENGINE,
+        interval=float(os.getenv("CLASSIFIER_TRAIN_INTERVAL", "300")),
+        min_new=int(os.getenv("CLASSIFIER_TRAIN_MIN_NEW", "20")),
+    )
+    TRAINER.start()
 
-DEVICE_STATE = {
-    "lights": {},
-    "thermometers": {},  
-}
+# Keyed by a hash of the uploaded bytes: exact replays (automation scripts,
+# retries) skip decoding and inference entirely.
+TRANSCRIPT_CACHE = LRUCache(
+    maxsize=int(os.getenv("TRANSCRIPT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("TRANSCRIPT_CACHE_TTL", "600")),
+)
+
+# Short in-vocabulary commands are answered by a cheap constrained pass and
+# only fall back to full transcription when it is unsure (backend/keyword_spotter.py).
+FAST_PATH = os.getenv("FAST_PATH", "1") != "0"
+FAST_PATH_STATS = FastPathStats()
+
+def _recognize(data: bytes) -> str:
+    key = hashlib.blake2b(data, digest_size=16).digest()
+    text = TRANSCRIPT_CACHE.get(key)
+    if text is not None:
+        METRICS.inc("recognitions_total", stage="cache")
+        return text
+    if FAST_PATH:
+        if RECOGNITION_WORKERS is not None:
+            text, info = RECOGNITION_WORKERS.recognize_command(data, language="ru-RU", timeout=WHISPER_DEADLINE)
+        else:
+            text, info = recognize_command(data, language="ru-RU", timeout=WHISPER_DEADLINE)
+        FAST_PATH_STATS.record(info)
+        # The stages ran wherever the recognizer lives (maybe a worker process); their times come back in info.
+        for stage, key_ms in (("decode", "decode_ms"), ("fast_pass", "fast_ms"), ("transcribe", "full_ms")):
+            if info.get(key_ms) is not None:
+                METRICS.observe("stage_seconds", info[key_ms] / 1000, stage=stage)
+        METRICS.inc("recognitions_total", stage=info["stage"])
+    else:
+        with METRICS.stage("transcribe"):
+            if RECOGNITION_WORKERS is not None:
+                text = RECOGNITION_WORKERS.recognize(data, language="ru-RU", timeout=WHISPER_DEADLINE)
+            else:
+                text = recognize_from_bytes(data, language="ru-RU", timeout=WHISPER_DEADLINE)
+        METRICS.inc("recognitions_total", stage="full")
+    TRANSCRIPT_CACHE.put(key, text)
+    return text
+
+SPEECH_BATCH_MAX = int(os.getenv("SPEECH_BATCH_MAX", "64"))
+
+def _recognize_batch(clips: list, beam_size: int, batch_size: int) -> list:
+    if RECOGNITION_WORKERS is not None:
+        groups = -(-len(clips) // batch_size)
+        return RECOGNITION_WORKERS.transcribe_batch(
+            clips, language="ru-RU", timeout=WHISPER_DEADLINE * groups, beam_size=beam_size, batch_size=batch_size,
+        )
+    return list(transcribe_batch(
+        clips, language="ru-RU", beam_size=beam_size, batch_size=batch_size, timeout=WHISPER_DEADLINE,
+    ))
+
+def _recognizer_status() -> dict:
+    if RECOGNITION_WORKERS is not None:
+        return RECOGNITION_WORKERS.status()
+    return recognizer_status()
 
-def _update_thermometers():
+ROOMS = ["зал", "кухня", "комната", "ванная"]
+
+# Thermometer readings over time: in-memory rings plus 1m/1h rollups in SQLite
+# (backend/telemetry.py), served by /api/sensors/<room>/history.
+TELEMETRY = TimeSeriesStore(
+    capacity=int(os.getenv("SENSOR_RING_SIZE", "4096")),
+    flush_interval=float(os.getenv("SENSOR_FLUSH_INTERVAL", "10")),
+    max_series=int(os.getenv("SENSOR_SERIES_MAX", "5000")),
+)
+TELEMETRY.start()
+
+def _record_thermometer(home: Household, room: str, t: dict) -> None:
+    TELEMETRY.record_many([
+        (home.home, room, "temperature", t["temperature"], None),
+        (home.home, room, "humidity", t["humidity"], None),
+    ])
+
+def _update_thermometers(home: Household):
     for room in ROOMS:
 
-        DEVICE_STATE["thermometers"][room] = {
+        home.thermometers[room] = {
             "temperature": round(random.uniform(18, 28), 1),
             "humidity": round(random.uniform(30, 70), 1),
         }
+        _record_thermometer(home, room, home.thermometers[room])
 
-_update_thermometers()
+def _restore_thermometers(home: Household) -> None:
+    # A home loaded again (restart, or unloaded while idle) continues from its
+    # last readings; nothing is recorded, they are already in the history.
+    last = TELEMETRY.last_values(home.home)
+    for room in set(ROOMS).union(room for room, values in last.items() if set(values) & set(STATE_METRICS)):
+        t = {"temperature": 22.0, "humidity": 50.0}
+        t.update({metric: value for metric, value in last.get(room, {}).items() if metric in STATE_METRICS})
+        home.thermometers[room] = t
 
-_SUBSCRIBERS = []
-_STATE_LOCK = threading.Lock()
+# Set when this process is one of several workers (python -m backend.cluster):
+# every household is owned by one of them, see backend/cluster.py.
+CLUSTER = ClusterNode.from_env()
 
-def _get_devices_snapshot() -> dict:
-    with _STATE_LOCK:
-        snapshot = json.loads(json.dumps(DEVICE_STATE))
+def _setup_home(home: Household) -> None:
+    if home.replica:
+        home.load_snapshot(CLUSTER.call(CLUSTER.owner(home.home), "snapshot", {"home": home.home}))
+        return
+    registry = home.registry
+    registry.load()
+    created = not registry.list()
 
+    for room in ROOMS:
+        if not registry.find(room, "thermometer"):
+            registry.ensure(room, "thermometer", is_on=True)
+
+    for room in ROOMS:
+        if not registry.find(room, "light"):
+            registry.ensure(room, "light", is_on=bool(random.getrandbits(1)))
+
+    if created:
+        _update_thermometers(home)
+    else:
+        _restore_thermometers(home)
+    snapshot = home.snapshot()
+    snapshot["timers"] = [_timer_state(job) for job in SCHEDULER.jobs(home.home)]
+    # seq starts from the load time in ms, so it keeps growing across restarts
+    # of the owner and replicas of this home notice the jump.
+    home.store.reset(snapshot, seq=int(time.time() * 1000))
+
+# Households are loaded on first use: devices from SQLite, sensor values,
+# and the StateStore + Hub their dashboard streams are served from.
+HOMES = Households(
+    _setup_home,
+    exists=db.home_exists,
+    count=db.count_homes,
+    max_homes=int(os.getenv("HOMES_MAX", "1000")),
+    max_resident=int(os.getenv("HOMES_RESIDENT_MAX", "256")),
+    hub_maxsize=int(os.getenv("SSE_QUEUE_SIZE", "64")),
+    hub_policy=os.getenv("SSE_SLOW_POLICY", "coalesce"),
+    history=int(os.getenv("SSE_HISTORY", "512")),
+)
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))
+
+def _household(home_id: str, create: bool = False) -> Household:
+    # Reads of a home nobody created are a 404; only writes may start a new one.
+    # In a cluster, a home owned by another worker is served from a replica.
+    return HOMES.get(home_id, replica=CLUSTER is not None and not CLUSTER.owns(home_id), create=create)
+
+def _request_home_id() -> str:
+    return request.args.get("home") or request.headers.get("X-Home") or DEFAULT_HOME
+
+def _device_changes(dev: dict | None) -> list:
+    if not dev:
+        return []
+    changes = [("devices", dev["id"], dev)]
+    if dev["type"] == "light" and dev["room"]:
+        changes.append(("lights", dev["room"], dev["is_on"]))
+    return changes
+
+# Mutations only mark their changes (under the home's lock, so they are recorded
+# in the order the state changed); the scheduler thread turns everything marked
+# within BROADCAST_WINDOW_MS into one delta per home and fans it out
+# (backend/broadcast.py). In a cluster each delta also goes on the change bus.
+BROADCASTER = BroadcastScheduler(
+    window=float(os.getenv("BROADCAST_WINDOW_MS", "50")) / 1000,
+    relay=(lambda home, event: CLUSTER.publish_frame(home.home, *event)) if CLUSTER else None,
+)
+BROADCASTER.start()
+
+def _apply_sensor_readings(latest: dict) -> None:
+    # Everything the ingest coalesced since its last round, per home.
+    for home_id, rooms in latest.items():
+        home = HOMES.get(home_id, create=True)
+        with home.lock:
+            changes = []
+            for room, values in rooms.items():
+                t = home.thermometers.setdefault(room, {"temperature": 22.0, "humidity": 50.0})
+                t.update(values)
+                changes.append(("thermometers", room, dict(t)))
+            BROADCASTER.mark(home, changes)
+
+# Bulk sensor updates (POST /api/sensors/batch): stored as they arrive, pushed
+# to the dashboard at most every SENSOR_BROADCAST_INTERVAL seconds.
+SENSOR_BATCH_MAX = int(os.getenv("SENSOR_BATCH_MAX", "5000"))
+SENSOR_INGEST = SensorIngest(
+    TELEMETRY,
+    _apply_sensor_readings,
+    interval=float(os.getenv("SENSOR_BROADCAST_INTERVAL", "0.25")),
+    room_key=lambda room: _canonicalize_room(room),
+    # a sensor reports for the standard rooms or ones the home has devices in
+    rooms=lambda home_id: {_canonicalize_room(room) for room in _household(home_id).rooms()}.union(ROOMS),
+)
+SENSOR_INGEST.start()
+
+# POST /api/actions: how many actions one request may carry.
+ACTIONS_BATCH_MAX = int(os.getenv("ACTIONS_BATCH_MAX", "500"))
+
+def _apply_command(parsed: dict, home: Household) -> int:
+    # One action, "включи свет на кухне и в зале", "выключи свет и поставь 20",
+    # a scene: whatever it is, it becomes one plan applied at once.
+    commands = parsed.get("params", {}).get("actions") if parsed.get("action") == "multiple" else [parsed]
+    for command in commands or []:
+        if command.get("action") == "set_timer":
+            _start_timer(home, command.get("params") or {})
+    return _apply_plan(compile_plan(parsed, lambda action: _home_rooms(home, action)), home)
+
+def _home_rooms(home: Household, action: str) -> list:
+    if action in LIGHT_ACTIONS:
+        return sorted(home.registry.lights())
+    return sorted(home.thermometers)
+
+LIGHT_ACTIONS = {"turn_on_light": True, "turn_off_light": False}
+
+# How each climate action changes a room's {"temperature", "humidity"}.
+CLIMATE_ACTIONS = {
+    "decrease_temperature": lambda t, p: {"temperature": max(10, t["temperature"] - 1)},
+    "decrease_humidity": lambda t, p: {"humidity": max(20, t["humidity"] - 1)},
+    "set_temperature": lambda t, p: {"temperature": max(10, min(40, float(p["value"])))},
+    "set_humidity": lambda t, p: {"humidity": max(20, min(90, float(p["value"])))},
+}
+
+def _apply_plan(plan: list, home: Household) -> int:
+    """Apply every step under one lock acquisition: light switches in one SQLite
+    transaction, thermometers in memory, and all changes marked together, so the
+    whole plan goes out as one delta. Returns how many steps were applied."""
+    if not plan:
+        return 0
+    lights = {}  # room -> is_on; a later step for the same room wins
+    climate = []
+    for step in plan:
+        if step.action in LIGHT_ACTIONS:
+            lights[step.room] = LIGHT_ACTIONS[step.action]
+        elif step.action in CLIMATE_ACTIONS:
+            climate.append(step)
+    with METRICS.stage("apply"), home.lock:
+        changes = []
+        if lights:
+            with METRICS.stage("db"):
+                devices = home.registry.ensure_many([(room, "light", is_on) for room, is_on in lights.items()])
+            for dev in devices:
+                changes.extend(_device_changes(dev))
+        touched = {}
+        for step in climate:
+            t = home.thermometers.setdefault(step.room, {"temperature": 22.0, "humidity": 50.0})
+            t.update(CLIMATE_ACTIONS[step.action](t, step.params))
+            touched[step.room] = t
+        for room, t in touched.items():
+            changes.append(("thermometers", room, dict(t)))
+        BROADCASTER.mark(home, changes)
+        TELEMETRY.record_many([
+            (home.home, room, metric, t[metric], None) for room, t in touched.items() for metric in ("temperature", "humidity")
+        ])
+    return len(lights) + len(climate)
+
+TIMER_UNITS = {"сек": 1, "мин": 60, "час": 3600}
+
+def _timer_state(job: dict) -> dict:
+    # What dashboards see of a pending job ("timers" section of the stream).
+    return {key: job[key] for key in ("id", "label", "due", "cron", "action", "params")}
+
+def _schedule(home: Household, action: str | None, params: dict, label: str | None, due=None, cron=None) -> dict:
+    # Under the home's lock, so a job that fires right away can't be marked gone before it was marked added.
+    with home.lock:
+        job = SCHEDULER.add(home.home, action, params, label=label, due=due, cron=cron)
+        BROADCASTER.mark(home, [("timers", job["id"], _timer_state(job))])
+    return job
+
+def _start_timer(home: Household, params: dict) -> dict | None:
+    value, unit = params.get("value"), params.get("unit") or ""
+    seconds = next((s for prefix, s in TIMER_UNITS.items() if unit.startswith(prefix)), None)
+    if not isinstance(value, int) or seconds is None:
+        return None
+    try:
+        return _schedule(home, None, {}, f"Таймер на {value} {unit}", due=time.time() + value * seconds)
+    except ValueError:
+        # "на миллиард часов": out of the scheduler's range, no timer
+        return None
+
+def _fire_jobs(jobs: list) -> None:
+    # Everything due in one scheduler round, per home: the actions as one plan,
+    # the fired timers as events, all in one delta.
+    by_home = {}
+    for job in jobs:
+        by_home.setdefault(job["home"], []).append(job)
+    errors = []
+    for home_id, home_jobs in by_home.items():
         try:
-            snapshot["devices"] = db.list_devices()
-        except Exception:
-            snapshot["devices"] = []
-        return snapshot
-
-def _broadcast_state():
-    snapshot = json.dumps(_get_devices_snapshot())
-    dead = []
-    for q in list(_SUBSCRIBERS):
-        try:
-            q.put_nowait(snapshot)
-        except Exception:
-            dead.append(q)
-    if dead:
-        for q in dead:
-            try:
-                _SUBSCRIBERS.remove(q)
-            except ValueError:
-                pass
-
-def _apply_command(parsed: dict):
-    action = parsed.get("action")
-    params = parsed.get("params", {})
-    room = params.get("room")
+            home = HOMES.get(home_id)
+            plan = []
+            for job in home_jobs:
+                if job["action"]:
+                    parsed = {"action": job["action"], "params": job["params"]}
+                    plan.extend(compile_plan(parsed, lambda action: _home_rooms(home, action)))
+            with home.lock:
+                _apply_plan(plan, home)
+                BROADCASTER.mark(
+                    home,
+                    [
+                        ("timers", job["id"], _timer_state(job | {"due": job["next_due"]}) if job["cron"] else None)
+                        for job in home_jobs
+                    ],
+                    events=[
+                        {"type": "timer", "id": job["id"], "label": job["label"], "action": job["action"], "due": job["due"]}
+                        for job in home_jobs
+                    ],
+                )
+        except Exception as e:
+            errors.append(f"{home_id}: {e}")
+    if errors:
+        raise RuntimeError("; ".join(errors))
 
-    if action == "turn_on_light" and room:
+# Timers and schedules of the homes this process owns; one dispatcher thread
+# for all of them (backend/scheduler.py).
+SCHEDULER = Scheduler(_fire_jobs)
+SCHEDULER.load(lambda home: CLUSTER is None or CLUSTER.owns(home))
+SCHEDULER.start()
 
-        dev = db.get_device_by_room_and_type(room, "light")
-        if not dev:
-            db.create_device(name=f"light:{room}", room=room, type_="light", is_on=True)
-        else:
-            db.update_device_state(dev["id"], True)
-        with _STATE_LOCK:
-            DEVICE_STATE.setdefault("lights", {})[room] = True
-        _broadcast_state()
-    elif action == "turn_off_light" and room:
-        dev = db.get_device_by_room_and_type(room, "light")
-        if not dev:
-            db.create_device(name=f"light:{room}", room=room, type_="light", is_on=False)
-        else:
-            db.update_device_state(dev["id"], False)
-        with _STATE_LOCK:
-            DEVICE_STATE.setdefault("lights", {})[room] = False
-        _broadcast_state()
-    elif action == "decrease_temperature" and room:
-        with _STATE_LOCK:
-            t = DEVICE_STATE["thermometers"].setdefault(room, {"temperature": 22.0, "humidity": 50.0})
-            t["temperature"] = max(10, t["temperature"] - 1)
-        _broadcast_state()
-    elif action == "decrease_humidity" and room:
-        with _STATE_LOCK:
-            t = DEVICE_STATE["thermometers"].setdefault(room, {"temperature": 22.0, "humidity": 50.0})
-            t["humidity"] = max(20, t["humidity"] - 1)
-        _broadcast_state()
-    elif action == "set_temperature" and room and "value" in params:
-        with _STATE_LOCK:
-            t = DEVICE_STATE["thermometers"].setdefault(room, {"temperature": 22.0, "humidity": 50.0})
-            t["temperature"] = max(10, min(40, float(params["value"])))
-        _broadcast_state()
-    elif action == "set_humidity" and room and "value" in params:
-        with _STATE_LOCK:
-            t = DEVICE_STATE["thermometers"].setdefault(room, {"temperature": 22.0, "humidity": 50.0})
-            t["humidity"] = max(20, min(90, float(params["value"])))
-        _broadcast_state()
 def _format_response(parsed: dict) -> str:
     action = parsed.get("action")
     params = parsed.get("params", {})
     room = params.get("room")
+    where = _in_rooms(params.get("rooms") or [room])
 
     if action == "turn_on_light":
-        return f"Свет{_in_room(room)} включен" if room else "Свет включен"
+        return f"Свет{where} включен" if room else "Свет включен"
     if action == "turn_off_light":
-        return f"Свет{_in_room(room)} выключен" if room else "Свет выключен"
+        return f"Свет{where} выключен" if room else "Свет выключен"
     if action == "set_timer":
         value = params.get("value")
         unit = params.get("unit")
@@ -142,15 +418,20 @@ def _format_response(parsed: dict) -> str:
         value = params.get("value")
         return f"Громкость установлена на {value}%" if value is not None else "Громкость изменена"
     if action == "decrease_temperature":
-        return f"Температура{_in_room(room)} снижена" if room else "Температура снижена"
+        return f"Температура{where} снижена" if room else "Температура снижена"
     if action == "decrease_humidity":
-        return f"Влажность{_in_room(room)} снижена" if room else "Влажность снижена"
+        return f"Влажность{where} снижена" if room else "Влажность снижена"
     if action == "set_temperature":
         value = params.get("value")
-        return f"Температура{_in_room(room)} установлена на {value}°C" if room and value is not None else "Температура установлена"
+        return f"Температура{where} установлена на {value}°C" if room and value is not None else "Температура установлена"
     if action == "set_humidity":
         value = params.get("value")
-        return f"Влажность{_in_room(room)} установлена на {value}💧" if room and value is not None else "Влажность установлена"
+        return f"Влажность{where} установлена на {value}💧" if room and value is not None else "Влажность установлена"
+    if action == "run_scene":
+        scene = SCENES.get(params.get("scene"))
+        return f"Сцена «{scene.title}» включена" if scene else "Такой сцены нет"
+    if action == "multiple":
+        return ". ".join(_format_response(command) for command in params.get("actions", []))
     return "Извините, не понял команду"
 
 
@@ -163,6 +444,10 @@ def _in_room(room: str | None) -> str:
     return f" в {room}"
 
 
+def _in_rooms(rooms: list) -> str:
+    return " и".join(_in_room(r) for r in rooms)
+
+
 def _canonicalize_room(room: str) -> str:
     r = (room or "").strip().lower()
 
@@ -171,6 +456,47 @@ def _canonicalize_room(room: str) -> str:
 
     return ROOMS_MAP.get(r, r)
 
+def _canonicalize_params(params: dict) -> None:
+    if params.get("room"):
+        params["room"] = _canonicalize_room(params["room"])
+    if params.get("rooms"):
+        params["rooms"] = [_canonicalize_room(r) for r in params["rooms"]]
+    for command in params.get("actions") or []:
+        _canonicalize_params(command.setdefault("params", {}))
+
+def _understand(text: str) -> tuple[dict, str]:
+    # Hot phrases repeat all day; the parse + canonicalize + response text for a
+    # normalized phrase is cached, so a repeat costs a dict lookup.
+    key = (command_parser.GRAMMAR_VERSION, INTENT_ENGINE.version, normalize(text))
+    cached = INTENT_CACHE.get(key)
+    if cached is not None:
+        action, params, intent, response_text = cached
+        parsed = {"action": action, "params": dict(params), "raw": text}
+        if intent is not None:
+            parsed["intent"] = intent
+        return parsed, response_text
+
+    with METRICS.stage("parse"):
+        parsed = INTENT_ENGINE.parse(text)
+    try:
+        _canonicalize_params(parsed.setdefault("params", {}))
+    except Exception:
+        pass
+    response_text = _format_response(parsed)
+    INTENT_CACHE.put(key, (parsed["action"], dict(parsed["params"]), parsed.get("intent"), response_text))
+    return parsed, response_text
+
+def _execute_text(text: str, home: Household | None = None) -> dict:
+    parsed, response_text = _understand(text)
+    _apply_command(parsed, home or _household(DEFAULT_HOME, create=True))
+    COMMAND_LOG.record(parsed)
+    METRICS.inc("commands_total", action=parsed["action"])
+    return {
+        "text": text,
+        "parsed": parsed,
+        "response": response_text
+    }
+
 @app.route("/")
 def root():
     return send_from_directory("frontend", "index.html")
@@ -181,19 +507,196 @@ def static_proxy(path):
 
 @app.route("/api/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok"})
+    recognizer = _recognizer_status()
+    return jsonify({"status": "ok", "ready": recognizer["ready"], "recognizer": recognizer, "stream": HOMES.stats(), "broadcast": BROADCASTER.stats(), "cache": _cache_stats(), "fast_path": FAST_PATH_STATS.stats(), "intent": INTENT_ENGINE.status(), "telemetry": TELEMETRY.stats(), "sensor_ingest": SENSOR_INGEST.stats(), "scheduler": SCHEDULER.stats(), "cluster": CLUSTER.stats() if CLUSTER else None})
 
-@app.route("/api/devices", methods=["GET"])
-def devices():
+@app.before_request
+def _start_request_clock():
+    g.metrics_t0 = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    t0 = g.pop("metrics_t0", None)
+    if t0 is not None:
+        endpoint = request.endpoint or "unmatched"
+        # For /api/devices/stream this is the time to the first byte; the stream itself is not timed.
+        METRICS.observe("http_request_seconds", time.perf_counter() - t0, endpoint=endpoint)
+        METRICS.inc("http_responses_total", endpoint=endpoint, status=response.status_code)
+    return response
+
+def _collect_metrics():
+    # Counters the components keep themselves, read at scrape time.
+    caches = {"intent": INTENT_CACHE.stats(), "transcript": TRANSCRIPT_CACHE.stats()}
+    yield "cache_lookups_total", "counter", "Cache lookups by cache and result.", [
+        ({"cache": name, "result": result}, stats[key]) for name, stats in caches.items() for result, key in (("hit", "hits"), ("miss", "misses"))
+    ]
+    yield "cache_entries", "gauge", "Entries in each cache.", [({"cache": name}, stats["size"]) for name, stats in caches.items()]
+    streams = HOMES.stats()
+    yield "stream_subscribers", "gauge", "Open /api/devices/stream connections.", [({}, streams["subscribers"])]
+    yield "stream_messages_total", "counter", "Stream messages by outcome: published, dropped for a slow subscriber, or the subscriber evicted.", [
+        ({"outcome": outcome}, streams[outcome]) for outcome in ("published", "dropped", "evicted")
+    ]
+    yield "households", "gauge", "Households loaded in this process.", [
+        ({"kind": "owned"}, streams["homes"]), ({"kind": "replica"}, streams["replicas"]),
+    ]
+    yield "households_evicted_total", "counter", "Idle households unloaded to stay under HOMES_RESIDENT_MAX.", [({}, streams["homes_evicted"])]
+    broadcast = BROADCASTER.stats()
+    yield "broadcasts_total", "counter", "State deltas broadcast.", [({}, broadcast["broadcasts"])]
+    recognizer = _recognizer_status()
+    yield "recognizer_ready", "gauge", "Whether speech recognition is ready.", [({}, 1 if recognizer.get("ready") else 0)]
+    if "queue_depth" in recognizer:
+        yield "recognizer_queue_depth", "gauge", "Recognitions waiting for a worker process.", [({}, recognizer["queue_depth"])]
+        yield "recognizer_rejected_total", "counter", "Recognitions refused because the queue was full.", [({}, recognizer["rejected"])]
+    ingest = SENSOR_INGEST.stats()
+    yield "sensor_readings_total", "counter", "Sensor readings received by outcome.", [
+        ({"outcome": "accepted"}, ingest["accepted"]), ({"outcome": "rejected"}, ingest["rejected"]),
+    ]
+    scheduler = SCHEDULER.stats()
+    yield "scheduler_jobs", "gauge", "Pending timers and schedules.", [({}, scheduler["pending"])]
+    yield "scheduler_fired_total", "counter", "Jobs fired.", [({}, scheduler["fired"])]
+    log = COMMAND_LOG.stats()
+    yield "command_log_dropped_total", "counter", "Command log rows dropped.", [({}, log["dropped"])]
+    yield "component_error", "gauge", "1 while a background component reports an error.", [
+        ({"component": name}, 1 if error else 0)
+        for name, error in (
+            ("broadcast", broadcast["error"]), ("sensor_ingest", ingest["error"]), ("scheduler", scheduler["error"]),
+            ("command_log", log["error"]), ("recognizer", recognizer.get("error")),
+        )
+    ]
+
+METRICS.collector(_collect_metrics)
+# Sampling profiler behind /api/metrics/profile; off unless METRICS_PROFILER=1.
+PROFILER = SamplingProfiler() if os.getenv("METRICS_PROFILER", "0") == "1" else None
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    # Prometheus text format; ?format=json gives recent p50/p95/p99 per stage instead of buckets.
+    if request.args.get("format") == "json":
+        return jsonify(METRICS.summary())
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/api/metrics/profile", methods=["GET"])
+def metrics_profile():
+    # ?seconds=10&interval_ms=5&format=json|folded - samples every thread's stack for that long.
+    if PROFILER is None:
+        return jsonify({"error": "профилировщик выключен (METRICS_PROFILER=0)"}), 404
+    try:
+        seconds = min(60.0, max(0.1, float(request.args.get("seconds", "5"))))
+        interval = min(1.0, max(0.001, float(request.args.get("interval_ms", "5")) / 1000))
+    except ValueError:
+        return jsonify({"error": "seconds и interval_ms должны быть числами"}), 400
+    try:
+        stacks = PROFILER.run(seconds, interval)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    if request.args.get("format") == "folded":
+        folded = "".join(f"{stack} {n}\n" for stack, n in sorted(stacks.items(), key=lambda item: -item[1]))
+        return Response(folded, mimetype="text/plain; charset=utf-8")
+    return jsonify({"seconds": seconds, "samples": sum(stacks.values()), "top": top_functions(stacks)})
+
+def _cache_stats() -> dict:
+    return {"intent": INTENT_CACHE.stats(), "transcript": TRANSCRIPT_CACHE.stats()}
+
+@app.route("/api/cache", methods=["GET"])
+def cache_stats():
+    return jsonify(_cache_stats())
+
+@app.route("/api/intent/models", methods=["GET"])
+def intent_models():
+    return jsonify({
+        "serving": INTENT_ENGINE.status(),
+        "training": TRAINER.status() if TRAINER else None,
+        "log": COMMAND_LOG.stats(),
+    })
 
+@app.route("/api/intent/labels", methods=["POST"])
+def intent_label():
+    # A correction: "this phrase meant that action". Goes into the training log.
+    payload = request.get_json(force=True, silent=True) or {}
+    text = (payload.get("text") or "").strip()
+    label = (payload.get("label") or "").strip()
+    if not text or not label:
+        return jsonify({"error": "text и label обязательны"}), 400
+    model = INTENT_ENGINE.classifier
+    if model is not None and label not in model.classes:
+        return jsonify({"error": f"неизвестное действие {label}", "known": model.classes}), 400
+    COMMAND_LOG.label(text, label)
+    return jsonify({"status": "accepted"}), 202
+
+@app.route("/api/intent/train", methods=["POST"])
+def intent_train():
+    # Runs one training round now instead of waiting for the next interval.
+    if TRAINER is None:
+        return jsonify({"error": "обучение выключено (CLASSIFIER_TRAINING=0)"}), 409
+    COMMAND_LOG.flush()
     try:
-        devices = db.list_devices()
-        return jsonify({"devices": devices})
+        record = TRAINER.step()
     except Exception as e:
-        return jsonify({"error": f"db error: {e}"}), 500
+        return jsonify({"error": f"ошибка обучения: {e}"}), 500
+    return jsonify({"published": record, "training": TRAINER.status()})
+
+@app.route("/api/sensors/<room>/history", methods=["GET"])
+def sensor_history(room: str):
+    # ?metric=temperature&from=<unix>&to=<unix> (or &hours=N) &resolution=auto|1m|1h|raw
+    room = _canonicalize_room(room)
+    home_id = _request_home_id()
+    if not valid_home(home_id):
+        return jsonify({"error": "неверный идентификатор дома"}), 400
+    try:
+        end = float(request.args["to"]) if "to" in request.args else None
+        start = float(request.args["from"]) if "from" in request.args else None
+        if start is None and "hours" in request.args:
+            start = (end or time.time()) - float(request.args["hours"]) * 3600
+        history = TELEMETRY.history(
+            home_id,
+            room,
+            metric=request.args.get("metric"),
+            start=start,
+            end=end,
+            resolution=request.args.get("resolution", "auto"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    history["home"] = home_id
+    history["latest"] = TELEMETRY.latest(home_id, room)
+    return jsonify(history)
+
+@app.route("/api/sensors/batch", methods=["POST"])
+def sensor_batch():
+    # {"readings": [{"room": "кухня", "metric": "temperature", "value": 21.5, "ts": 1700000000}, ...]}
+    payload = request.get_json(force=True, silent=True)
+    readings = payload.get("readings") if isinstance(payload, dict) else payload
+    home_id = _request_home_id()
+    if not valid_home(home_id):
+        return jsonify({"error": "неверный идентификатор дома"}), 400
+    if not isinstance(readings, list):
+        return jsonify({"error": "ожидается список readings"}), 400
+    if len(readings) > SENSOR_BATCH_MAX:
+        return jsonify({"error": f"не больше {SENSOR_BATCH_MAX} показаний за запрос"}), 413
+    _household(home_id, create=True)
+    accepted, rejected = SENSOR_INGEST.submit(home_id, readings)
+    return jsonify({"accepted": accepted, "rejected": rejected}), 202
+
+@app.route("/api/sensors/ingest", methods=["GET"])
+def sensor_ingest_stats():
+    return jsonify({"ingest": SENSOR_INGEST.stats(), "telemetry": TELEMETRY.stats(), "memory": process_memory()})
+
+@app.route("/api/homes", methods=["POST"])
+def homes_create():
+    # The home from ?home= / X-Home, with its starter devices; 200 if it exists already.
+    home_id = _request_home_id()
+    existed = HOMES.find(home_id) is not None or (valid_home(home_id) and db.home_exists(home_id))
+    home = _household(home_id, create=True)
+    return jsonify({"home": home.home, "devices": home.registry.list()}), 200 if existed else 201
+
+@app.route("/api/devices", methods=["GET"])
+def devices():
+
+    return jsonify({"devices": _household(_request_home_id()).registry.list()})
 
 @app.route("/api/devices", methods=["POST"])
 def devices_create():
+    home = _household(_request_home_id(), create=True)
     try:
         payload = request.get_json(force=True, silent=True) or {}
         name = payload.get("name")
@@ -202,47 +705,200 @@ def devices_create():
         is_on = bool(payload.get("is_on", False))
         if not name:
             return jsonify({"error": "name is required"}), 400
-        dev = db.create_device(name=name, room=room, type_=type_, is_on=is_on)
-
-        if dev and dev.get("type") == "light" and dev.get("room"):
-            DEVICE_STATE.setdefault("lights", {})[dev["room"]] = bool(dev["is_on"])  
-            _broadcast_state()
+        try:
+            with home.lock:
+                dev = home.registry.create(name=name, room=room, type_=type_, is_on=is_on)
+                BROADCASTER.mark(home, _device_changes(dev))
+        except sqlite3.IntegrityError:
+            return jsonify({"error": f"в комнате уже есть устройство типа {type_}"}), 409
         return jsonify(dev), 201
     except Exception as e:
         return jsonify({"error": f"db error: {e}"}), 500
 
 @app.route("/api/devices/<int:device_id>", methods=["PATCH"])
 def devices_update(device_id: int):
+    home = _household(_request_home_id())
     try:
         payload = request.get_json(force=True, silent=True) or {}
         if "is_on" not in payload:
             return jsonify({"error": "is_on required"}), 400
-        dev = db.update_device_state(device_id, bool(payload["is_on"]))
+        if home.registry.get(device_id) is None:
+            return jsonify({"error": "not found"}), 404
+        with home.lock:
+            dev = home.registry.set_state(device_id, bool(payload["is_on"]))
+            BROADCASTER.mark(home, _device_changes(dev))
         if not dev:
             return jsonify({"error": "not found"}), 404
-        if dev.get("type") == "light" and dev.get("room"):
-            DEVICE_STATE.setdefault("lights", {})[dev["room"]] = bool(dev["is_on"])  # type: ignore
-            _broadcast_state()
         return jsonify(dev)
     except Exception as e:
         return jsonify({"error": f"db error: {e}"}), 500
 
+@app.route("/api/scenes", methods=["GET"])
+def scenes():
+    return jsonify({"scenes": scene_list()})
+
+@app.route("/api/scenes/<name>", methods=["POST"])
+def scene_run(name: str):
+    if name not in SCENES:
+        return jsonify({"error": f"сцена {name} не найдена", "known": sorted(SCENES)}), 404
+    home = _household(_request_home_id(), create=True)
+    parsed = {"action": "run_scene", "params": {"scene": name}}
+    try:
+        steps = _apply_command(parsed, home)
+    except Exception as e:
+        return jsonify({"error": f"db error: {e}"}), 500
+    return jsonify({"scene": name, "steps": steps, "response": _format_response(parsed)})
+
+def _rejected_error(rejected: list):
+    # value as text: it may be NaN or Infinity, which JSON cannot carry
+    return jsonify({
+        "error": "value должно быть конечным числом",
+        "rejected": [{"action": c.get("action"), "params": dict(c.get("params") or {}, value=str((c.get("params") or {}).get("value")))} for c in rejected],
+    }), 400
+
+@app.route("/api/actions", methods=["POST"])
+def actions_run():
+    # {"actions": [{"action": "turn_off_light", "params": {"room": "зал"}}, ...]}
+    # applied together, like a scene: one transaction, one delta.
+    payload = request.get_json(force=True, silent=True)
+    actions = payload.get("actions") if isinstance(payload, dict) else payload
+    if not isinstance(actions, list) or not all(isinstance(a, dict) and isinstance(a.get("params", {}), dict) for a in actions):
+        return jsonify({"error": "ожидается список actions из {action, params}"}), 400
+    if len(actions) > ACTIONS_BATCH_MAX:
+        return jsonify({"error": f"не больше {ACTIONS_BATCH_MAX} действий за запрос"}), 413
+    home = _household(_request_home_id(), create=True)
+    parsed = {"action": "multiple", "params": {"actions": [
+        {"action": a.get("action"), "params": dict(a.get("params") or {})} for a in actions
+    ]}}
+    try:
+        _canonicalize_params(parsed["params"])
+    except (AttributeError, TypeError):
+        return jsonify({"error": "room и rooms должны быть строками"}), 400
+    rejected = invalid_commands(parsed)
+    if rejected:
+        return _rejected_error(rejected)
+    try:
+        steps = _apply_command(parsed, home)
+    except Exception as e:
+        return jsonify({"error": f"db error: {e}"}), 500
+    return jsonify({"steps": steps, "response": _format_response(parsed)})
+
+@app.route("/api/schedules", methods=["GET"])
+def schedules():
+    return jsonify({"jobs": SCHEDULER.jobs(_household(_request_home_id()).home)})
+
+@app.route("/api/schedules", methods=["POST"])
+def schedule_create():
+    # {"cron": "0 23 * * *" | "at": <unix> | "in": <seconds>,
+    #  "text": "спокойной ночи" | "action": ..., "params": {...}, "label": ...}
+    payload = request.get_json(force=True, silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "ожидается JSON-объект"}), 400
+    home = _household(_request_home_id(), create=True)
+    when = [key for key in ("cron", "at", "in") if payload.get(key) is not None]
+    if len(when) != 1:
+        return jsonify({"error": "нужно ровно одно из cron, at, in"}), 400
+    text = (payload.get("text") or "").strip()
+    if text:
+        parsed, _response = _understand(text)
+        action, params = parsed["action"], parsed["params"]
+        if action == "unknown":
+            return jsonify({"error": f"не понял команду: {text}"}), 400
+    else:
+        action, params = payload.get("action"), payload.get("params") or {}
+        if action is not None and not isinstance(action, str) or not isinstance(params, dict):
+            return jsonify({"error": "action должен быть строкой, params - объектом"}), 400
+        try:
+            _canonicalize_params(params)
+        except (AttributeError, TypeError):
+            return jsonify({"error": "room и rooms должны быть строками"}), 400
+        rejected = invalid_commands({"action": action, "params": params})
+        if rejected:
+            return _rejected_error(rejected)
+    label = payload.get("label") or text or None
+    try:
+        if "cron" in when:
+            job = _schedule(home, action, params, label, cron=str(payload["cron"]))
+        else:
+            due = float(payload["at"]) if "at" in when else time.time() + float(payload["in"])
+            if not math.isfinite(due):
+                return jsonify({"error": "время срабатывания должно быть конечным числом"}), 400
+            job = _schedule(home, action, params, label, due=due)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"db error: {e}"}), 500
+    return jsonify(job), 201
+
+@app.route("/api/schedules/<int:job_id>", methods=["DELETE"])
+def schedule_delete(job_id: int):
+    home = _household(_request_home_id())
+    with home.lock:
+        job = SCHEDULER.cancel(home.home, job_id)
+        if job is None:
+            return jsonify({"error": "not found"}), 404
+        BROADCASTER.mark(home, [("timers", job_id, None)])
+    return jsonify({"deleted": job_id})
+
+def _stream_backlog(home: Household, last_event_id: str | None) -> list:
+    backlog = None
+    if last_event_id and last_event_id.isdigit():
+        backlog = home.store.since(int(last_event_id))
+    if backlog is None:
+        backlog = [home.store.snapshot_frame()]
+    return backlog
+
+def _stream_frame(home: Household, item, sent: int):
+    """Turn a hub item into the (seq, frame) to send next, or None to skip it."""
+    if item is RESYNC:
+        return home.store.snapshot_frame()
+    seq, frame = item
+    if seq <= sent:
+        return None
+    if seq > sent + 1:
+        return home.store.snapshot_frame()
+    return seq, frame
+
 @app.route("/api/devices/stream", methods=["GET"])
 def devices_stream():
-    def event_stream(q: queue.Queue):
+    # First frame is a full snapshot (event: snapshot), then compact deltas
+    # (event: delta), each with id: <seq>. A reconnecting client sends
+    # Last-Event-ID and only gets the deltas it missed, if they're still in
+    # the home's StateStore history; otherwise it gets a fresh snapshot.
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+
+    home = _household(_request_home_id())
+    sub = home.hub.subscribe()
+    backlog = _stream_backlog(home, last_event_id)
 
-        first = json.dumps(_get_devices_snapshot())
-        yield f"data: {first}\n\n"
+    def event_stream():
+        # Heartbeats keep proxies from closing an idle stream and make a
+        # disconnected client show up as a failed write, which ends this
+        # generator and releases the thread.
+        sent = 0
         try:
+            for seq, frame in backlog:
+                yield frame
+                sent = seq
             while True:
-                data = q.get()
-                yield f"data: {data}\n\n"
-        except GeneratorExit:
+                item = sub.get(timeout=SSE_HEARTBEAT)
+                if item is None:
+                    yield ": keepalive\n\n"
+                    continue
+                out = _stream_frame(home, item, sent)
+                if out:
+                    sent, frame = out
+                    yield frame
+        except SubscriptionClosed:
             pass
+        finally:
+            sub.close()
 
-    q: queue.Queue = queue.Queue(maxsize=10)
-    _SUBSCRIBERS.append(q)
-    return Response(event_stream(q), mimetype="text/event-stream")
+    return Response(
+        event_stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.route("/api/routes", methods=["GET"])
 def api_routes():
@@ -257,6 +913,7 @@ def api_routes():
 
 @app.route("/api/speech_to_action", methods=["POST"])
 def api_speech_to_action():
+    home = _household(_request_home_id(), create=True)
 
     audio = request.files.get("audio")
     if not audio or audio.filename == "":
@@ -265,46 +922,64 @@ def api_speech_to_action():
     if not allowed_file(audio.filename):
         return jsonify({"error": "Неподдерживаемый формат файла"}), 415
 
-    safe_name = secure_filename(audio.filename)
-    suffix = os.path.splitext(safe_name)[1].lower()
-    temp_path = temp_filepath(suffix)
-
     try:
-        audio.save(temp_path)
+        with METRICS.stage("upload"):
+            data = audio.read()
     except Exception:
-        return jsonify({"error": "Не удалось сохранить файл"}), 500
+        return jsonify({"error": "Не удалось прочитать файл"}), 500
 
     try:
-        text = recognize_from_file(temp_path, language="ru-RU")
-        parsed = parse_command(text)
-        try:
-            room = parsed.get("params", {}).get("room")
-            if room:
-                can = _canonicalize_room(room)
-                parsed.setdefault("params", {})["room"] = can
-        except Exception:
-            pass
+        text = _recognize(data)
+        return jsonify(_execute_text(text, home))
+    except RecognitionError as e:
+        return _recognition_error(e)
+    except Exception as e:
+        return jsonify({"error": f"Внутренняя ошибка: {e}"}), 500
 
-        response_text = _format_response(parsed)
+def _recognition_error(e: RecognitionError):
+    METRICS.inc("errors_total", kind=type(e).__name__)
+    if isinstance(e, RecognizerBusy):
+        body = {"error": str(e), "queue_depth": e.queue_depth, "max_queue": e.max_queue}
+        return jsonify(body), 503, {"Retry-After": "1"}
+    if isinstance(e, RecognitionTimeout):
+        return jsonify({"error": str(e)}), 504
+    return jsonify({"error": str(e)}), 422
 
-        _apply_command(parsed)
+@app.route("/api/speech_batch", methods=["POST"])
+def api_speech_batch():
+    # Replays of recorded clips: transcribed together, commands are parsed but
+    # not applied to the devices.
+    files = [f for f in request.files.getlist("audio") if f and f.filename]
+    if not files:
+        return jsonify({"error": "Файл не найден"}), 400
+    if len(files) > SPEECH_BATCH_MAX:
+        return jsonify({"error": f"Не больше {SPEECH_BATCH_MAX} файлов за запрос"}), 413
+    for f in files:
+        if not allowed_file(f.filename):
+            return jsonify({"error": f"Неподдерживаемый формат файла: {f.filename}"}), 415
+    try:
+        beam_size = max(1, int(request.form.get("beam_size", 5)))
+        batch_size = max(1, int(request.form.get("batch_size", 8)))
+    except ValueError:
+        return jsonify({"error": "beam_size и batch_size должны быть целыми числами"}), 400
 
-        return jsonify({
-            "text": text,
-            "parsed": parsed,
-            "response": response_text
-        })
+    try:
+        clips = [f.read() for f in files]
+    except Exception:
+        return jsonify({"error": "Не удалось прочитать файл"}), 500
+
+    started = time.perf_counter()
+    try:
+        results = _recognize_batch(clips, beam_size, batch_size)
     except RecognitionError as e:
-        return jsonify({"error": str(e)}), 422
+        return _recognition_error(e)
     except Exception as e:
         return jsonify({"error": f"Внутренняя ошибка: {e}"}), 500
-    finally:
-
-        try:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        except OSError:
-            pass
+    for f, result in zip(files, results):
+        result["file"] = f.filename
+        if result["text"]:
+            result["parsed"], result["response"] = _understand(result["text"])
+    return jsonify({"results": results, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
 
 @app.route("/api/text_command", methods=["POST"])
 def api_text_command():
@@ -312,21 +987,105 @@ def api_text_command():
     text = payload.get("text", "").strip()
     if not text:
         return jsonify({"error": "Текст команды пуст"}), 400
-    parsed = parse_command(text)
+    return jsonify(_execute_text(text, _household(_request_home_id(), create=True)))
+
+@app.errorhandler(HomeError)
+def home_error(e: HomeError):
+    return jsonify({"error": str(e)}), e.status
+
+# Cluster mode: requests that change or read one household's state run on the
+# worker that owns it; the others forward them over the change bus. Streams
+# are served locally from a replica kept current by the owner's deltas.
+HOME_ROUTES = {
+    "homes_create", "devices", "devices_create", "devices_update", "api_text_command", "api_speech_to_action",
+    "sensor_batch", "sensor_history", "scene_run", "actions_run", "schedules", "schedule_create", "schedule_delete",
+}
+FORWARDED_HEADER = "X-Cluster-Forwarded"
+
+@app.before_request
+def _forward_to_owner():
+    if CLUSTER is None or request.endpoint not in HOME_ROUTES or request.headers.get(FORWARDED_HEADER):
+        return None
+    home_id = _request_home_id()
+    if not valid_home(home_id) or CLUSTER.owns(home_id):
+        return None
     try:
-        room = parsed.get("params", {}).get("room")
-        if room:
-            can = _canonicalize_room(room)
-            parsed.setdefault("params", {})["room"] = can
-    except Exception:
-        pass
-    response_text = _format_response(parsed)
-    _apply_command(parsed)
-    return jsonify({
-        "text": text,
-        "parsed": parsed,
-        "response": response_text
-    })
+        reply = CLUSTER.call(CLUSTER.owner(home_id), "http", {
+            "method": request.method,
+            "path": request.path,
+            "query_string": request.query_string.decode("latin-1"),
+            "headers": [(k, v) for k, v in request.headers if k.lower() not in ("host", "content-length")],
+            "body": request.get_data(),
+        }, timeout=WHISPER_DEADLINE + 5)
+    except ClusterError as e:
+        return jsonify({"error": f"дом {home_id} недоступен: {e}"}), 503
+    return Response(reply["body"], status=reply["status"], headers=reply["headers"])
+
+def _serve_forwarded(params: dict) -> dict:
+    environ = EnvironBuilder(
+        path=params["path"],
+        method=params["method"],
+        query_string=params["query_string"],
+        headers=params["headers"] + [(FORWARDED_HEADER, "1")],
+        data=params["body"],
+    ).get_environ()
+    with app.request_context(environ):
+        response = app.full_dispatch_request()
+    # CORS headers are added again by the worker that answers the client.
+    headers = [
+        (k, v) for k, v in response.headers
+        if k.lower() != "content-length" and not k.lower().startswith("access-control-")
+    ]
+    return {"status": response.status_code, "headers": headers, "body": response.get_data()}
+
+def _on_cluster_frame(home_id: str, seq: int, frame: str) -> None:
+    home = HOMES.find(home_id)
+    if home is None or not home.replica or home.follow(seq, frame):
+        return
+    # Missed a delta: reload the replica from the owner, off the bus reader thread.
+    home.begin_resync()
+    CLUSTER.run(_resync_replica, home)
+
+def _resync_replica(home: Household) -> None:
+    for attempt in range(5):
+        try:
+            home.load_snapshot(CLUSTER.call(CLUSTER.owner(home.home), "snapshot", {"home": home.home}))
+            return
+        except ClusterError:
+            time.sleep(1 + attempt)
+    HOMES.discard(home)
+
+def _on_cluster_connect() -> None:
+    # Whatever went by while this worker was off the bus (at start, or until a
+    # reconnect): classifier versions announced to nobody, deltas replicas missed.
+    if CLASSIFIER_TRAINING:
+        if INTENT_ENGINE.version:
+            CLUSTER.notify("classifier", {"version": INTENT_ENGINE.version})
+    else:
+        INTENT_ENGINE.reload()
+    for home in HOMES.loaded():
+        if home.replica:
+            home.begin_resync()
+            _resync_replica(home)
+
+if CLUSTER is not None:
+    # Forwarded requests (speech among them) get their own threads, so slow
+    # ones never hold up snapshot calls that replicas are waiting for.
+    CLUSTER.handle("http", _serve_forwarded, threads=int(os.getenv("CLUSTER_HTTP_THREADS", "16")))
+    CLUSTER.handle("snapshot", lambda params: HOMES.get(params["home"]).store.snapshot())
+    CLUSTER.on_frame = _on_cluster_frame
+    CLUSTER.on_connect = _on_cluster_connect
+    if CLASSIFIER_TRAINING:
+        INTENT_ENGINE.on_install = lambda model: CLUSTER.notify("classifier", {"version": model.version})
+    else:
+        CLUSTER.listen("classifier", lambda params: INTENT_ENGINE.reload())
+    CLUSTER.start()
+
+if CLUSTER is None or CLUSTER.owns(DEFAULT_HOME):
+    HOMES.get(DEFAULT_HOME, create=True)
 
 if __name__ == "__main__":
+    if os.getenv("STREAM_ENABLED", "1") != "0":
+        from backend.streaming import start_stream_server
+        start_stream_server(_execute_text, host="0.0.0.0", port=int(os.getenv("STREAM_PORT", "5001")))
     app.run(debug=False, host="0.0.0.0", port=5000)
@@ -0,0 +1,272 @@
+"""Asyncio serving mode.
+
+    python asgi.py                      # uvicorn on 0.0.0.0:5000
+    uvicorn asgi:application --port 5000
+
+Long-lived connections are coroutines here: /api/devices/stream (SSE) and the
+/ws/speech push-to-talk WebSocket hold no thread while idle. Every other route
+is the unchanged Flask app, called through a bounded thread pool, so blocking
+work (SQLite, Whisper decode and inference) never runs on the event loop.
+"""
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qs
+
+from app import (
+    app as flask_app, SSE_HEARTBEAT, DEFAULT_HOME, HomeError, _execute_text, _household, _stream_backlog,
+    _stream_frame,
+)
+from backend.pubsub import SubscriptionClosed
+from backend.streaming import SpeechStream
+
+EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("ASGI_THREADS", "32")), thread_name_prefix="asgi")
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+    elif scope["type"] == "websocket":
+        if scope["path"] == "/ws/speech":
+            await _speech_ws(scope, receive, send)
+        else:
+            await send({"type": "websocket.close", "code": 1008})
+    elif scope["path"] == "/api/devices/stream" and scope["method"] == "GET":
+        await _sse(scope, receive, send)
+    else:
+        await _wsgi(scope, receive, send)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            EXECUTOR.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def _home_id(scope) -> str:
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    home = query.get("home", [""])[0] or dict(scope["headers"]).get(b"x-home", b"").decode("latin-1")
+    return home or DEFAULT_HOME
+
+
+async def _sse(scope, receive, send):
+    headers = dict(scope["headers"])
+    last_event_id = headers.get(b"last-event-id", b"").decode("latin-1")
+    if not last_event_id:
+        last_event_id = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("last_event_id", [""])[0]
+
+    loop = asyncio.get_running_loop()
+    try:
+        # Loading a home touches SQLite (or, for a replica, waits on its owner).
+        home = await loop.run_in_executor(EXECUTOR, _household, _home_id(scope))
+    except HomeError as e:
+        await _json_error(send, e.status, str(e))
+        return
+
+    wake = asyncio.Event()
+
+    def wakeup():
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass
+
+    sub = home.hub.subscribe()
+    sub.wakeup = wakeup
+    backlog = _stream_backlog(home, last_event_id)
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+        wake.set()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+    try:
+        sent = 0
+        for seq, frame in backlog:
+            await _chunk(send, frame)
+            sent = seq
+        while not disconnected.is_set():
+            wake.clear()
+            item = sub.get_nowait()
+            if item is None:
+                try:
+                    await asyncio.wait_for(wake.wait(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    await _chunk(send, ": keepalive\n\n")
+                continue
+            out = _stream_frame(home, item, sent)
+            if out:
+                sent, frame = out
+                await _chunk(send, frame)
+    except (SubscriptionClosed, OSError):
+        pass
+    finally:
+        watcher.cancel()
+        sub.close()
+    if not disconnected.is_set():
+        try:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        except OSError:
+            pass
+
+
+async def _json_error(send, status: int, message: str):
+    body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"access-control-allow-origin", b"*")],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _chunk(send, text: str):
+    await send({"type": "http.response.body", "body": text.encode("utf-8"), "more_body": True})
+
+
+async def _speech_ws(scope, receive, send):
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        home = await loop.run_in_executor(EXECUTOR, _household, _home_id(scope), True)
+    except HomeError:
+        await send({"type": "websocket.close", "code": 1008})
+        return
+    await send({"type": "websocket.accept"})
+    stream = SpeechStream(lambda text: _execute_text(text, home))
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if data is None:
+                data = message.get("text", "")
+            replies, finished = await loop.run_in_executor(EXECUTOR, stream.feed, data)
+            for payload in replies:
+                await send({"type": "websocket.send", "text": json.dumps(payload, ensure_ascii=False)})
+            if finished:
+                await send({"type": "websocket.close", "code": 1000})
+                return
+    finally:
+        stream.close()
+
+
+async def _wsgi(scope, receive, send):
+    # Flask checks MAX_CONTENT_LENGTH only once the body is buffered, so the limit is enforced while reading.
+    limit = flask_app.config.get("MAX_CONTENT_LENGTH")
+    length = dict(scope["headers"]).get(b"content-length")
+    if limit is not None and length is not None and length.isdigit() and int(length) > limit:
+        await _too_large(send, limit)
+        return
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        body += message.get("body", b"")
+        if limit is not None and len(body) > limit:
+            await _too_large(send, limit)
+            return
+        if not message.get("more_body"):
+            break
+    environ = _environ(scope, bytes(body))
+    status, headers, chunks = await asyncio.get_running_loop().run_in_executor(EXECUTOR, _call_flask, environ)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
+    await send({"type": "http.response.body", "body": b"".join(chunks)})
+
+
+async def _too_large(send, limit: int) -> None:
+    body = json.dumps({"error": f"Слишком большой запрос: больше {limit // (1024 * 1024)} МБ"}, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _call_flask(environ):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = headers
+        return lambda data: chunks.append(data)
+
+    chunks = []
+    result = flask_app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return started["status"], started["headers"], chunks
+
+
+def _environ(scope, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif key != "CONTENT_LENGTH":
+            key = f"HTTP_{key}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("Для асинхронного режима установите uvicorn: pip install uvicorn")
+    uvicorn.run(application, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", "5000")), log_level="warning")
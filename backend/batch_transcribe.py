@@ -0,0 +1,86 @@
+"""Transcribe recorded clips in bulk, one JSON line per clip.
+
+    python -m backend.batch_transcribe logs/voice/ > transcripts.jsonl
+    find logs -name '*.webm' | python -m backend.batch_transcribe - --beam-size 1 --batch-size 16
+
+Arguments are files or directories (searched recursively for supported
+formats); `-` reads paths from stdin. Lines are written as soon as their batch
+is done and in input order; a summary goes to stderr.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from backend.command_parser import parse_command
+from backend.fileutils import allowed_file
+from backend.speech_recognizer import transcribe_batch
+
+
+def iter_paths(args):
+    for arg in args:
+        if arg == "-":
+            for line in sys.stdin:
+                if line.strip():
+                    yield line.strip()
+        elif os.path.isdir(arg):
+            for root, _dirs, files in os.walk(arg):
+                for name in sorted(files):
+                    if allowed_file(name):
+                        yield os.path.join(root, name)
+        else:
+            yield arg
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("paths", nargs="*", default=["-"])
+    ap.add_argument("--language", default="ru-RU")
+    ap.add_argument("--beam-size", type=int, default=5)
+    ap.add_argument("--batch-size", type=int, default=8)
+    ap.add_argument("--decode-workers", type=int, default=os.cpu_count() or 4)
+    ap.add_argument("--no-parse", action="store_true", help="не разбирать команды, только текст")
+    args = ap.parse_args()
+
+    paths = []
+
+    def clips():
+        for path in iter_paths(args.paths):
+            paths.append(path)
+            yield path
+
+    started = time.perf_counter()
+    done = failed = 0
+    audio_seconds = 0.0
+    results = transcribe_batch(
+        clips(),
+        language=args.language,
+        beam_size=args.beam_size,
+        batch_size=args.batch_size,
+        decode_workers=args.decode_workers,
+    )
+    for result in results:
+        result["file"] = paths[result["index"]]
+        if result["text"] and not args.no_parse:
+            result["parsed"] = parse_command(result["text"])
+        done += 1
+        failed += result["error"] is not None
+        audio_seconds += result["duration"] or 0.0
+        sys.stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "clips": done,
+        "failed": failed,
+        "seconds": round(elapsed, 2),
+        "clips_per_second": round(done / elapsed, 2) if elapsed else None,
+        "audio_seconds": round(audio_seconds, 1),
+        "realtime_factor": round(elapsed / audio_seconds, 3) if audio_seconds else None,
+    }
+    print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from backend.metrics import METRICS, percentiles
+from backend.state_store import Change
+
+# Mutations do not broadcast themselves. They mark what changed and return;
+# the scheduler thread waits `window` seconds after the first mark so that a
+# burst (a scene switching twenty lights, a batch of sensor values) piles up,
+# then applies everything to the StateStore as one delta - serialized once -
+# and hands that frame to the Hub. A request never pays for serialization or
+# for the number of open streams.
+#
+# A target is anything with a `store` (StateStore) and a `hub` (Hub) - one per
+# household - and one scheduler thread serves all of them.
+
+
+class BroadcastScheduler:
+    def __init__(
+        self,
+        window: float = 0.05,
+        relay: Optional[Callable[[Any, Tuple[int, str]], None]] = None,
+        lag_window: int = 1000,
+    ):
+        self.window = window
+        # Called with (target, (seq, frame)) after each local publish, e.g. to
+        # pass the frame on to other processes.
+        self.relay = relay
+        # target -> {(section, key): value}; a later mark of the same key replaces the value.
+        self._pending: Dict[Any, Dict[Tuple[str, Any], Any]] = {}
+        # target -> events to send with its next delta, in order
+        self._events: Dict[Any, List[Dict[str, Any]]] = {}
+        self._dirty_since: Optional[float] = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._lag_ms: deque = deque(maxlen=lag_window)
+        self.marks = 0
+        self.changes = 0
+        self.broadcasts = 0
+        self.failed = 0
+        self.last_serialize_ms: Optional[float] = None
+        self.last_fanout_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="broadcast", daemon=True).start()
+
+    def mark(self, target, changes: Iterable[Change], events: Iterable[Dict[str, Any]] = ()) -> None:
+        """Queue changes (and events) for target's next broadcast. Call it where the state was changed (under its lock)."""
+        changes, events = list(changes), list(events)
+        if not changes and not events:
+            return
+        with self._cond:
+            pending = self._pending.setdefault(target, {})
+            for section, key, value in changes:
+                pending[(section, key)] = value
+            if events:
+                self._events.setdefault(target, []).extend(events)
+            self.changes += len(changes)
+            self.marks += 1
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+                self._cond.notify()
+
+    def flush(self) -> int:
+        """Broadcast whatever is marked right now; return how many deltas went out."""
+        with self._flush_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+                events, self._events = self._events, {}
+                since, self._dirty_since = self._dirty_since, None
+            if not pending:
+                return 0
+            serialize = fanout = 0.0
+            sent = 0
+            error = None
+            for target, marked in pending.items():
+                # One target failing must not cost the others their delta.
+                t0 = t1 = time.perf_counter()
+                try:
+                    event = target.store.apply(
+                        [(section, key, value) for (section, key), value in marked.items()], events.get(target, ()),
+                    )
+                    t1 = time.perf_counter()
+                    if event is not None:
+                        target.hub.publish(event)
+                        if self.relay is not None:
+                            self.relay(target, event)
+                        sent += 1
+                except Exception as e:
+                    error = f"{getattr(target, 'home', target)}: {e}"
+                    self.failed += 1
+                t2 = time.perf_counter()
+                serialize += t1 - t0
+                fanout += t2 - t1
+                METRICS.observe("stage_seconds", t1 - t0, stage="broadcast_serialize")
+                METRICS.observe("stage_seconds", t2 - t1, stage="broadcast_fanout")
+            self.broadcasts += sent
+            self.error = error
+            self.last_serialize_ms = round(serialize * 1000, 3)
+            self.last_fanout_ms = round(fanout * 1000, 3)
+            lag = time.monotonic() - since
+            self._lag_ms.append(lag * 1000)
+            METRICS.observe("stage_seconds", lag, stage="broadcast_wait")
+            return sent
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._dirty_since is None:
+                    self._cond.wait()
+                wait = self._dirty_since + self.window - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.flush()
+            except Exception as e:
+                self.error = str(e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            lag = list(self._lag_ms)
+            pending = sum(len(marked) for marked in self._pending.values())
+
+        return {
+            "window_ms": round(self.window * 1000, 1),
+            "marks": self.marks,
+            "changes": self.changes,
+            "broadcasts": self.broadcasts,
+            "failed": self.failed,
+            "marks_per_broadcast": round(self.marks / self.broadcasts, 2) if self.broadcasts else None,
+            "pending": pending,
+            "lag_ms": percentiles(lag),
+            "last_serialize_ms": self.last_serialize_ms,
+            "last_fanout_ms": self.last_fanout_ms,
+            "error": self.error,
+        }
@@ -0,0 +1,367 @@
+"""Several server processes on one port, households partitioned between them.
+
+    python -m backend.cluster --workers 4 --port 5000
+
+The supervisor opens the listening socket and starts `--workers` children
+(fresh interpreters running app.py's Flask app) that all accept on it, so
+the kernel spreads connections over every core. Each household is owned by
+exactly one worker, crc32(home) % workers: only the owner changes its state
+and assigns delta seqs. A request for someone else's home is passed to the
+owner over the change bus and its response relayed back. Dashboard streams
+are served by whichever worker took the connection: it keeps a replica of
+the home, loaded from the owner's snapshot and kept current by the deltas
+every owner publishes on the bus. seq numbers are the owner's, so a client
+resumes with Last-Event-ID on any worker.
+
+The change bus is a star of multiprocessing connections through the
+supervisor: it forwards calls and replies to the addressed worker, and
+delta frames and notifications (e.g. "a new classifier version was saved")
+to all the others.
+"""
+import argparse
+import itertools
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Dict, Optional
+
+
+class ClusterError(Exception):
+    pass
+
+
+def owner_of(home: str, workers: int) -> int:
+    return zlib.crc32(home.encode("utf-8")) % workers
+
+
+# supervisor side
+
+class BusBroker:
+    def __init__(self, authkey: bytes):
+        self._listener = Listener(("127.0.0.1", 0), authkey=authkey)
+        self._workers: Dict[int, Connection] = {}
+        self._send_locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def address(self):
+        return self._listener.address
+
+    def start(self) -> None:
+        threading.Thread(target=self._accept, name="bus-accept", daemon=True).start()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                # wrong authkey or a connection that went away mid-handshake
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name="bus-conn", daemon=True).start()
+
+    def _serve(self, conn: Connection) -> None:
+        try:
+            kind, worker = conn.recv()
+        except (OSError, EOFError):
+            conn.close()
+            return
+        if kind != "hello":
+            conn.close()
+            return
+        with self._lock:
+            # A restarted worker replaces its predecessor's connection.
+            self._workers[worker] = conn
+            self._send_locks[worker] = threading.Lock()
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] in ("frame", "notify"):
+                    for other in self._peers(worker):
+                        self._send(other, message)
+                # ("call", to, caller, call_id, ...) / ("reply", to, ...)
+                elif not self._send(message[1], message) and message[0] == "call":
+                    # the caller should not wait out its timeout for a worker that is not there
+                    self._send(worker, ("reply", worker, message[3], False, f"процесс {message[1]} не подключён к шине"))
+        except (OSError, EOFError):
+            pass
+        finally:
+            with self._lock:
+                if self._workers.get(worker) is conn:
+                    del self._workers[worker]
+            conn.close()
+
+    def _peers(self, worker: int):
+        with self._lock:
+            return [w for w in self._workers if w != worker]
+
+    def _send(self, worker: int, message: tuple) -> bool:
+        with self._lock:
+            conn = self._workers.get(worker)
+            lock = self._send_locks.get(worker)
+        if conn is None:
+            return False
+        try:
+            with lock:
+                conn.send(message)
+            return True
+        except (OSError, EOFError, ValueError):
+            return False
+
+
+def _supervise(args) -> None:
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    sock.set_inheritable(True)
+    authkey = secrets.token_bytes(16)
+    broker = BusBroker(authkey)
+    broker.start()
+    env = dict(
+        os.environ,
+        CLUSTER_WORKERS=str(args.workers),
+        CLUSTER_BUS=json.dumps(broker.address),
+        CLUSTER_KEY=authkey.hex(),
+        STREAM_ENABLED="0",
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def spawn(i: int) -> subprocess.Popen:
+        worker_env = dict(env, CLUSTER_WORKER=str(i))
+        if i:
+            # One trainer is enough; the others load each version it saves when
+            # it announces it on the bus.
+            worker_env["CLASSIFIER_TRAINING"] = "0"
+        return subprocess.Popen(
+            [sys.executable, "-m", "backend.cluster", "--serve-fd", str(sock.fileno())],
+            cwd=root, env=worker_env, pass_fds=(sock.fileno(),),
+        )
+
+    procs = [spawn(i) for i in range(args.workers)]
+    print(f"{args.workers} процессов на http://{args.host}:{args.port}", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+            for i, proc in enumerate(procs):
+                if proc.poll() is not None:
+                    print(f"процесс {i} завершился с кодом {proc.returncode}, перезапуск", file=sys.stderr, flush=True)
+                    procs[i] = spawn(i)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+
+def _serve_worker(fd: int) -> None:
+    from werkzeug.serving import make_server
+
+    import app
+
+    make_server("0.0.0.0", 0, app.app, threaded=True, fd=fd).serve_forever()
+
+
+# worker side
+
+class ClusterNode:
+    """A worker's end of the change bus."""
+
+    def __init__(self, worker: int, workers: int, address: Any, authkey: bytes, call_threads: int = 8):
+        self.worker = worker
+        self.workers = workers
+        self._address = address
+        self._authkey = authkey
+        self._conn: Optional[Connection] = None
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._calls: Dict[int, Future] = {}
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._listeners: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=call_threads, thread_name_prefix="bus-call")
+        # method -> its own pool, for calls that must not hold up the rest (see handle)
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self.on_frame: Optional[Callable[[str, int, str], None]] = None
+        # Called (off the reader thread) after every connect, including reconnects.
+        self.on_connect: Optional[Callable[[], None]] = None
+        self.reconnects = 0
+        self.frames_out = 0
+        self.frames_in = 0
+        self.calls_out = 0
+        self.calls_in = 0
+        self.error: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["ClusterNode"]:
+        if not os.getenv("CLUSTER_BUS"):
+            return None
+        address = json.loads(os.environ["CLUSTER_BUS"])
+        return cls(
+            worker=int(os.environ["CLUSTER_WORKER"]),
+            workers=int(os.environ["CLUSTER_WORKERS"]),
+            address=tuple(address) if isinstance(address, list) else address,
+            authkey=bytes.fromhex(os.environ["CLUSTER_KEY"]),
+        )
+
+    def handle(self, method: str, fn: Callable[[Dict[str, Any]], Any], threads: int = 0) -> None:
+        """Answer calls of method with fn; threads > 0 gives it a pool of its own."""
+        self._handlers[method] = fn
+        if threads > 0:
+            self._pools[method] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"bus-{method}")
+
+    def listen(self, topic: str, fn: Callable[[Dict[str, Any]], None]) -> None:
+        """Call fn (off the bus reader thread) for every notify(topic, ...) of another worker."""
+        self._listeners[topic] = fn
+
+    def notify(self, topic: str, payload: Dict[str, Any]) -> None:
+        try:
+            self._send(("notify", topic, payload))
+        except (AttributeError, OSError, ValueError) as e:
+            # AttributeError: not connected yet; start() callers catch up on their own
+            self.error = f"шина изменений недоступна: {e}"
+
+    def start(self) -> None:
+        self._connect()
+        threading.Thread(target=self._read, name="bus-reader", daemon=True).start()
+
+    def _connect(self) -> None:
+        conn = Client(self._address, authkey=self._authkey)
+        with self._send_lock:
+            self._conn = conn
+            conn.send(("hello", self.worker))
+        if self.on_connect is not None:
+            self._executor.submit(self.on_connect)
+
+    def _reconnect(self) -> None:
+        delay = 0.5
+        while True:
+            time.sleep(delay)
+            try:
+                self._connect()
+            except (OSError, EOFError) as e:
+                self.error = f"шина изменений недоступна: {e}"
+                delay = min(delay * 2, 30.0)
+                continue
+            self.reconnects += 1
+            self.error = None
+            return
+
+    def owner(self, home: str) -> int:
+        return owner_of(home, self.workers)
+
+    def owns(self, home: str) -> bool:
+        return self.owner(home) == self.worker
+
+    def _send(self, message: tuple) -> None:
+        with self._send_lock:
+            self._conn.send(message)
+
+    def publish_frame(self, home: str, seq: int, frame: str) -> None:
+        try:
+            self._send(("frame", home, seq, frame))
+            self.frames_out += 1
+        except (OSError, ValueError) as e:
+            self.error = f"шина изменений недоступна: {e}"
+
+    def call(self, worker: int, method: str, params: Dict[str, Any], timeout: float = 30.0) -> Any:
+        call_id = next(self._ids)
+        future: Future = Future()
+        self._calls[call_id] = future
+        try:
+            self._send(("call", worker, self.worker, call_id, method, params))
+            self.calls_out += 1
+            return future.result(timeout)
+        except FutureTimeout:
+            raise ClusterError(f"процесс {worker} не ответил за {timeout:g} с")
+        except (OSError, ValueError) as e:
+            raise ClusterError(f"шина изменений недоступна: {e}")
+        finally:
+            self._calls.pop(call_id, None)
+
+    def _read(self) -> None:
+        while True:
+            try:
+                message = self._conn.recv()
+            except (OSError, EOFError) as e:
+                self.error = f"шина изменений закрыта: {e}"
+                for future in list(self._calls.values()):
+                    if not future.done():
+                        future.set_exception(ClusterError(self.error))
+                try:
+                    self._conn.close()
+                except OSError:
+                    pass
+                # Frames missed meanwhile show up as seq gaps, which replicas resync from.
+                self._reconnect()
+                continue
+            kind = message[0]
+            if kind == "frame":
+                _kind, home, seq, frame = message
+                self.frames_in += 1
+                if self.on_frame is not None:
+                    self.on_frame(home, seq, frame)
+            elif kind == "notify":
+                _kind, topic, payload = message
+                listener = self._listeners.get(topic)
+                if listener is not None:
+                    self._executor.submit(listener, payload)
+            elif kind == "call":
+                self._pools.get(message[4], self._executor).submit(self._answer, *message[2:])
+            elif kind == "reply":
+                _kind, _to, call_id, ok, result = message
+                future = self._calls.get(call_id)
+                if future is not None and not future.done():
+                    if ok:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(ClusterError(result))
+
+    def _answer(self, caller: int, call_id: int, method: str, params: Dict[str, Any]) -> None:
+        self.calls_in += 1
+        try:
+            reply = (True, self._handlers[method](params))
+        except Exception as e:
+            reply = (False, f"{method}: {e}")
+        try:
+            self._send(("reply", caller, call_id, *reply))
+        except (OSError, ValueError):
+            pass
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> None:
+        """Run fn off the bus reader thread (it must not block on a call itself)."""
+        self._executor.submit(fn, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker": self.worker,
+            "workers": self.workers,
+            "frames_out": self.frames_out,
+            "frames_in": self.frames_in,
+            "calls_out": self.calls_out,
+            "calls_in": self.calls_in,
+            "reconnects": self.reconnects,
+            "error": self.error,
+        }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Умный дом на нескольких процессах")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=5000)
+    ap.add_argument("--serve-fd", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.serve_fd is not None:
+        _serve_worker(args.serve_fd)
+    else:
+        _supervise(args)
+
+
+if __name__ == "__main__":
+    main()
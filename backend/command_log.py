@@ -0,0 +1,72 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend import db
+
+
+class CommandLog:
+    """Buffered append-only log of executed commands (db.command_log).
+
+    record() only appends to a list; a background thread writes the buffer in
+    one transaction every `interval` seconds, so logging adds no SQLite write
+    to the request path.
+    """
+
+    def __init__(self, interval: float = 1.0, max_buffer: int = 10000):
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self._buffer: List[Tuple[float, str, str, str, Optional[float], Optional[str]]] = []
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.error: Optional[str] = None
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="command-log", daemon=True).start()
+
+    def record(self, parsed: Dict[str, Any]) -> None:
+        action = parsed.get("action") or "unknown"
+        intent = parsed.get("intent")
+        source = intent["source"] if intent else ("rules" if action != "unknown" else "none")
+        confidence = intent["confidence"] if intent else None
+        # Only rule matches are trusted as labels; the classifier's own guesses
+        # would just teach it what it already believes. Scenes and multi-command
+        # utterances are not labels either: the classifier could not fill their params.
+        label = action if source == "rules" and action not in ("run_scene", "multiple") else None
+        self._append((time.time(), parsed.get("raw") or "", action, source, confidence, label))
+
+    def label(self, text: str, label: str) -> None:
+        self._append((time.time(), text, label, "feedback", None, label))
+
+    def _append(self, row: tuple) -> None:
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._buffer.append(row)
+
+    def flush(self) -> None:
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        try:
+            db.log_commands(rows)
+        except Exception as e:
+            self.error = str(e)
+            with self._lock:
+                self.dropped += len(rows)
+            return
+        with self._lock:
+            self.written += len(rows)
+        self.error = None
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"buffered": len(self._buffer), "written": self.written, "dropped": self.dropped, "error": self.error}
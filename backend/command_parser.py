@@ -1,77 +1,296 @@
 import re
-from typing import Dict, Any
+from typing import Any, Callable, Dict, List, Match, NamedTuple, Optional, Pattern
+
+from backend.phrase_matcher import PhraseAutomaton
 
 ROOMS_MAP = {
 
-    "кухне": "кухня", "кухня": "кухня",
+    "кухне": "кухня", "кухня": "кухня", "кухню": "кухня", "кухни": "кухня",
 
-    "спальне": "спальня", "спальня": "спальня",
+    "спальне": "спальня", "спальня": "спальня", "спальню": "спальня", "спальни": "спальня",
 
-    "гостиной": "гостиная", "гостиная": "гостиная", "зале": "зал", "зал": "зал",
+    "гостиной": "гостиная", "гостиная": "гостиная", "гостиную": "гостиная", "зале": "зал", "зал": "зал", "зала": "зал",
 
-    "ванной": "ванная", "ванна": "ванная", "санузле": "туалет", "санузел": "туалет", "туалете": "туалет", "туалет": "туалет",
+    "ванной": "ванная", "ванна": "ванная", "ванная": "ванная", "ванную": "ванная", "ванне": "ванная",
+    "санузле": "туалет", "санузел": "туалет", "туалете": "туалет", "туалет": "туалет",
 
     "коридоре": "коридор", "коридор": "коридор", "прихожей": "прихожая", "прихожая": "прихожая", "холле": "холл", "холл": "холл",
 
     "кабинете": "кабинет", "кабинет": "кабинет", "офисе": "офис", "офис": "офис",
 
-    "детской": "детская", "детская": "детская", "комнате": "комната", "комната": "комната",
+    "детской": "детская", "детская": "детская", "детскую": "детская", "детской комнате": "детская",
+    "комнате": "комната", "комната": "комната", "комнату": "комната",
+}
+
+# Trigger phrases of scenes (backend/scenes.py): phrase -> scene name.
+SCENE_PHRASES = {
+    "спокойной ночи": "night", "доброй ночи": "night", "я спать": "night",
+    "доброе утро": "morning",
+    "я ухожу": "away", "я ушел": "away", "я ушёл": "away",
+    "я дома": "home", "я пришел": "home", "я пришёл": "home",
 }
 
+# Where one utterance may switch to the next command: "выключи свет в зале и
+# поставь температуру 20", "...; потом ...". A clause is split off only if it
+# has a command of its own, so "включи свет на кухне и в зале" stays one command.
+_CLAUSE_RE = re.compile(r"(\s*[,;]\s*(?:а\s+)?(?:(?:и\s+)?(?:потом|затем)\s+)?|\s+(?:и|а)\s+(?:(?:потом|затем)\s+)?|\s+(?:потом|затем)\s+)")
+
 def normalize(text: str) -> str:
-    return re.sub(r"\s+", " ", text.strip().lower())
+    return " ".join(text.lower().split())
+
+
+def _room_params(m: Match, t: str) -> Dict[str, Any]:
+    rooms = extract_rooms(t)
+    params: Dict[str, Any] = {"room": rooms[0] if rooms else None}
+    if len(rooms) > 1:
+        params["rooms"] = rooms
+    return params
+
+
+def _timer_params(m: Match, t: str) -> Dict[str, Any]:
+    return {"value": int(m.group("timer_value")), "unit": m.group("timer_unit")}
+
+
+def _app_params(m: Match, t: str) -> Dict[str, Any]:
+    return {"target": m.group("app_target")}
+
+
+def _volume_params(m: Match, t: str) -> Dict[str, Any]:
+    return {"value": max(0, min(100, int(m.group("volume_value"))))}
+
+
+def _setpoint_params(prefix: str) -> Callable[[Match, str], Dict[str, Any]]:
+    def params(m: Match, t: str) -> Dict[str, Any]:
+        room = _extract_room(m.group(f"{prefix}_room") or t)
+        return {"room": room, "value": int(m.group(f"{prefix}_value"))}
+    return params
+
+
+class Intent(NamedTuple):
+    action: str
+    stem: str  # literal that must occur in the text for `pattern` to have a chance
+    pattern: Pattern
+    params: Callable[[Match, str], Dict[str, Any]]
+
+
+# Intents in priority order: the first one whose pattern matches wins.
+INTENTS: List[Intent] = [
+    Intent("turn_on_light", "включ", re.compile(r"\bвключ(?:и|ить)\b.*\bсвет\b"), _room_params),
+    Intent("turn_off_light", "выключ", re.compile(r"\bвыключ(?:и|ить)\b.*\bсвет\b"), _room_params),
+    Intent(
+        "set_timer",
+        "таймер",
+        re.compile(r"таймер.*?на\s+(?P<timer_value>\d+)\s+(?P<timer_unit>секунд(?:у|ы|)|минут(?:у|ы|)|час(?:|а|ов))"),
+        _timer_params,
+    ),
+    Intent("open_app", "открой", re.compile(r"\bоткрой\b\s+(?P<app_target>[a-zA-Zа-яА-Я0-9._-]+)"), _app_params),
+    Intent("set_volume", "громкост", re.compile(r"\bгромкост[ьи]\b\s+(?P<volume_value>\d{1,3})"), _volume_params),
+    Intent("decrease_temperature", "температур", re.compile(r"сниз(?:ь|ить|и) температуру"), _room_params),
+    Intent("decrease_humidity", "влажност", re.compile(r"сниз(?:ь|ить|и) влажность"), _room_params),
+    Intent(
+        "set_temperature",
+        "температур",
+        re.compile(r"(?:установи|установить|поставь|измени|задать|сделай)? ?температур[ауыи]* ?(?:на|в)? ?(?P<temp_room>[а-я]+)? ?(?P<temp_value>\d{1,2})"),
+        _setpoint_params("temp"),
+    ),
+    Intent(
+        "set_humidity",
+        "влажност",
+        re.compile(r"(?:установи|установить|поставь|измени|задать|сделай)? ?влажност[ьи]* ?(?:на|в)? ?(?P<hum_room>[а-я]+)? ?(?P<hum_value>\d{1,2})"),
+        _setpoint_params("hum"),
+    ),
+]
+
+
+def _alternation(words) -> Pattern:
+    # Longest first, so a stem/form never shadows a longer one starting at the same place.
+    return re.compile("|".join(re.escape(w) for w in sorted(set(words), key=len, reverse=True)))
+
+
+GRAMMAR_VERSION = 0
+
+
+def _compile_grammar() -> None:
+    global _STEM_RE, _ROOMS, GRAMMAR_VERSION
+    # One scan over the text finds every stem present; only intents whose stem
+    # was seen get their full pattern tried. Text with no stem at all (chit-chat,
+    # unsupported requests) costs exactly one regex pass, and adding intents or
+    # room aliases grows the compiled stem alternation / room automaton, not the
+    # number of scans. Scene phrases are whole-word alternatives of the same scan.
+    scenes = "|".join(re.escape(p) for p in sorted(SCENE_PHRASES, key=len, reverse=True))
+    stems = _alternation(intent.stem for intent in INTENTS).pattern
+    _STEM_RE = re.compile(rf"\b(?:{scenes})\b|{stems}" if scenes else stems)
+    _ROOMS = PhraseAutomaton(ROOMS_MAP.items())
+    # Lets result caches keyed on text notice the grammar changed.
+    GRAMMAR_VERSION += 1
+
+
+def register_intent(intent: Intent, before: Optional[str] = None) -> None:
+    index = len(INTENTS)
+    if before is not None:
+        index = next(i for i, existing in enumerate(INTENTS) if existing.action == before)
+    INTENTS.insert(index, intent)
+    _compile_grammar()
+
+
+def register_room(form: str, canonical: str) -> None:
+    ROOMS_MAP[form.lower()] = canonical.lower()
+    _compile_grammar()
+
+
+def register_scene_phrases(phrases, scene: str) -> None:
+    for phrase in phrases:
+        SCENE_PHRASES[normalize(phrase)] = scene
+    _compile_grammar()
+
+
+_compile_grammar()
+
 
 def parse_command(text: str) -> Dict[str, Any]:
     t = normalize(text)
+    found = _STEM_RE.findall(t)
+    if len(found) > 1:
+        parsed = _parse_clauses(t, text)
+        if parsed is not None:
+            return parsed
+    return _parse_clause(t, set(found), text)
 
-    if re.search(r"\bвключ(и|ить)\b.*\bсвет\b", t):
-        room = _extract_room(t)
-        return {"action": "turn_on_light", "params": {"room": room}, "raw": text}
-    if re.search(r"\bвыключ(и|ить)\b.*\bсвет\b", t):
-        room = _extract_room(t)
-        return {"action": "turn_off_light", "params": {"room": room}, "raw": text}
-
-    m = re.search(r"таймер.*?на\s+(\d+)\s+(секунд(?:у|ы|)|минут(?:у|ы|)|час(?:|а|ов))", t)
-    if m:
-        value = int(m.group(1))
-        unit = m.group(2)
-        return {"action": "set_timer", "params": {"value": value, "unit": unit}, "raw": text}
-
-    m = re.search(r"\bоткрой\b\s+([a-zA-Zа-яА-Я0-9._-]+)", t)
-    if m:
-        target = m.group(1)
-        return {"action": "open_app", "params": {"target": target}, "raw": text}
-
-    m = re.search(r"\bгромкост[ьи]\b\s+(\d{1,3})", t)
-    if m:
-        vol = max(0, min(100, int(m.group(1))))
-        return {"action": "set_volume", "params": {"value": vol}, "raw": text}
-
-    m = re.search(r"сниз(ь|ить|и) температуру( в ([а-я]+))?", t)
-    if m:
-        room = _extract_room(t)
-        return {"action": "decrease_temperature", "params": {"room": room}, "raw": text}
-
-    m = re.search(r"сниз(ь|ить|и) влажность( в ([а-я]+))?", t)
-    if m:
-        room = _extract_room(t)
-        return {"action": "decrease_humidity", "params": {"room": room}, "raw": text}
-
-    m = re.search(r'(установи|установить|поставь|измени|задать|сделай)? ?температур[ауыи]* ?(на|в)? ?([а-я]+)? ?(\d{1,2})', t)
-    if m:
-        value = int(m.group(4))
-        room = _extract_room(m.group(3) or t)
-        return {"action": "set_temperature", "params": {"room": room, "value": value}, "raw": text}
-    m = re.search(r'(установи|установить|поставь|измени|задать|сделай)? ?влажност[ьи]* ?(на|в)? ?([а-я]+)? ?(\d{1,2})', t)
-    if m:
-        value = int(m.group(4))
-        room = _extract_room(m.group(3) or t)
-        return {"action": "set_humidity", "params": {"room": room, "value": value}, "raw": text}
 
+def _parse_clause(t: str, stems, text: str) -> Dict[str, Any]:
+    if stems:
+        for intent in INTENTS:
+            if intent.stem in stems:
+                m = intent.pattern.search(t)
+                if m:
+                    return {"action": intent.action, "params": intent.params(m, t), "raw": text}
+        for stem in stems:
+            if stem in SCENE_PHRASES:
+                return {"action": "run_scene", "params": {"scene": SCENE_PHRASES[stem]}, "raw": text}
     return {"action": "unknown", "params": {}, "raw": text}
 
+
+def _parse_clauses(t: str, text: str) -> Optional[Dict[str, Any]]:
+    """Several commands in one utterance, or None if there is at most one."""
+    pieces = _CLAUSE_RE.split(t)
+    clauses = [pieces[0]]
+    for sep, clause in zip(pieces[1::2], pieces[2::2]):
+        if _STEM_RE.search(clause) and _STEM_RE.search(clauses[-1]):
+            clauses.append(clause)
+        else:
+            clauses[-1] += sep + clause
+    if len(clauses) < 2:
+        return None
+    commands = []
+    unresolved = []
+    previous = None
+    for clause in clauses:
+        parsed = _parse_clause(clause, set(_STEM_RE.findall(clause)), clause)
+        if parsed["action"] == "unknown" and previous is not None:
+            parsed = _borrow_object(clause, previous)
+        if parsed["action"] != "unknown":
+            commands.append({"action": parsed["action"], "params": parsed["params"]})
+            previous = clause
+        else:
+            unresolved.append(clause)
+    if commands and any(extract_rooms(clause) for clause in unresolved):
+        # The whole-text fallback would drop that clause or give its rooms to
+        # another clause's verb ("включи свет в зале и выключи ... на кухне"
+        # turning the kitchen on); an incomplete parse is better.
+        commands.append({"action": "unknown", "params": {}})
+        return {"action": "multiple", "params": {"actions": commands}, "raw": text}
+    if len(commands) < 2:
+        return None
+    # "выключи свет в зале и поставь температуру 20": a command without a room
+    # takes the rooms of the one before it (or, for the first, the one after).
+    for i, command in enumerate(commands):
+        params = command["params"]
+        if command["action"] in ROOM_ACTIONS and not params.get("room"):
+            neighbours = commands[i - 1::-1] if i else commands[1:]
+            for other in neighbours:
+                if other["params"].get("room"):
+                    params["room"] = other["params"]["room"]
+                    if other["params"].get("rooms"):
+                        params["rooms"] = list(other["params"]["rooms"])
+                    break
+    return {"action": "multiple", "params": {"actions": commands}, "raw": text}
+
+
+_PREPOSITIONS = {"в", "во", "на"}
+
+
+def _borrow_object(clause: str, previous: str) -> Dict[str, Any]:
+    """"включи свет в зале и выключи на кухне": a clause with a verb but no
+    object takes the object of the clause before it (its words other than the
+    verb, rooms, numbers and prepositions), right after its own verb."""
+    words = clause.split()
+    verb = next((i for i, word in enumerate(words) if _STEM_RE.search(word)), None)
+    if verb is None:
+        return {"action": "unknown", "params": {}, "raw": clause}
+    borrowed = [
+        word for word in previous.split()
+        if not _STEM_RE.search(word) and word not in _PREPOSITIONS and not word.isdigit() and not extract_rooms(word)
+    ]
+    candidate = " ".join(words[:verb + 1] + borrowed + words[verb + 1:])
+    parsed = _parse_clause(candidate, set(_STEM_RE.findall(candidate)), clause)
+    # only objects that go with a room ("свет", "температуру") are borrowed
+    if parsed["action"] not in ROOM_ACTIONS:
+        return {"action": "unknown", "params": {}, "raw": clause}
+    return parsed
+
+
+# Actions that do nothing without a room.
+ROOM_ACTIONS = {
+    "turn_on_light",
+    "turn_off_light",
+    "decrease_temperature",
+    "decrease_humidity",
+    "set_temperature",
+    "set_humidity",
+}
+
+
+def is_complete(parsed: Dict[str, Any]) -> bool:
+    action = parsed.get("action")
+    if action in (None, "unknown"):
+        return False
+    if action == "multiple":
+        return all(is_complete(command) for command in parsed.get("params", {}).get("actions", []))
+    if action == "run_scene":
+        return bool(parsed.get("params", {}).get("scene"))
+    if action in ROOM_ACTIONS and not parsed.get("params", {}).get("room"):
+        return False
+    return True
+
+
+_NUMBER_RE = re.compile(r"\d+")
+_UNIT_RE = re.compile(r"секунд(?:у|ы|)|минут(?:у|ы|)|час(?:|а|ов)")
+
+
+def slot_params(action: str, text: str) -> Dict[str, Any]:
+    """Best-effort slots for an action chosen without a pattern match (e.g. by the classifier)."""
+    t = normalize(text)
+    params = _room_params(None, t)
+    number = _NUMBER_RE.search(t)
+    if number:
+        params["value"] = int(number.group())
+    if action == "set_timer":
+        unit = _UNIT_RE.search(t)
+        if unit:
+            params["unit"] = unit.group()
+    elif action == "set_volume" and "value" in params:
+        params["value"] = max(0, min(100, params["value"]))
+    return params
+
+
+def extract_rooms(t: str) -> List[str]:
+    rooms: List[str] = []
+    for _start, _end, canonical in _ROOMS.find(t):
+        if canonical not in rooms:
+            rooms.append(canonical)
+    return rooms
+
+
 def _extract_room(t: str):
-    for form, canonical in ROOMS_MAP.items():
-        if form in t:
-            return canonical
-    return None
+    rooms = extract_rooms(t)
+    return rooms[0] if rooms else None
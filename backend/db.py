@@ -1,88 +1,449 @@
+import json
 import os
+import queue
 import sqlite3
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "devices.sqlite3")
+DB_PATH = os.getenv("DEVICES_DB", os.path.join(os.path.dirname(__file__), "devices.sqlite3"))
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+_COLUMNS = "id, name, room, type, is_on"
+
+# Every device and sensor rollup belongs to a household; single-home setups
+# only ever see this one.
+DEFAULT_HOME = "default"
+
+# WAL lets readers run alongside the single writer; synchronous=NORMAL in WAL mode
+# fsyncs at checkpoints rather than on every commit, so toggling a light is no
+# longer an fsync per request.
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+_POOL: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+_POOL_CREATED = 0
+_POOL_LOCK = threading.Lock()
 
 
 def _connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    # isolation_level=None: autocommit for reads, explicit BEGIN IMMEDIATE for writes.
+    # The sqlite3 statement cache keeps compiled statements per connection, so
+    # pooled connections reuse prepared statements across requests.
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
-def init_db() -> None:
-    conn = _connect()
+@contextmanager
+def _acquire() -> Iterator[sqlite3.Connection]:
+    global _POOL_CREATED
     try:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS devices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                room TEXT,
-                type TEXT NOT NULL,
-                is_on INTEGER NOT NULL DEFAULT 0
-            )
-            """
-        )
-        conn.commit()
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        with _POOL_LOCK:
+            grow = _POOL_CREATED < POOL_SIZE
+            if grow:
+                _POOL_CREATED += 1
+        conn = _connect() if grow else _POOL.get()
+    try:
+        yield conn
     finally:
-        conn.close()
+        if conn.in_transaction:
+            conn.rollback()
+        _POOL.put(conn)
 
 
-def list_devices() -> List[Dict[str, Any]]:
-    conn = _connect()
-    try:
-        cur = conn.execute("SELECT id, name, room, type, is_on FROM devices ORDER BY id ASC")
-        return [dict(row) | {"is_on": bool(row["is_on"])} for row in cur.fetchall()]
-    finally:
-        conn.close()
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    with _acquire() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
 
 
-def get_device_by_room_and_type(room: str, type_: str) -> Optional[Dict[str, Any]]:
-    conn = _connect()
-    try:
+def close_all() -> None:
+    global _POOL_CREATED
+    while True:
+        try:
+            _POOL.get_nowait().close()
+        except queue.Empty:
+            break
+        with _POOL_LOCK:
+            _POOL_CREATED -= 1
+
+
+def _row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    return (dict(row) | {"is_on": bool(row["is_on"])}) if row else None
+
+
+# Device types that exist at most once per room; (room, type) is unique for them.
+SINGLETON_TYPES = ("light", "thermometer")
+_SINGLETON_WHERE = "room IS NOT NULL AND type IN ('light', 'thermometer')"
+
+# Schema migrations, applied in order; PRAGMA user_version records how many ran.
+MIGRATIONS: List[Tuple[str, ...]] = [
+    (
+        """
+        CREATE TABLE IF NOT EXISTS devices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            room TEXT,
+            type TEXT NOT NULL,
+            is_on INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+    ),
+    (
+        # Older databases could get duplicate room lights from the get-then-create race.
+        f"""
+        DELETE FROM devices WHERE {_SINGLETON_WHERE} AND id NOT IN (
+            SELECT MIN(id) FROM devices WHERE {_SINGLETON_WHERE} GROUP BY room, type
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_devices_room_type ON devices(room, type)",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS uq_devices_room_singleton ON devices(room, type) WHERE {_SINGLETON_WHERE}",
+        "CREATE INDEX IF NOT EXISTS idx_devices_type ON devices(type)",
+    ),
+    (
+        # Every executed command, for retraining the intent classifier. label is
+        # the trusted action (a rule match or an explicit correction), else NULL.
+        """
+        CREATE TABLE IF NOT EXISTS command_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            text TEXT NOT NULL,
+            action TEXT NOT NULL,
+            source TEXT NOT NULL,
+            confidence REAL,
+            label TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_command_log_labeled ON command_log(id) WHERE label IS NOT NULL",
+    ),
+    (
+        # Sensor rollups: one row per (room, resolution, bucket, metric) holding
+        # count/sum/min/max, so range queries read pre-aggregated buckets and
+        # raw readings never become rows (backend/telemetry.py).
+        """
+        CREATE TABLE IF NOT EXISTS sensor_rollups (
+            room TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            PRIMARY KEY (room, resolution, bucket, metric)
+        ) WITHOUT ROWID
+        """,
+    ),
+    (
+        # Households: devices and rollups get a home column, and the per-room
+        # uniqueness of lights and thermometers becomes per (home, room).
+        f"ALTER TABLE devices ADD COLUMN home TEXT NOT NULL DEFAULT '{DEFAULT_HOME}'",
+        "DROP INDEX IF EXISTS uq_devices_room_singleton",
+        "DROP INDEX IF EXISTS idx_devices_room_type",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS uq_devices_home_room_singleton ON devices(home, room, type) WHERE {_SINGLETON_WHERE}",
+        "CREATE INDEX IF NOT EXISTS idx_devices_home_room_type ON devices(home, room, type)",
+        """
+        CREATE TABLE sensor_rollups_v2 (
+            home TEXT NOT NULL,
+            room TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            PRIMARY KEY (home, room, resolution, bucket, metric)
+        ) WITHOUT ROWID
+        """,
+        f"INSERT INTO sensor_rollups_v2 SELECT '{DEFAULT_HOME}', * FROM sensor_rollups",
+        "DROP TABLE sensor_rollups",
+        "ALTER TABLE sensor_rollups_v2 RENAME TO sensor_rollups",
+    ),
+    (
+        # Pending timers and schedules (backend/scheduler.py). cron is NULL for
+        # a one-shot job; action NULL means the job only notifies.
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            home TEXT NOT NULL,
+            due REAL NOT NULL,
+            cron TEXT,
+            action TEXT,
+            params TEXT NOT NULL DEFAULT '{}',
+            label TEXT,
+            created REAL NOT NULL
+        )
+        """,
+    ),
+]
+
+
+def schema_version() -> int:
+    with _acquire() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db() -> None:
+    with transaction() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {number}")
+
+
+def list_homes() -> List[str]:
+    with _acquire() as conn:
+        return [row[0] for row in conn.execute("SELECT DISTINCT home FROM devices ORDER BY home")]
+
+
+def home_exists(home: str) -> bool:
+    with _acquire() as conn:
+        return conn.execute("SELECT 1 FROM devices WHERE home = ? LIMIT 1", (home,)).fetchone() is not None
+
+
+def count_homes() -> int:
+    with _acquire() as conn:
+        return conn.execute("SELECT COUNT(DISTINCT home) FROM devices").fetchone()[0]
+
+
+def list_devices(home: str = DEFAULT_HOME) -> List[Dict[str, Any]]:
+    with _acquire() as conn:
+        cur = conn.execute(f"SELECT {_COLUMNS} FROM devices WHERE home = ? ORDER BY id ASC", (home,))
+        return [_row(row) for row in cur.fetchall()]
+
+
+def get_device_by_room_and_type(room: str, type_: str, home: str = DEFAULT_HOME) -> Optional[Dict[str, Any]]:
+    with _acquire() as conn:
         cur = conn.execute(
-            "SELECT id, name, room, type, is_on FROM devices WHERE room = ? AND type = ? LIMIT 1",
-            (room, type_),
+            f"SELECT {_COLUMNS} FROM devices WHERE home = ? AND room = ? AND type = ? LIMIT 1",
+            (home, room, type_),
         )
-        row = cur.fetchone()
-        return (dict(row) | {"is_on": bool(row["is_on"])}) if row else None
-    finally:
-        conn.close()
+        return _row(cur.fetchone())
 
 
-def create_device(name: str, room: Optional[str], type_: str, is_on: bool = False) -> Dict[str, Any]:
-    conn = _connect()
-    try:
+def get_device(device_id: int, home: str = DEFAULT_HOME) -> Optional[Dict[str, Any]]:
+    with _acquire() as conn:
+        cur = conn.execute(f"SELECT {_COLUMNS} FROM devices WHERE id=? AND home=?", (device_id, home))
+        return _row(cur.fetchone())
+
+
+def _insert(
+    conn: sqlite3.Connection, name: str, room: Optional[str], type_: str, is_on: bool, home: str
+) -> Dict[str, Any]:
+    cur = conn.execute(
+        f"INSERT INTO devices(name, room, type, is_on, home) VALUES(?,?,?,?,?) RETURNING {_COLUMNS}",
+        (name, room, type_, 1 if is_on else 0, home),
+    )
+    return _row(cur.fetchone())
+
+
+def _update(conn: sqlite3.Connection, device_id: int, is_on: bool, home: str) -> Optional[Dict[str, Any]]:
+    cur = conn.execute(
+        f"UPDATE devices SET is_on=? WHERE id=? AND home=? RETURNING {_COLUMNS}",
+        (1 if is_on else 0, device_id, home),
+    )
+    return _row(cur.fetchone())
+
+
+def create_device(
+    name: str, room: Optional[str], type_: str, is_on: bool = False, home: str = DEFAULT_HOME
+) -> Dict[str, Any]:
+    with transaction() as conn:
+        return _insert(conn, name, room, type_, is_on, home)
+
+
+def update_device_state(device_id: int, is_on: bool, home: str = DEFAULT_HOME) -> Optional[Dict[str, Any]]:
+    with transaction() as conn:
+        return _update(conn, device_id, is_on, home)
+
+
+def ensure_device(
+    room: str,
+    type_: str,
+    is_on: Optional[bool] = None,
+    name: Optional[str] = None,
+    home: str = DEFAULT_HOME,
+) -> Dict[str, Any]:
+    """Return the room's device of this type, creating it if missing.
+
+    With is_on given, the state is also set (created with it or updated to it),
+    all in one statement for singleton types, so concurrent callers can't create
+    duplicates.
+    """
+    with transaction() as conn:
+        return _ensure(conn, room, type_, is_on, name, home)
+
+
+def ensure_many(items: Iterable[Tuple[str, str, Optional[bool]]], home: str = DEFAULT_HOME) -> List[Dict[str, Any]]:
+    """ensure_device for several (room, type, is_on) in one transaction."""
+    with transaction() as conn:
+        return [_ensure(conn, room, type_, is_on, None, home) for room, type_, is_on in items]
+
+
+def _ensure(
+    conn: sqlite3.Connection, room: str, type_: str, is_on: Optional[bool], name: Optional[str], home: str
+) -> Dict[str, Any]:
+    name = name or f"{type_}:{room}"
+    if type_ in SINGLETON_TYPES and room is not None:
+        on_conflict = "devices.is_on" if is_on is None else "excluded.is_on"
         cur = conn.execute(
-            "INSERT INTO devices(name, room, type, is_on) VALUES(?,?,?,?)",
-            (name, room, type_, 1 if is_on else 0),
+            f"""
+            INSERT INTO devices(name, room, type, is_on, home) VALUES(?,?,?,?,?)
+            ON CONFLICT(home, room, type) WHERE {_SINGLETON_WHERE} DO UPDATE SET is_on = {on_conflict}
+            RETURNING {_COLUMNS}
+            """,
+            (name, room, type_, 1 if is_on else 0, home),
         )
-        conn.commit()
-        device_id = cur.lastrowid
-        return get_device(device_id) 
-    finally:
-        conn.close()
+        return _row(cur.fetchone())
+    row = conn.execute(
+        f"SELECT {_COLUMNS} FROM devices WHERE home = ? AND room IS ? AND type = ? LIMIT 1", (home, room, type_)
+    ).fetchone()
+    if row is None:
+        return _insert(conn, name, room, type_, bool(is_on), home)
+    if is_on is None:
+        return _row(row)
+    return _update(conn, row["id"], is_on, home)
 
 
-def get_device(device_id: int) -> Optional[Dict[str, Any]]:
-    conn = _connect()
-    try:
-        cur = conn.execute("SELECT id, name, room, type, is_on FROM devices WHERE id=?", (device_id,))
-        row = cur.fetchone()
-        return (dict(row) | {"is_on": bool(row["is_on"])}) if row else None
-    finally:
-        conn.close()
+def create_many(devices: Iterable[Dict[str, Any]], home: str = DEFAULT_HOME) -> List[Dict[str, Any]]:
+    """Insert several devices ({"name", "room", "type", "is_on"}) in one transaction."""
+    with transaction() as conn:
+        return [
+            _insert(conn, d["name"], d.get("room"), d.get("type", "light"), bool(d.get("is_on", False)), home)
+            for d in devices
+        ]
 
 
-def update_device_state(device_id: int, is_on: bool) -> Optional[Dict[str, Any]]:
-    conn = _connect()
-    try:
-        conn.execute("UPDATE devices SET is_on=? WHERE id=?", (1 if is_on else 0, device_id))
-        conn.commit()
-        return get_device(device_id)
-    finally:
-        conn.close()
+def update_many(changes: Iterable[Tuple[int, bool]], home: str = DEFAULT_HOME) -> List[Dict[str, Any]]:
+    """Apply (device_id, is_on) pairs in one transaction; unknown ids (or another home's) are skipped."""
+    with transaction() as conn:
+        updated = (_update(conn, device_id, is_on, home) for device_id, is_on in changes)
+        return [dev for dev in updated if dev]
+
+
+def log_commands(rows: Iterable[Tuple[float, str, str, str, Optional[float], Optional[str]]]) -> None:
+    """Append (ts, text, action, source, confidence, label) rows in one transaction."""
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT INTO command_log(ts, text, action, source, confidence, label) VALUES(?,?,?,?,?,?)",
+            rows,
+        )
+
+
+def labeled_commands(after_id: int = 0, limit: int = 1000) -> List[Tuple[int, str, str]]:
+    """(id, text, label) of labeled commands with id > after_id, oldest first."""
+    with _acquire() as conn:
+        cur = conn.execute(
+            "SELECT id, text, label FROM command_log WHERE label IS NOT NULL AND id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        )
+        return [tuple(row) for row in cur.fetchall()]
+
+
+def upsert_rollups(rows: Iterable[Tuple[str, str, int, int, str, int, float, float, float]]) -> None:
+    """Merge (home, room, resolution, bucket, metric, count, sum, min, max) partial aggregates."""
+    with transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO sensor_rollups(home, room, resolution, bucket, metric, count, sum, min, max)
+            VALUES(?,?,?,?,?,?,?,?,?)
+            ON CONFLICT(home, room, resolution, bucket, metric) DO UPDATE SET
+                count = count + excluded.count,
+                sum = sum + excluded.sum,
+                min = MIN(min, excluded.min),
+                max = MAX(max, excluded.max)
+            """,
+            rows,
+        )
+
+
+def query_rollups(
+    home: str, room: str, resolution: int, start: int, end: int, metric: Optional[str] = None
+) -> List[Tuple[int, str, int, float, float, float]]:
+    """(bucket, metric, count, sum, min, max) for buckets in [start, end], oldest first."""
+    sql = (
+        "SELECT bucket, metric, count, sum, min, max FROM sensor_rollups "
+        "WHERE home = ? AND room = ? AND resolution = ? AND bucket BETWEEN ? AND ?"
+    )
+    params: Tuple[Any, ...] = (home, room, resolution, start, end)
+    if metric is not None:
+        sql += " AND metric = ?"
+        params += (metric,)
+    with _acquire() as conn:
+        return [tuple(row) for row in conn.execute(sql + " ORDER BY bucket", params).fetchall()]
+
+
+def latest_rollups(home: str, resolution: int) -> List[Tuple[str, str, float]]:
+    """(room, metric, average) of the newest bucket of every series of a home."""
+    with _acquire() as conn:
+        return [tuple(row) for row in conn.execute(
+            """
+            SELECT room, metric, sum / count FROM sensor_rollups AS r
+            WHERE home = ? AND resolution = ? AND bucket = (
+                SELECT MAX(bucket) FROM sensor_rollups
+                WHERE home = r.home AND room = r.room AND resolution = r.resolution AND metric = r.metric
+            )
+            """,
+            (home, resolution),
+        ).fetchall()]
+
+
+def delete_rollups_before(resolution: int, bucket: int) -> int:
+    with transaction() as conn:
+        return conn.execute(
+            "DELETE FROM sensor_rollups WHERE resolution = ? AND bucket < ?", (resolution, bucket)
+        ).rowcount
+
+
+_JOB_COLUMNS = "id, home, due, cron, action, params, label, created"
+
+
+def _job(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    return (dict(row) | {"params": json.loads(row["params"])}) if row else None
+
+
+def create_job(
+    home: str, due: float, action: Optional[str], params: Dict[str, Any], label: Optional[str], cron: Optional[str] = None
+) -> Dict[str, Any]:
+    with transaction() as conn:
+        cur = conn.execute(
+            f"INSERT INTO jobs(home, due, cron, action, params, label, created) VALUES(?,?,?,?,?,?,?) RETURNING {_JOB_COLUMNS}",
+            (home, due, cron, action, json.dumps(params, ensure_ascii=False), label, time.time()),
+        )
+        return _job(cur.fetchone())
+
+
+def pending_jobs() -> List[Dict[str, Any]]:
+    with _acquire() as conn:
+        return [_job(row) for row in conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs ORDER BY due")]
+
+
+def delete_job(job_id: int) -> bool:
+    with transaction() as conn:
+        return conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount > 0
 
 
+def finish_jobs(done: Iterable[int], rescheduled: Iterable[Tuple[float, int]]) -> None:
+    """Delete fired one-shot jobs and move recurring ones to their (due, id), in one transaction."""
+    with transaction() as conn:
+        conn.executemany("DELETE FROM jobs WHERE id = ?", ((job_id,) for job_id in done))
+        conn.executemany("UPDATE jobs SET due = ? WHERE id = ?", rescheduled)
@@ -0,0 +1,212 @@
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from backend.db import DEFAULT_HOME
+from backend.pubsub import Hub
+from backend.registry import DeviceRegistry
+from backend.state_store import StateStore
+
+_HOME_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+class HomeError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def valid_home(home: str) -> bool:
+    return bool(_HOME_RE.match(home or ""))
+
+
+class Household:
+    """One home's live state: devices, current sensor values, the versioned
+    StateStore its dashboards stream from and the Hub of those streams.
+
+    A replica mirrors a home owned by another worker process
+    (backend/cluster.py): it has no registry, and its store only follows the
+    deltas the owner publishes.
+    """
+
+    def __init__(
+        self,
+        home: str = DEFAULT_HOME,
+        replica: bool = False,
+        hub_maxsize: int = 64,
+        hub_policy: str = "coalesce",
+        history: int = 512,
+    ):
+        self.home = home
+        self.replica = replica
+        # Held while this home's state changes, so its deltas are ordered like the changes.
+        self.lock = threading.RLock()
+        self.registry = None if replica else DeviceRegistry(home)
+        self.thermometers: Dict[str, Dict[str, float]] = {}
+        self.store = StateStore(history=history)
+        self.hub = Hub(maxsize=hub_maxsize, policy=hub_policy)
+        self.ready = threading.Event()
+        self.error: Optional[str] = None
+        self.last_used = time.monotonic()
+        # Owner deltas that arrive before the replica's snapshot does.
+        self._buffered: Optional[List[Tuple[int, str]]] = [] if replica else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            thermometers = {room: dict(t) for room, t in self.thermometers.items()}
+        return {"lights": self.registry.lights(), "thermometers": thermometers, "devices": self.registry.list()}
+
+    def rooms(self) -> Set[str]:
+        """Rooms this home has devices or thermometers in."""
+        with self.lock:
+            rooms = set(self.thermometers)
+        if self.registry is not None:
+            rooms.update(dev["room"] for dev in self.registry.list() if dev["room"])
+        return rooms
+
+    # replicas
+
+    def follow(self, seq: int, frame: str) -> bool:
+        """Apply an owner delta and pass it to local streams; False if a resync is needed."""
+        with self.lock:
+            if self._buffered is not None:
+                self._buffered.append((seq, frame))
+                return True
+            if seq <= self.store.seq:
+                return True
+            if not self.store.follow(seq, frame):
+                return False
+        self.hub.publish((seq, frame))
+        return True
+
+    def begin_resync(self) -> None:
+        with self.lock:
+            if self._buffered is None:
+                self._buffered = []
+
+    def load_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        """Start (or restart) a replica from the owner's snapshot plus what arrived meanwhile."""
+        with self.lock:
+            self.store.reset(snapshot, seq=snapshot["seq"])
+            buffered, self._buffered = self._buffered or [], None
+            replayed = [
+                (seq, frame) for seq, frame in sorted(buffered)
+                if seq > self.store.seq and self.store.follow(seq, frame)
+            ]
+        # Streams see the jump in seq and send their clients a fresh snapshot.
+        for event in replayed:
+            self.hub.publish(event)
+
+
+class Households:
+    """The households this process has loaded.
+
+    `setup` fills a new Household (loads the devices, or for a replica fetches
+    the owner's snapshot) before anyone else gets to use it.
+
+    A home that is not loaded is looked up with `exists` (it has devices in
+    SQLite). Only callers passing create=True - the explicit create and the
+    write paths - may start a new one, and no more than `max_homes` of them
+    exist. At most `max_resident` are kept in memory: the least recently used
+    one that has no open streams and has been idle for `idle_seconds` makes
+    room; it is loaded again from SQLite when it is needed next.
+    """
+
+    def __init__(
+        self,
+        setup: Callable[[Household], None],
+        exists: Callable[[str], bool] = lambda home: True,
+        count: Callable[[], int] = lambda: 0,
+        max_homes: int = 1000,
+        max_resident: int = 256,
+        idle_seconds: float = 60.0,
+        **options,
+    ):
+        self._setup = setup
+        self._exists = exists
+        self._count = count
+        self.max_homes = max_homes
+        self.max_resident = max_resident
+        self.idle_seconds = idle_seconds
+        self._options = options
+        self._homes: Dict[str, Household] = {}
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, home: str, replica: bool = False, create: bool = False, timeout: float = 30.0) -> Household:
+        household = self._homes.get(home)
+        if household is None:
+            if not valid_home(home):
+                raise HomeError("идентификатор дома: латиница, цифры, '.', '_' или '-', до 64 символов")
+            if not self._exists(home):
+                if not create:
+                    raise HomeError(f"дом {home} не найден", 404)
+                if self._count() >= self.max_homes:
+                    raise HomeError(f"достигнут предел числа домов ({self.max_homes})", 403)
+            with self._lock:
+                household = self._homes.get(home)
+                created = household is None
+                if created:
+                    evicted = self._make_room()
+                    household = self._homes[home] = Household(home, replica=replica, **self._options)
+            if created:
+                if evicted is not None:
+                    evicted.hub.close_all()
+                try:
+                    self._setup(household)
+                except Exception as e:
+                    household.error = str(e)
+                    with self._lock:
+                        self._homes.pop(home, None)
+                finally:
+                    household.ready.set()
+        household.last_used = time.monotonic()
+        if not household.ready.wait(timeout) or household.error:
+            raise HomeError(f"дом {home} недоступен: {household.error or 'таймаут загрузки'}", 503)
+        return household
+
+    def _make_room(self) -> Optional[Household]:
+        """Unload the least recently used idle household if the limit is reached (under _lock)."""
+        if len(self._homes) < self.max_resident:
+            return None
+        idle_before = time.monotonic() - self.idle_seconds
+        idle = [
+            h for h in self._homes.values()
+            if h.home != DEFAULT_HOME and h.ready.is_set() and not len(h.hub) and h.last_used < idle_before
+        ]
+        if not idle:
+            raise HomeError(f"загружено слишком много активных домов ({self.max_resident})", 503)
+        victim = min(idle, key=lambda h: h.last_used)
+        del self._homes[victim.home]
+        self.evicted += 1
+        return victim
+
+    def find(self, home: str) -> Optional[Household]:
+        return self._homes.get(home)
+
+    def discard(self, household: Household) -> None:
+        """Forget a household and disconnect its streams (clients reconnect and get a fresh one)."""
+        with self._lock:
+            if self._homes.get(household.home) is household:
+                del self._homes[household.home]
+        household.hub.close_all()
+
+    def loaded(self) -> List[Household]:
+        return list(self._homes.values())
+
+    def stats(self) -> Dict[str, Any]:
+        homes = self.loaded()
+        counters = ("subscribers", "total_subscribed", "published", "dropped", "evicted")
+        streams: Dict[str, Any] = dict.fromkeys(counters, 0)
+        for household in homes:
+            hub = household.hub.stats()
+            for key in counters:
+                streams[key] += hub[key]
+            streams["policy"], streams["queue_size"] = hub["policy"], hub["queue_size"]
+        streams["homes"] = sum(not h.replica for h in homes)
+        streams["replicas"] = sum(h.replica for h in homes)
+        streams["max_resident"] = self.max_resident
+        # homes unloaded to make room; "evicted" above counts slow stream subscribers
+        streams["homes_evicted"] = self.evicted
+        return streams
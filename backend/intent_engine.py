@@ -0,0 +1,151 @@
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.batching import MicroBatcher
+from backend.command_parser import parse_command, slot_params
+from backend.models.command_classifier import ARTIFACT_DIR, CommandClassifier, load_latest, train_and_save
+
+# How parse_command and the classifier are combined:
+#   rules     - parse_command only;
+#   fallback  - the classifier is asked only when no rule matched;
+#   ensemble  - both run; a rule match wins, the classifier scores it.
+MODES = ("rules", "fallback", "ensemble")
+
+
+class IntentEngine:
+    def __init__(
+        self,
+        mode: str = "fallback",
+        min_confidence: float = 0.5,
+        top_k: int = 3,
+        max_batch: int = 64,
+        max_delay: float = 0.002,
+        timeout: float = 1.0,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"unknown intent engine mode {mode!r}, expected one of {MODES}")
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.top_k = max(1, top_k)
+        self.timeout = timeout
+        self.error: Optional[str] = None
+        # Replaced as a whole by install(); readers take one reference per batch.
+        self.classifier: Optional[CommandClassifier] = None
+        # Called with every installed model, e.g. to tell other processes about it.
+        self.on_install: Optional[Callable[[CommandClassifier], None]] = None
+        self._served: Dict[int, Dict[str, float]] = {}
+        self._batcher = MicroBatcher(self._classify_batch, max_batch=max_batch, max_delay=max_delay, name="intent-batcher")
+
+    @property
+    def version(self) -> int:
+        model = self.classifier
+        return model.version if model is not None else 0
+
+    def start(self, directory: str = ARTIFACT_DIR, bootstrap: bool = True) -> None:
+        if self.mode == "rules":
+            return
+        model = load_latest(directory)
+        if model is not None:
+            self.install(model)
+            return
+        if not bootstrap:
+            return
+        # No usable artifact (fresh checkout, or one pickled by another sklearn):
+        # build one from the bundled data without holding up startup.
+        threading.Thread(target=self._bootstrap, args=(directory,), name="intent-bootstrap", daemon=True).start()
+
+    def _bootstrap(self, directory: str) -> None:
+        try:
+            self.install(train_and_save(directory=directory))
+        except Exception as e:
+            self.error = f"не удалось обучить классификатор команд: {e}"
+
+    def install(self, model: CommandClassifier) -> None:
+        self.classifier = model
+        self.error = None
+        if self.on_install is not None:
+            self.on_install(model)
+
+    def reload(self, directory: str = ARTIFACT_DIR) -> bool:
+        """Install the newest artifact in directory if it is newer than the one serving."""
+        if self.mode == "rules":
+            return False
+        model = load_latest(directory)
+        if model is None or model.version <= self.version:
+            return False
+        self.install(model)
+        return True
+
+    def _classify_batch(self, texts: List[str]) -> List[List[Tuple[str, float]]]:
+        model = self.classifier
+        if model is None:
+            return [[] for _ in texts]
+        t0 = time.perf_counter()
+        result = model.predict_batch(texts, self.top_k)
+        served = self._served.setdefault(model.version, {"batches": 0, "items": 0, "total_ms": 0.0})
+        served["batches"] += 1
+        served["items"] += len(texts)
+        served["total_ms"] += (time.perf_counter() - t0) * 1000
+        return result
+
+    def classify(self, text: str) -> List[Tuple[str, float]]:
+        """Top-k (action, probability) for one utterance; [] if no model is loaded yet."""
+        if self.classifier is None:
+            return []
+        try:
+            return self._batcher(text, self.timeout)
+        except FutureTimeout:
+            return []
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        parsed = parse_command(text)
+        if self.mode == "rules" or (self.mode == "fallback" and parsed["action"] != "unknown"):
+            return parsed
+        top = self.classify(text)
+        if not top:
+            return parsed
+
+        if parsed["action"] != "unknown":
+            source = "rules"
+            confidence = next((p for label, p in top if label == parsed["action"]), 0.0)
+        else:
+            label, confidence = top[0]
+            source = "none"
+            if label != "unknown" and confidence >= self.min_confidence:
+                parsed = {"action": label, "params": slot_params(label, text), "raw": text}
+                source = "classifier"
+        parsed["intent"] = {
+            "source": source,
+            "confidence": round(confidence, 4),
+            "low_confidence": confidence < self.min_confidence,
+            "top_k": [{"action": label, "p": round(p, 4)} for label, p in top],
+            "model_version": self.version,
+        }
+        return parsed
+
+    def status(self) -> Dict[str, Any]:
+        model = self.classifier
+        return {
+            "mode": self.mode,
+            "ready": model is not None or self.mode == "rules",
+            "error": self.error,
+            "model_version": model.version if model is not None else None,
+            "trained_at": model.meta.get("trained_at") if model is not None else None,
+            "classes": model.classes if model is not None else [],
+            "min_confidence": self.min_confidence,
+            "batching": self._batcher.stats(),
+            "served": self.served(),
+        }
+
+    def served(self) -> Dict[int, Dict[str, Any]]:
+        """Per model version: how many utterances it classified and its average cost."""
+        return {
+            version: {
+                "batches": s["batches"],
+                "items": s["items"],
+                "avg_us_per_item": round(s["total_ms"] * 1000 / s["items"], 1) if s["items"] else None,
+            }
+            for version, s in list(self._served.items())
+        }
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from backend import command_parser
+from backend.command_parser import is_complete, parse_command
+from backend.metrics import percentiles
+from backend.speech_recognizer import (
+    SAMPLE_RATE, RecognitionError, RecognitionTimeout, RecognizerBusy, decode_audio_bytes, transcribe_array,
+    transcribe_scored,
+)
+
+# Fast path for the closed command vocabulary. Short clips first get one cheap
+# pass: greedy decode, a single temperature, no timestamps, a few tokens, with
+# the prompt primed by the command phrasing and room names. The text is taken
+# only if Whisper is confident and the parser recognises a complete command;
+# anything else (low confidence, chit-chat, missing room, long audio) goes to
+# the full beam-search transcription as before.
+
+FAST_PATH_MAX_SECONDS = float(os.getenv("FAST_PATH_MAX_SECONDS", "4"))
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.6"))
+FAST_PATH_MAX_NO_SPEECH = float(os.getenv("FAST_PATH_MAX_NO_SPEECH", "0.5"))
+
+_EXAMPLES = (
+    "Включи свет на кухне. Выключи свет в зале. Снизь температуру в спальне. "
+    "Установи температуру 22. Установи влажность 45. Поставь таймер на 5 минут. Громкость 30."
+)
+
+_PROMPT: Tuple[int, str] = (-1, "")
+
+
+def command_prompt() -> str:
+    global _PROMPT
+    version, prompt = _PROMPT
+    if version != command_parser.GRAMMAR_VERSION:
+        rooms = ", ".join(sorted(set(command_parser.ROOMS_MAP.values())))
+        prompt = f"{_EXAMPLES} Комнаты: {rooms}."
+        _PROMPT = (command_parser.GRAMMAR_VERSION, prompt)
+    return prompt
+
+
+def _fast_pass(audio, language: str, timeout: Optional[float]) -> Tuple[str, Optional[float], Optional[float]]:
+    return transcribe_scored(
+        audio,
+        language,
+        timeout,
+        beam_size=1,
+        temperature=0.0,
+        without_timestamps=True,
+        condition_on_previous_text=False,
+        initial_prompt=command_prompt(),
+        max_new_tokens=32,
+        vad_filter=True,
+    )
+
+
+def _accept(text: str, confidence: Optional[float], no_speech: Optional[float]) -> bool:
+    if not text or confidence is None:
+        return False
+    if confidence < FAST_PATH_MIN_CONFIDENCE or no_speech > FAST_PATH_MAX_NO_SPEECH:
+        return False
+    return is_complete(parse_command(text))
+
+
+def recognize_command(
+    data: bytes, language: str = "ru-RU", timeout: Optional[float] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Transcribe a voice command; returns (text, info) where info says which stage answered.
+
+    timeout covers the whole request: the full pass only gets what the fast
+    pass left of it.
+
+    info: {"stage": "fast" | "full", "fast_attempted": bool, "confidence",
+    "decode_ms", "fast_ms", "full_ms"} (stages that did not run are None).
+    """
+    info: Dict[str, Any] = {
+        "stage": "full",
+        "fast_attempted": False,
+        "confidence": None,
+        "decode_ms": None,
+        "fast_ms": None,
+        "full_ms": None,
+    }
+    t0 = time.perf_counter()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    audio = decode_audio_bytes(data)
+    t1 = time.perf_counter()
+    info["decode_ms"] = (t1 - t0) * 1000
+
+    if audio.size <= FAST_PATH_MAX_SECONDS * SAMPLE_RATE:
+        info["fast_attempted"] = True
+        try:
+            text, confidence, no_speech = _fast_pass(audio, language, _remaining(deadline))
+        except (RecognitionTimeout, RecognizerBusy):
+            raise
+        except RecognitionError:
+            text, confidence, no_speech = "", None, None
+        t2 = time.perf_counter()
+        info["fast_ms"] = (t2 - t1) * 1000
+        info["confidence"] = confidence
+        if _accept(text, confidence, no_speech):
+            info["stage"] = "fast"
+            return text, info
+        t1 = t2
+
+    text = transcribe_array(audio, language, _remaining(deadline))
+    info["full_ms"] = (time.perf_counter() - t1) * 1000
+    return text, info
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise RecognitionTimeout("Истекло время ожидания распознавания")
+    return left
+
+
+class FastPathStats:
+    """Hit rate and per-stage latency percentiles over the last `window` requests."""
+
+    STAGES = ("decode_ms", "fast_ms", "full_ms", "total_ms")
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._samples = {stage: deque(maxlen=window) for stage in self.STAGES}
+        self.requests = 0
+        self.attempted = 0
+        self.hits = 0
+
+    def record(self, info: Dict[str, Any]) -> None:
+        total = sum(info.get(stage) or 0.0 for stage in ("decode_ms", "fast_ms", "full_ms"))
+        with self._lock:
+            self.requests += 1
+            self.attempted += bool(info.get("fast_attempted"))
+            self.hits += info.get("stage") == "fast"
+            for stage in self.STAGES:
+                value = total if stage == "total_ms" else info.get(stage)
+                if value is not None:
+                    self._samples[stage].append(value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latency = {stage: percentiles(self._samples[stage]) for stage in self.STAGES}
+            return {
+                "requests": self.requests,
+                "fast_attempted": self.attempted,
+                "fast_hits": self.hits,
+                "fallbacks": self.attempted - self.hits,
+                "skipped": self.requests - self.attempted,
+                "hit_rate": round(self.hits / self.requests, 4) if self.requests else None,
+                "latency_ms": latency,
+            }
+
@@ -0,0 +1,263 @@
+import math
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Process-wide counters and latency histograms, rendered for Prometheus by
+# /api/metrics. Recording is a bisect and a few increments under a lock per
+# series (about a microsecond), cheap enough to stay on in production.
+# Numbers the components already keep (cache hits, hub drops, queue depths)
+# are not counted twice: collectors read their stats() at scrape time.
+
+# Upper bounds in seconds, from a parse (tens of microseconds) to a slow Whisper run.
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+# (name, type, help, [(labels, value)]) produced by a collector at scrape time
+Family = Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]
+
+
+def percentiles(samples: Iterable[float], scale: float = 1.0, digits: int = 1) -> Dict[str, Any]:
+    """Nearest-rank p50/p95/p99 and max of samples (times scale), as every stats() reports them."""
+    ordered = sorted(samples)
+    n = len(ordered)
+    if not n:
+        return {"n": 0, "p50": None, "p95": None, "p99": None, "max": None}
+
+    def pick(q: float) -> float:
+        return round(ordered[max(0, math.ceil(q * n) - 1)] * scale, digits)
+
+    return {"n": n, "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": pick(1.0)}
+
+
+class Histogram:
+    """Cumulative bucket counts for Prometheus plus the last `window` values for exact recent percentiles."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS, window: int = 1024):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._recent: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+            self._recent.append(value)
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+    def percentiles(self) -> Dict[str, Any]:
+        """All-time count and mean plus percentiles of the recent window, in milliseconds."""
+        with self._lock:
+            recent = list(self._recent)
+            count, total = self._count, self._sum
+        return {
+            "count": count,
+            "mean_ms": round(total / count * 1000, 3) if count else None,
+            **percentiles(recent, scale=1000, digits=3),
+        }
+
+
+class Metrics:
+    def __init__(self, prefix: str = "smart_home"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        key = (name, _labels(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, name: str, **labels: Any) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def stage(self, stage: str):
+        """Time one step of request handling: `with METRICS.stage("parse"): ...`."""
+        return self.time("stage_seconds", stage=stage)
+
+    def collector(self, fn: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4."""
+        lines: List[str] = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+
+        def header(name: str, kind: str) -> None:
+            help_text = self._help.get(name, (kind, ""))[1]
+            lines.append(f"# HELP {self.prefix}_{name} {help_text}".rstrip())
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        last = None
+        for (name, labels), value in counters:
+            if name != last:
+                header(name, "counter")
+                last = name
+            lines.append(f"{self.prefix}_{name}{_format_labels(labels)} {_number(value)}")
+        last = None
+        for (name, labels), histogram in histograms:
+            if name != last:
+                header(name, "histogram")
+                last = name
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, n in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.prefix}_{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.prefix}_{name}_sum{_format_labels(labels)} {_number(total)}")
+            lines.append(f"{self.prefix}_{name}_count{_format_labels(labels)} {count}")
+        for collect in self._collectors:
+            try:
+                families = list(collect())
+            except Exception:
+                # a component failing its stats() must not break the whole scrape
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {self.prefix}_{name} {help_text}".rstrip())
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{self.prefix}_{name}{_format_labels(_labels(labels))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """The same numbers as JSON, with recent p50/p95/p99 per histogram series."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+        out: Dict[str, Any] = {"counters": {}, "histograms": {}}
+        for (name, labels), value in counters:
+            out["counters"].setdefault(name, {})[_label_key(labels)] = value
+        for (name, labels), histogram in histograms:
+            out["histograms"].setdefault(name, {})[_label_key(labels)] = histogram.percentiles()
+        return out
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _label_key(labels: Labels) -> str:
+    return ",".join(f"{k}={v}" for k, v in labels) or "total"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+METRICS = Metrics()
+for _name, _kind, _help in (
+    ("stage_seconds", "histogram", "Time spent in one step of handling a request."),
+    ("http_request_seconds", "histogram", "Time to produce an HTTP response, by endpoint."),
+    ("http_responses_total", "counter", "HTTP responses by endpoint and status code."),
+    ("recognitions_total", "counter", "Speech recognitions by the stage that answered (cache, fast, full)."),
+    ("errors_total", "counter", "Errors by kind."),
+    ("commands_total", "counter", "Executed commands by action."),
+):
+    METRICS.describe(_name, _kind, _help)
+
+
+class SamplingProfiler:
+    """Statistical profiler: samples the Python stack of every other thread every `interval` seconds.
+
+    Costs nothing unless it runs. The result maps folded stacks
+    ("module:function;module:function") to sample counts, the input of the
+    usual flame graph tools.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def run(self, seconds: float, interval: Optional[float] = None) -> Dict[str, int]:
+        """Sample for `seconds`; one run at a time."""
+        interval = interval or self.interval
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("профилировщик уже запущен")
+        try:
+            me = threading.get_ident()
+            stacks: Dict[str, int] = {}
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    names = []
+                    while frame is not None:
+                        code = frame.f_code
+                        names.append(f"{_module_of(code.co_filename)}:{code.co_name}")
+                        frame = frame.f_back
+                    key = ";".join(reversed(names))
+                    stacks[key] = stacks.get(key, 0) + 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            self._lock.release()
+
+
+def top_functions(stacks: Dict[str, int], limit: int = 30) -> List[Dict[str, Any]]:
+    """Functions by samples on top of the stack (self) and anywhere in it (total)."""
+    own: Dict[str, int] = {}
+    total: Dict[str, int] = {}
+    for stack, n in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] = own.get(frames[-1], 0) + n
+        for name in set(frames):
+            total[name] = total.get(name, 0) + n
+    ranked = sorted(total, key=lambda name: (own.get(name, 0), total[name]), reverse=True)[:limit]
+    return [{"function": name, "self": own.get(name, 0), "total": total[name]} for name in ranked]
+
+
+def _module_of(path: str) -> str:
+    parts = path.replace("\\", "/").rsplit("/", 2)
+    return "/".join(parts[-2:])
@@ -1,55 +1,188 @@
+import datetime
+import glob
+import os
+import re
+import tempfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
 import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+import numpy as np
+import sklearn
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.pipeline import Pipeline
-import os
+
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_DIR = os.getenv("CLASSIFIER_DIR", os.path.join(MODELS_DIR, "artifacts"))
+TRAINING_DATA = os.path.join(MODELS_DIR, "data", "commands_ru.tsv")
+
+ARTIFACT_FORMAT = 1
+_ARTIFACT_RE = re.compile(r"command_model-v(\d+)\.joblib$")
+
+
+class ArtifactError(Exception):
+    pass
+
+
+def load_training_data(path: str = TRAINING_DATA) -> Tuple[List[str], List[str]]:
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        next(f, None)  # header
+        for line in f:
+            text, _, label = line.rstrip("\n").partition("\t")
+            if text and label:
+                texts.append(text)
+                labels.append(label)
+    return texts, labels
+
+
+def online_pipeline(n_features: int = 2 ** 18) -> Pipeline:
+    """Hashing features + SGD logistic regression: trainable chunk by chunk with partial_fit.
+
+    The vectorizer is stateless (no vocabulary to refit or pickle), and the
+    model is plain numpy arrays, which load memory-mapped from the artifact.
+    """
+    return Pipeline([
+        ("hashing", HashingVectorizer(
+            analyzer="char_wb", ngram_range=(2, 4), n_features=n_features, alternate_sign=False, lowercase=True,
+        )),
+        ("clf", SGDClassifier(loss="log_loss", alpha=1e-5, random_state=42)),
+    ])
+
 
 class CommandClassifier:
-    def __init__(self, model_path='models/command_model.pkl'):
-        self.model_path = model_path
-        self.pipeline = None
-        self.load_or_train()
-
-    def load_or_train(self):
-        if os.path.exists(self.model_path):
-            self.pipeline = joblib.load(self.model_path)
-        else:
-            self.train_model()
-
-    def train_model(self):
-
-        commands = [
-            "включи свет",
-            "выключи свет",
-            "включи отопление",
-            "выключи отопление",
-            "установи температуру 25",
-            "повысь температуру",
-            "понизь температуру",
-            "статус устройств"
-        ]
-        labels = [
-            "turn_on_light",
-            "turn_off_light",
-            "turn_on_heating",
-            "turn_off_heating",
-            "set_temperature",
-            "increase_temperature",
-            "decrease_temperature",
-            "get_status"
-        ]
+    """Whole-utterance intent classifier over a (vectorizer, classifier) sklearn Pipeline.
+
+    Either char n-gram TF-IDF + logistic regression (train()) or hashing + SGD
+    (online_pipeline(), trained incrementally by backend/models/online_trainer.py).
+    Instances are never modified once serving; a new model is a new instance
+    with a higher version, written as its own artifact file.
+    """
 
-        self.pipeline = Pipeline([
-            ('tfidf', TfidfVectorizer()),
-            ('clf', LogisticRegression(random_state=42))
+    def __init__(self, pipeline: Pipeline, version: int = 0, meta: Optional[Dict[str, Any]] = None):
+        self.pipeline = pipeline
+        self.version = version
+        self.meta = meta or {}
+        self._vectorizer = pipeline.steps[0][1]
+        self._clf = pipeline.steps[-1][1]
+        self.classes = [str(c) for c in self._clf.classes_]
+        if hasattr(self._clf, "coef_") and not self._clf.coef_.flags["F_CONTIGUOUS"]:
+            # Prediction multiplies by coef_.T; stored column-major that is a
+            # C-contiguous view, so scipy never copies the weights per call.
+            # Saved artifacts keep this layout and load mapped as-is.
+            self._clf.coef_ = np.asfortranarray(self._clf.coef_)
+
+    @property
+    def online(self) -> bool:
+        return self.pipeline.steps[0][0] == "hashing"
+
+    @classmethod
+    def train(cls, texts: Sequence[str], labels: Sequence[str], version: int = 1) -> "CommandClassifier":
+        pipeline = Pipeline([
+            # Character n-grams inside word boundaries absorb Russian inflection
+            # ("кухне"/"кухню", "включи"/"включить") without a stemmer.
+            ("tfidf", TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), sublinear_tf=True, lowercase=True)),
+            ("clf", LogisticRegression(C=10.0, max_iter=1000, random_state=42)),
         ])
+        pipeline.fit(list(texts), list(labels))
+        meta = {
+            "trained_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "samples": len(texts),
+        }
+        return cls(pipeline, version=version, meta=meta)
+
+    def save(self, directory: str = ARTIFACT_DIR) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"command_model-v{self.version:04d}.joblib")
+
+        artifact = {
+            "format": ARTIFACT_FORMAT,
+            "version": self.version,
+            "sklearn": sklearn.__version__,
+            "classes": self.classes,
+            "meta": self.meta,
+            "pipeline": self.pipeline,
+        }
+        # Written next to the target and renamed, so a reader never sees half a file.
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            joblib.dump(artifact, tmp)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return path
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "CommandClassifier":
+        # mmap_mode maps the weight arrays read-only instead of copying them:
+        # loading a new version is cheap and processes share the pages.
+        try:
+            artifact = joblib.load(path, mmap_mode="r" if mmap else None)
+        except Exception as e:
+            raise ArtifactError(f"{path}: {e}")
+        if not isinstance(artifact, dict) or artifact.get("format") != ARTIFACT_FORMAT:
+            raise ArtifactError(f"{path}: unknown artifact format")
+        # Pickled estimators are only guaranteed to work with the sklearn that wrote them.
+        if artifact["sklearn"] != sklearn.__version__:
+            raise ArtifactError(f"{path}: built with scikit-learn {artifact['sklearn']}, running {sklearn.__version__}")
+        return cls(artifact["pipeline"], version=artifact["version"], meta=artifact.get("meta"))
+
+    def predict(self, text: str) -> str:
+        return self.predict_batch([text], k=1)[0][0][0]
+
+    def predict_batch(self, texts: Sequence[str], k: int = 3) -> List[List[Tuple[str, float]]]:
+        """Top-k (label, probability) per text, best first; all texts in one sparse transform."""
+        if not texts:
+            return []
+        probs = self._clf.predict_proba(self._vectorizer.transform(texts))
+        k = min(k, probs.shape[1])
+        top = np.argsort(-probs, axis=1)[:, :k]
+        return [
+            [(self.classes[j], float(row[j])) for j in order]
+            for row, order in zip(probs, top)
+        ]
+
+
+def artifact_versions(directory: str = ARTIFACT_DIR) -> List[Tuple[int, str]]:
+    found = []
+    for path in glob.glob(os.path.join(directory, "command_model-v*.joblib")):
+        m = _ARTIFACT_RE.search(os.path.basename(path))
+        if m:
+            found.append((int(m.group(1)), path))
+    return sorted(found)
+
+
+def load_latest(directory: str = ARTIFACT_DIR) -> Optional[CommandClassifier]:
+    """Newest artifact that loads in this environment, or None."""
+    for _version, path in reversed(artifact_versions(directory)):
+        try:
+            return CommandClassifier.load(path)
+        except ArtifactError:
+            continue
+    return None
+
+
+def prune(directory: str = ARTIFACT_DIR, keep: int = 5) -> None:
+    for _version, path in artifact_versions(directory)[:-keep]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def train_and_save(data_path: str = TRAINING_DATA, directory: str = ARTIFACT_DIR) -> CommandClassifier:
+    texts, labels = load_training_data(data_path)
+    versions = artifact_versions(directory)
+    model = CommandClassifier.train(texts, labels, version=(versions[-1][0] + 1) if versions else 1)
+    model.save(directory)
+    return model
 
-        self.pipeline.fit(commands, labels)
 
-        os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-        joblib.dump(self.pipeline, self.model_path)
+if __name__ == "__main__":
+    import sys
 
-    def predict(self, text):
-        if self.pipeline:
-            return self.pipeline.predict([text])[0]
-        return None
+    model = train_and_save(sys.argv[1] if len(sys.argv) > 1 else TRAINING_DATA)
+    print(f"command_model v{model.version}: {model.meta['samples']} samples, classes: {', '.join(model.classes)}")
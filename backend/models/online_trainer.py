@@ -0,0 +1,216 @@
+import copy
+import datetime
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend import db
+from backend.models.command_classifier import (
+    ARTIFACT_DIR, CommandClassifier, artifact_versions, load_training_data, online_pipeline, prune,
+)
+
+# Background retraining from the command log. The trainer owns a private
+# hashing + SGD pipeline and feeds it new labeled rows with partial_fit (mixed
+# with the bundled seed set so it does not drift onto the most frequent
+# commands). Each round that saw enough new rows becomes a new artifact
+# version; it is loaded memory-mapped and swapped into the engine with one
+# reference assignment, so requests never wait for training or loading.
+# Every `holdout_every`-th logged row is kept out of training and used to
+# compare the candidate with the serving model before the swap.
+
+
+class OnlineTrainer:
+    def __init__(
+        self,
+        engine,
+        directory: str = ARTIFACT_DIR,
+        interval: float = 300.0,
+        min_new: int = 20,
+        chunk: int = 1000,
+        holdout_every: int = 10,
+        max_drop: float = 0.02,
+        keep: int = 5,
+        seed_epochs: int = 10,
+    ):
+        self.engine = engine
+        self.directory = directory
+        self.interval = interval
+        self.min_new = max(1, min_new)
+        self.chunk = chunk
+        self.holdout_every = max(2, holdout_every)
+        self.max_drop = max_drop
+        self.keep = keep
+        self.seed_epochs = seed_epochs
+        self.history: deque = deque(maxlen=50)
+        self.error: Optional[str] = None
+        self._pipeline = None
+        self._classes: List[str] = []
+        self._cursor = 0
+        self._trained = 0
+        self._pending: List[Tuple[str, str]] = []
+        self._holdout: deque = deque(maxlen=2000)
+        self._seed = load_training_data()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="intent-trainer", daemon=True).start()
+
+    def _run(self) -> None:
+        try:
+            self._init()
+        except Exception as e:
+            self.error = f"не удалось подготовить обучение классификатора: {e}"
+            return
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.step()
+                self.error = None
+            except Exception as e:
+                self.error = str(e)
+
+    # training state
+
+    def _init(self) -> None:
+        current = self.engine.classifier
+        if current is not None and current.online:
+            # Resume: continue from the serving weights and the log position they saw.
+            self._pipeline = copy.deepcopy(current.pipeline)
+            clf = self._pipeline.steps[-1][1]
+            clf.coef_ = np.ascontiguousarray(clf.coef_)  # off the read-only memory map
+            clf.intercept_ = np.array(clf.intercept_)
+            self._classes = list(current.classes)
+            self._cursor = current.meta.get("log_cursor", 0)
+            self._trained = current.meta.get("samples", 0)
+            self._load_holdout(self._cursor)
+            return
+        texts, labels = self._seed
+        self._classes = sorted(set(labels))
+        self._pipeline = online_pipeline()
+        for _ in range(self.seed_epochs):
+            self._fit(list(zip(texts, labels)))
+        self._trained = len(texts)
+        self._publish()
+
+    def _load_holdout(self, upto: int) -> None:
+        after = 0
+        while after < upto:
+            rows = db.labeled_commands(after, self.chunk)
+            if not rows:
+                break
+            for row_id, text, label in rows:
+                if row_id <= upto and row_id % self.holdout_every == 0 and label in self._classes:
+                    self._holdout.append((text, label))
+            after = rows[-1][0]
+
+    def _fit(self, rows: Sequence[Tuple[str, str]]) -> None:
+        rows = list(rows)
+        random.shuffle(rows)
+        vectorizer, clf = self._pipeline.steps[0][1], self._pipeline.steps[-1][1]
+        X = vectorizer.transform([text for text, _label in rows])
+        clf.partial_fit(X, [label for _text, label in rows], classes=self._classes)
+
+    def _read_log(self) -> int:
+        read = 0
+        while True:
+            rows = db.labeled_commands(self._cursor, self.chunk)
+            for row_id, text, label in rows:
+                if label not in self._classes:
+                    continue
+                if row_id % self.holdout_every == 0:
+                    self._holdout.append((text, label))
+                else:
+                    self._pending.append((text, label))
+                    read += 1
+            if rows:
+                self._cursor = rows[-1][0]
+            if len(rows) < self.chunk:
+                return read
+
+    def step(self) -> Optional[Dict[str, Any]]:
+        """One round: read new labeled rows, train on them if there are enough, maybe publish."""
+        with self._lock:
+            if self._pipeline is None:
+                return None
+            self._read_log()
+            if len(self._pending) < self.min_new:
+                return None
+            rows, self._pending = self._pending, []
+            texts, labels = self._seed
+            self._fit(rows + list(zip(texts, labels)))
+            self._trained += len(rows)
+            return self._publish()
+
+    # publishing
+
+    def _publish(self) -> Dict[str, Any]:
+        versions = artifact_versions(self.directory)
+        version = max(versions[-1][0] if versions else 0, self.engine.version) + 1
+        candidate = CommandClassifier(copy.deepcopy(self._pipeline), version=version, meta={
+            "trained_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "samples": self._trained,
+            "log_cursor": self._cursor,
+        })
+        eval_set = list(self._holdout) or list(zip(*self._seed))
+        record: Dict[str, Any] = {
+            "version": version,
+            "trained_at": candidate.meta["trained_at"],
+            "samples": self._trained,
+            "log_cursor": self._cursor,
+            "eval_set": "holdout" if self._holdout else "seed",
+            "eval_size": len(eval_set),
+            "accuracy": _accuracy(candidate, eval_set),
+            "latency_us": _latency(candidate, [text for text, _label in eval_set[:64]]),
+        }
+        current = self.engine.classifier
+        if current is not None:
+            record["serving_version"] = current.version
+            record["serving_accuracy"] = _accuracy(current, eval_set)
+        record["installed"] = current is None or (
+            record["accuracy"] >= record["serving_accuracy"] - self.max_drop
+        )
+        if record["installed"]:
+            candidate.meta.update(accuracy=record["accuracy"], latency_us=record["latency_us"])
+            path = candidate.save(self.directory)
+            self.engine.install(CommandClassifier.load(path))
+            prune(self.directory, self.keep)
+        self.history.append(record)
+        return record
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "error": self.error,
+            "interval": self.interval,
+            "log_cursor": self._cursor,
+            "pending": len(self._pending),
+            "holdout": len(self._holdout),
+            "trained_samples": self._trained,
+            "versions": list(self.history),
+        }
+
+
+def _accuracy(model: CommandClassifier, rows: Sequence[Tuple[str, str]]) -> Optional[float]:
+    if not rows:
+        return None
+    predicted = model.predict_batch([text for text, _label in rows], k=1)
+    hits = sum(top[0][0] == label for top, (_text, label) in zip(predicted, rows))
+    return round(hits / len(rows), 4)
+
+
+def _latency(model: CommandClassifier, texts: Sequence[str], repeat: int = 20) -> Dict[str, Any]:
+    if not texts:
+        return {}
+    single = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        model.predict_batch([texts[i % len(texts)]])
+        single.append((time.perf_counter() - t0) * 1e6)
+    t0 = time.perf_counter()
+    model.predict_batch(list(texts))
+    batch = (time.perf_counter() - t0) * 1e6 / len(texts)
+    single.sort()
+    return {"single_p50": round(single[len(single) // 2], 1), "batch_per_item": round(batch, 1), "batch": len(texts)}
@@ -0,0 +1,85 @@
+import re
+from typing import Any, Dict, Iterable, List, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+class PhraseAutomaton:
+    """Aho-Corasick automaton over word tokens.
+
+    Patterns are phrases of one or more whole words, so matches always fall on
+    word boundaries ("комнате" never fires inside another word). One scan over
+    the tokens finds every occurrence of every phrase; `find` then keeps the
+    leftmost-longest, non-overlapping ones.
+    """
+
+    def __init__(self, phrases: Iterable[Tuple[str, Any]] = ()):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        for phrase, value in phrases:
+            self._add(tokenize(phrase), value)
+        self._build()
+
+    def _add(self, words: List[str], value: Any) -> None:
+        if not words:
+            return
+        state = 0
+        for word in words:
+            nxt = self._goto[state].get(word)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][word] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state] = [(len(words), value)]
+
+    def _build(self) -> None:
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for word, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and word not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(word, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Inherit matches that end here via the failure link (shorter suffixes).
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, words: List[str]) -> List[Tuple[int, int, Any]]:
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        matches = []
+        state = 0
+        for i, word in enumerate(words):
+            if not state:
+                # Fast path: most words of a command start no phrase at all.
+                state = root.get(word, 0)
+            else:
+                while state and word not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(word, 0)
+            if out[state]:
+                for length, value in out[state]:
+                    matches.append((i + 1 - length, i + 1, value))
+        return matches
+
+    def find(self, text: str) -> List[Tuple[int, int, Any]]:
+        matches = self.iter_matches(tokenize(text))
+        if len(matches) < 2:
+            return matches
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+        result = []
+        end = 0
+        for start, stop, value in matches:
+            if start >= end:
+                result.append((start, stop, value))
+                end = stop
+        return result
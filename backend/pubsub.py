@@ -0,0 +1,164 @@
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+POLICIES = ("drop_oldest", "coalesce", "evict")
+
+# Returned by Subscription.get() under the "coalesce" policy after the queue
+# overflowed: the consumer should send a fresh snapshot instead of the backlog.
+RESYNC = object()
+
+
+class SubscriptionClosed(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, hub: "Hub", maxsize: int, policy: str):
+        self._hub = hub
+        self._maxsize = maxsize
+        self._policy = policy
+        self._items: deque = deque()
+        self._cond = threading.Condition()
+        self._resync = False
+        self.closed = False
+        self.dropped = 0
+        # Called (outside the lock) whenever something is queued or the
+        # subscription closes; lets non-thread consumers (asyncio) wait without
+        # blocking a thread in get().
+        self.wakeup: Optional[Callable[[], None]] = None
+
+    def _offer(self, item: Any) -> int:
+        """Queue item, applying the slow-consumer policy; return messages dropped."""
+        dropped = 0
+        with self._cond:
+            if self.closed:
+                return 0
+            if len(self._items) >= self._maxsize:
+                if self._policy == "drop_oldest":
+                    self._items.popleft()
+                    dropped = 1
+                elif self._policy == "coalesce":
+                    dropped = len(self._items) + 1
+                    self._items.clear()
+                    self._resync = True
+                    item = None
+                else:
+                    dropped = len(self._items) + 1
+                    self._items.clear()
+                    self.closed = True
+                    item = None
+            if item is not None:
+                self._items.append(item)
+            self.dropped += dropped
+            self._cond.notify()
+        if self.wakeup:
+            self.wakeup()
+        return dropped
+
+    def get_nowait(self) -> Any:
+        """Next item, RESYNC, or None if nothing is queued; raises once closed."""
+        with self._cond:
+            return self._take()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Next item, RESYNC, or None on timeout (time for a heartbeat)."""
+        with self._cond:
+            if not self._items and not self._resync and not self.closed:
+                self._cond.wait(timeout)
+            return self._take()
+
+    def _take(self) -> Any:
+        if self._resync:
+            self._resync = False
+            return RESYNC
+        if self._items:
+            return self._items.popleft()
+        if self.closed:
+            raise SubscriptionClosed()
+        return None
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        if self.wakeup:
+            self.wakeup()
+        self._hub.unsubscribe(self)
+
+
+class Hub:
+    """Thread-safe fan-out of pre-serialized frames to many stream consumers.
+
+    Each subscriber has a bounded queue. When a consumer falls behind, the
+    policy decides: "drop_oldest" discards the oldest queued frame,
+    "coalesce" discards the backlog and asks the consumer to resync from a
+    snapshot, "evict" closes the subscription (the client reconnects and
+    resumes from Last-Event-ID).
+    """
+
+    def __init__(self, maxsize: int = 64, policy: str = "coalesce"):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown slow-consumer policy {policy!r}, expected one of {POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscription] = []
+        self.published = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.total_subscribed = 0
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(self, self.maxsize, self.policy)
+        with self._lock:
+            self._subscribers.append(sub)
+            self.total_subscribed += 1
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            try:
+                self._subscribers.remove(sub)
+            except ValueError:
+                pass
+
+    def publish(self, item: Any) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        evicted = []
+        dropped = 0
+        for sub in subscribers:
+            lost = sub._offer(item)
+            dropped += lost
+            if lost and self.policy == "evict":
+                evicted.append(sub)
+        if dropped or evicted:
+            with self._lock:
+                self.dropped += dropped
+                self.evicted += len(evicted)
+                for sub in evicted:
+                    if sub in self._subscribers:
+                        self._subscribers.remove(sub)
+
+    def close_all(self) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.close()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "total_subscribed": self.total_subscribed,
+                "published": self.published,
+                "dropped": self.dropped,
+                "evicted": self.evicted,
+                "policy": self.policy,
+                "queue_size": self.maxsize,
+            }
@@ -0,0 +1,266 @@
+import json
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.speech_recognizer import RecognitionError, RecognitionTimeout, RecognizerBusy
+
+# Whisper in separate processes. Each worker is a plain `python -m` child with
+# its own warm WhisperModel, so decode and inference neither hold the server's
+# GIL nor share a model. Children are started as fresh interpreters (not
+# multiprocessing spawn/fork) so they never re-import app.py and its startup
+# side effects. Jobs go through a bounded queue: when it is full new audio is
+# refused right away (RecognizerBusy -> 503) instead of piling up. A job whose
+# worker dies under it is retried once on the replacement worker.
+
+# How long a new child may take to connect back before it is killed and respawned.
+SPAWN_TIMEOUT = 60.0
+
+
+class RecognitionWorkers:
+    def __init__(self, workers: int = 2, max_queue: int = 8):
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self._jobs: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        # pid -> connection of a child that said hello, until its _spawn picks it up
+        self._arrived: Dict[int, Connection] = {}
+        self._expected: set = set()
+        self._arrival = threading.Condition()
+        self._pending = 0
+        self._in_flight = 0
+        self._ready = 0
+        self._completed = 0
+        self._rejected = 0
+        self._expired = 0
+        self._retried = 0
+        self._authkey = secrets.token_bytes(16)
+        self._listener: Optional[Listener] = None
+        self.error: Optional[str] = None
+
+    # parent side
+
+    def start(self) -> None:
+        self._listener = Listener(authkey=self._authkey)
+        threading.Thread(target=self._accept, name="whisper-accept", daemon=True).start()
+        for i in range(self.workers):
+            threading.Thread(target=self._serve, name=f"whisper-worker-{i}", daemon=True).start()
+
+    def _spawn(self) -> Connection:
+        env = dict(os.environ, WHISPER_REPLICAS="1", WHISPER_BACKEND="thread")
+        address = json.dumps(self._listener.address)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "backend.recognition_workers", address, self._authkey.hex()],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env=env,
+        )
+        # Children connect in any order; each is matched to its Popen by the pid it sends.
+        deadline = time.monotonic() + SPAWN_TIMEOUT
+        with self._arrival:
+            self._expected.add(proc.pid)
+            while proc.pid not in self._arrived and proc.poll() is None and time.monotonic() < deadline:
+                self._arrival.wait(0.5)
+            self._expected.discard(proc.pid)
+            conn = self._arrived.pop(proc.pid, None)
+        if conn is None:
+            proc.kill()
+            proc.wait()
+            raise OSError(f"процесс {proc.pid} не подключился (код {proc.returncode})")
+        conn.proc = proc  # type: ignore[attr-defined]
+        return conn
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn = self._listener.accept()
+                # ("hello", pid) comes right after connecting; a silent peer is dropped
+                hello = conn.recv() if conn.poll(10) else None
+            except Exception:
+                # wrong authkey or a connection that went away mid-handshake
+                continue
+            with self._arrival:
+                if isinstance(hello, tuple) and hello[0] == "hello" and hello[1] in self._expected:
+                    self._arrived[hello[1]] = conn
+                    self._arrival.notify_all()
+                    continue
+            conn.close()
+
+    @staticmethod
+    def _retire(conn: Connection) -> None:
+        conn.close()
+        conn.proc.kill()  # type: ignore[attr-defined]
+        conn.proc.wait()  # type: ignore[attr-defined]
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                conn = self._spawn()
+            except OSError as e:
+                self.error = f"не удалось запустить процесс распознавания: {e}"
+                time.sleep(5)
+                continue
+            try:
+                status, error = conn.recv()
+                if status != "ready":
+                    self.error = error
+                    time.sleep(5)
+                    continue
+                with self._lock:
+                    self._ready += 1
+                try:
+                    self._run_jobs(conn)
+                finally:
+                    with self._lock:
+                        self._ready -= 1
+            except (OSError, EOFError) as e:
+                self.error = f"не удалось запустить процесс распознавания: {e}"
+                time.sleep(5)
+            finally:
+                self._retire(conn)
+
+    def _run_jobs(self, conn: Connection) -> None:
+        while True:
+            future, job, deadline, retry = self._jobs.get()
+            try:
+                # a retried job's future is already running
+                if not retry and not future.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and time.time() > deadline:
+                    with self._lock:
+                        self._expired += 1
+                    future.set_exception(RecognitionTimeout("Истекло время ожидания распознавания"))
+                    continue
+                with self._lock:
+                    self._in_flight += 1
+                try:
+                    conn.send((job, deadline))
+                    status, result = conn.recv()
+                except (OSError, EOFError):
+                    if retry:
+                        future.set_exception(RecognitionError("Процесс распознавания завершился аварийно"))
+                    else:
+                        with self._lock:
+                            self._pending += 1
+                            self._retried += 1
+                        self._jobs.put((future, job, deadline, True))
+                    return
+                finally:
+                    with self._lock:
+                        self._in_flight -= 1
+                if status == "ok":
+                    with self._lock:
+                        self._completed += 1
+                    future.set_result(result)
+                elif status == "expired":
+                    with self._lock:
+                        self._expired += 1
+                    future.set_exception(RecognitionTimeout(result))
+                else:
+                    future.set_exception(RecognitionError(result))
+            finally:
+                with self._lock:
+                    self._pending -= 1
+
+    def _submit(self, job: tuple, timeout: Optional[float]) -> Any:
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self._rejected += 1
+                raise RecognizerBusy(self._pending, self.max_queue)
+            self._pending += 1
+        future: Future = Future()
+        deadline = time.time() + timeout if timeout else None
+        self._jobs.put((future, job, deadline, False))
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise RecognitionTimeout("Истекло время ожидания распознавания")
+
+    def recognize(self, data: bytes, language: str = "ru-RU", timeout: Optional[float] = None) -> str:
+        return self._submit(("recognize", data, language), timeout)
+
+    def recognize_command(
+        self, data: bytes, language: str = "ru-RU", timeout: Optional[float] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        return self._submit(("command", data, language), timeout)
+
+    def transcribe_batch(
+        self, clips: List[bytes], language: str = "ru-RU", timeout: Optional[float] = None, **options: Any
+    ) -> List[Dict[str, Any]]:
+        # The whole batch is one job on one worker: it takes one queue slot and
+        # gets the worker's batched pipeline to itself.
+        return self._submit(("batch", clips, language, options), timeout)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready > 0
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "process",
+                "ready": self._ready > 0,
+                "error": self.error,
+                "workers": self.workers,
+                "ready_workers": self._ready,
+                "queue_depth": self._pending,
+                "in_flight": self._in_flight,
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "expired": self._expired,
+                "retried": self._retried,
+            }
+
+
+# child side
+
+def _worker_main(address: Any, authkey: bytes) -> None:
+    from backend.keyword_spotter import recognize_command
+    from backend.speech_recognizer import init_recognizer, recognize_from_bytes, transcribe_batch
+
+    conn = Client(address, authkey=authkey)
+    conn.send(("hello", os.getpid()))
+    pool = init_recognizer(background=False)
+    conn.send(("ready" if pool.ready else "error", pool.error))
+    if not pool.ready:
+        return
+    while True:
+        try:
+            job, deadline = conn.recv()
+        except EOFError:
+            return
+        if deadline is not None and time.time() > deadline:
+            conn.send(("expired", "Истекло время ожидания распознавания"))
+            continue
+        try:
+            if job[0] == "batch":
+                _kind, clips, language, options = job
+                conn.send(("ok", list(transcribe_batch(clips, language, **options))))
+            elif job[0] == "command":
+                _kind, data, language = job
+                # the fast and the full pass share what is left of the request's deadline
+                timeout = deadline - time.time() if deadline is not None else None
+                conn.send(("ok", recognize_command(data, language, timeout)))
+            else:
+                _kind, data, language = job
+                conn.send(("ok", recognize_from_bytes(data, language)))
+        except RecognitionTimeout as e:
+            conn.send(("expired", str(e)))
+        except RecognitionError as e:
+            conn.send(("error", str(e)))
+        except Exception as e:
+            # a bad clip must not take the worker (and, retried, the next one) down
+            conn.send(("error", f"Ошибка распознавания: {e}"))
+
+
+if __name__ == "__main__":
+    address = json.loads(sys.argv[1])
+    _worker_main(tuple(address) if isinstance(address, list) else address, bytes.fromhex(sys.argv[2]))
@@ -0,0 +1,90 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend import db
+
+
+class DeviceRegistry:
+    """In-process copy of one household's rows of the devices table; serves every read.
+
+    Writes go through to SQLite first and are applied here under the same lock,
+    so the registry never shows a state the database doesn't have. Returned
+    dicts are shared with the registry: treat them as read-only.
+    """
+
+    def __init__(self, home: str = db.DEFAULT_HOME):
+        self.home = home
+        self._lock = threading.RLock()
+        self._devices: Dict[int, Dict[str, Any]] = {}
+        self._by_room_type: Dict[Tuple[Optional[str], str], int] = {}
+        self._list: Optional[List[Dict[str, Any]]] = None
+
+    def load(self) -> None:
+        with self._lock:
+            self._devices = {}
+            self._by_room_type = {}
+            for dev in db.list_devices(self.home):
+                self._put(dev)
+
+    def _put(self, dev: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if dev:
+            self._devices[dev["id"]] = dev
+            self._by_room_type.setdefault((dev["room"], dev["type"]), dev["id"])
+            self._list = None
+        return dev
+
+    # reads
+
+    def list(self) -> List[Dict[str, Any]]:
+        devices = self._list
+        if devices is None:
+            with self._lock:
+                devices = self._list = [self._devices[i] for i in sorted(self._devices)]
+        return devices
+
+    def get(self, device_id: int) -> Optional[Dict[str, Any]]:
+        return self._devices.get(device_id)
+
+    def find(self, room: Optional[str], type_: str) -> Optional[Dict[str, Any]]:
+        device_id = self._by_room_type.get((room, type_))
+        return self._devices.get(device_id) if device_id is not None else None
+
+    def lights(self) -> Dict[str, bool]:
+        return {d["room"]: d["is_on"] for d in self.list() if d["type"] == "light" and d["room"]}
+
+    # write-through mutations
+
+    def create(self, name: str, room: Optional[str], type_: str, is_on: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            return self._put(db.create_device(name=name, room=room, type_=type_, is_on=is_on, home=self.home))
+
+    def set_state(self, device_id: int, is_on: bool) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._put(db.update_device_state(device_id, is_on, home=self.home))
+
+    def ensure(self, room: str, type_: str, is_on: Optional[bool] = None) -> Dict[str, Any]:
+        with self._lock:
+            dev = self.find(room, type_)
+            if dev is not None and (is_on is None or dev["is_on"] == is_on):
+                return dev
+            return self._put(db.ensure_device(room, type_, is_on=is_on, home=self.home))
+
+    def ensure_many(self, items: Iterable[Tuple[str, str, Optional[bool]]]) -> List[Dict[str, Any]]:
+        """ensure() for several (room, type, is_on) in one transaction; returns the devices it created or changed."""
+        with self._lock:
+            todo = []
+            for room, type_, is_on in items:
+                dev = self.find(room, type_)
+                if dev is None or (is_on is not None and dev["is_on"] != is_on):
+                    todo.append((room, type_, is_on))
+            if not todo:
+                return []
+            return [self._put(dev) for dev in db.ensure_many(todo, home=self.home)]
+
+    def create_many(self, devices: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._put(dev) for dev in db.create_many(devices, home=self.home)]
+
+    def update_many(self, changes: Iterable[Tuple[int, bool]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._put(dev) for dev in db.update_many(changes, home=self.home)]
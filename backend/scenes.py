@@ -0,0 +1,121 @@
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from backend import command_parser
+from backend.command_parser import ROOM_ACTIONS
+from backend.validation import is_number
+
+# A scene, several commands in one utterance, one command for several rooms -
+# all compile to a flat plan of (action, room, params) steps that the caller
+# applies to a household in one go: one lock acquisition, one SQLite
+# transaction and one broadcast, however many devices it touches.
+
+# Room placeholder in scene steps: every room of the household that has a
+# device for the action (a light for light steps, a thermometer for climate).
+ALL_ROOMS = "*"
+
+
+class Scene(NamedTuple):
+    name: str
+    title: str
+    steps: Tuple[Tuple[str, Dict[str, Any]], ...]  # (action, params), applied in order
+
+
+class Step(NamedTuple):
+    action: str
+    room: str
+    params: Dict[str, Any]
+
+
+SCENES: Dict[str, Scene] = {}
+
+
+def register_scene(scene: Scene, phrases: Iterable[str] = ()) -> None:
+    SCENES[scene.name] = scene
+    if phrases:
+        command_parser.register_scene_phrases(phrases, scene.name)
+
+
+for _scene in (
+    Scene("night", "Спокойной ночи", (
+        ("turn_off_light", {"room": ALL_ROOMS}),
+        ("set_temperature", {"room": ALL_ROOMS, "value": 20}),
+    )),
+    Scene("morning", "Доброе утро", (
+        ("turn_on_light", {"room": "кухня"}),
+        ("turn_on_light", {"room": "ванная"}),
+        ("set_temperature", {"room": ALL_ROOMS, "value": 22}),
+    )),
+    Scene("away", "Никого нет дома", (
+        ("turn_off_light", {"room": ALL_ROOMS}),
+        ("set_temperature", {"room": ALL_ROOMS, "value": 18}),
+    )),
+    Scene("home", "Я дома", (
+        ("turn_on_light", {"room": "зал"}),
+        ("set_temperature", {"room": ALL_ROOMS, "value": 22}),
+    )),
+):
+    register_scene(_scene)
+
+# Steps that need a value besides the room.
+_NEEDS_VALUE = {"set_temperature", "set_humidity"}
+
+
+def compile_plan(parsed: Dict[str, Any], rooms_for: Callable[[str], List[str]]) -> List[Step]:
+    """Flatten a parsed command into the steps that change state, in order.
+
+    rooms_for(action) lists the household's rooms an ALL_ROOMS step covers.
+    Actions that change no device state (timers, volume, ...) and unknown
+    scenes yield no steps.
+    """
+    plan: List[Step] = []
+    _compile(parsed.get("action"), parsed.get("params") or {}, rooms_for, plan, depth=0)
+    return plan
+
+
+def _compile(action: Optional[str], params: Dict[str, Any], rooms_for, plan: List[Step], depth: int) -> None:
+    if depth > 4:
+        # a scene running a scene running a scene ... - stop rather than recurse forever
+        return
+    if action == "multiple":
+        for command in params.get("actions") or []:
+            if isinstance(command, dict):
+                _compile(command.get("action"), command.get("params") or {}, rooms_for, plan, depth + 1)
+        return
+    if action == "run_scene":
+        scene = SCENES.get(params.get("scene"))
+        for step_action, step_params in scene.steps if scene else ():
+            _compile(step_action, step_params, rooms_for, plan, depth + 1)
+        return
+    if action not in ROOM_ACTIONS or (action in _NEEDS_VALUE and not is_number(params.get("value"))):
+        return
+    rooms = params.get("rooms")
+    for room in rooms if isinstance(rooms, list) and rooms else [params.get("room")]:
+        if room == ALL_ROOMS:
+            plan.extend(Step(action, r, params) for r in rooms_for(action))
+        elif room and isinstance(room, str):
+            plan.append(Step(action, room, params))
+
+
+def invalid_commands(parsed: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Commands (of a "multiple" too) that compile_plan would skip for want of a numeric value."""
+    if parsed.get("action") == "multiple":
+        commands = (parsed.get("params") or {}).get("actions") or []
+        return [bad for command in commands if isinstance(command, dict) for bad in invalid_commands(command)]
+    if parsed.get("action") in _NEEDS_VALUE and not is_number((parsed.get("params") or {}).get("value")):
+        return [parsed]
+    return []
+
+
+def scene_list() -> List[Dict[str, Any]]:
+    phrases: Dict[str, List[str]] = {}
+    for phrase, name in command_parser.SCENE_PHRASES.items():
+        phrases.setdefault(name, []).append(phrase)
+    return [
+        {
+            "name": scene.name,
+            "title": scene.title,
+            "phrases": phrases.get(scene.name, []),
+            "steps": [{"action": action, "params": params} for action, params in scene.steps],
+        }
+        for scene in SCENES.values()
+    ]
@@ -0,0 +1,305 @@
+import heapq
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from backend import db
+from backend.metrics import percentiles
+
+# Timers ("поставь таймер на 5 минут") and recurring schedules ("0 23 * * *:
+# спокойной ночи") of every household share one min-heap of (due, job id).
+# A single dispatcher thread sleeps on a Condition until the earliest due time;
+# adding a job that is due sooner wakes it, nothing polls. Cancelling only
+# forgets the job - its heap entry is skipped when it comes up - so adding and
+# cancelling stay O(log n) with tens of thousands of pending jobs.
+#
+# Jobs are rows of the SQLite jobs table, so they survive a restart: one-shot
+# timers that came due while the server was down fire as soon as it is back,
+# recurring ones resume from their next time. All jobs due in one round are
+# handed to `fire` together and written back in one transaction.
+
+# How far ahead a job may be due (also how far Cron looks for a next match).
+MAX_AHEAD = 366 * 24 * 3600 * 5
+# The dispatcher never sleeps longer than this in one wait: huge timeouts overflow.
+_MAX_WAIT = 3600.0
+
+
+def valid_due(due: float, now: float) -> bool:
+    return math.isfinite(due) and 0 <= due <= now + MAX_AHEAD
+
+
+class Cron:
+    """Five-field cron expression, local time: minute hour day-of-month month day-of-week.
+
+    Fields take *, numbers, ranges (1-5), lists (1,15) and steps (*/10, 8-18/2);
+    day-of-week is 0-6 from Sunday (7 is Sunday too).
+    """
+
+    _RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"в расписании {expr!r} должно быть 5 полей: минута час день месяц день_недели")
+        self.expr = " ".join(parts)
+        fields = [self._field(part, lo, hi) for part, (lo, hi) in zip(parts, self._RANGES)]
+        self.minutes, self.hours, self.days, self.months = fields[:4]
+        self.weekdays = frozenset(d % 7 for d in fields[4])
+        # As in cron: with both day fields restricted, a day matching either one counts.
+        self._any_day, self._any_weekday = parts[2] == "*", parts[4] == "*"
+
+    @staticmethod
+    def _field(text: str, lo: int, hi: int) -> FrozenSet[int]:
+        values = set()
+        for item in text.split(","):
+            span, _, step = item.partition("/")
+            try:
+                step_n = int(step) if step else 1
+                if span == "*":
+                    first, last = lo, hi
+                elif "-" in span:
+                    first, last = (int(x) for x in span.split("-", 1))
+                else:
+                    first = int(span)
+                    last = hi if step else first
+            except ValueError:
+                raise ValueError(f"не понимаю поле расписания {text!r}") from None
+            if not (lo <= first <= last <= hi) or step_n < 1:
+                raise ValueError(f"поле расписания {text!r} вне диапазона {lo}-{hi}")
+            values.update(range(first, last + 1, step_n))
+        return frozenset(values)
+
+    def _day_matches(self, t: datetime) -> bool:
+        day = t.day in self.days
+        weekday = (t.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, ts: float) -> float:
+        """The first matching minute strictly after ts (unix time)."""
+        t = datetime.fromtimestamp(ts).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(seconds=MAX_AHEAD)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t.timestamp()
+        raise ValueError(f"расписание {self.expr!r} никогда не срабатывает")
+
+
+class Scheduler:
+    def __init__(self, fire: Callable[[List[Dict[str, Any]]], None], max_batch: int = 1000, lag_window: int = 1000):
+        # Called on the dispatcher thread with the jobs (db.jobs rows) due in one round.
+        self.fire = fire
+        self.max_batch = max_batch
+        self._heap: List[Tuple[float, int]] = []
+        self._jobs: Dict[int, Dict[str, Any]] = {}
+        self._by_home: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._crons: Dict[str, Cron] = {}
+        self._cond = threading.Condition()
+        self._late_ms: deque = deque(maxlen=lag_window)
+        self.fired = 0
+        self.rounds = 0
+        self.error: Optional[str] = None
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="scheduler", daemon=True).start()
+
+    def load(self, owns: Callable[[str], bool] = lambda home: True) -> int:
+        """Queue the persisted jobs of the households owns() accepts; return how many."""
+        now = time.time()
+        loaded = 0
+        broken = []
+        with self._cond:
+            for job in db.pending_jobs():
+                if job["id"] in self._jobs or not owns(job["home"]):
+                    continue
+                try:
+                    if job["cron"] and job["due"] < now:
+                        # Missed runs of a schedule are skipped, not replayed.
+                        job["due"] = self._cron(job["cron"]).next_after(now)
+                    elif not job["cron"] and not math.isfinite(job["due"]):
+                        raise ValueError(f"недопустимое время срабатывания {job['due']}")
+                except ValueError as e:
+                    # saved before it was validated: drop it rather than stall the dispatcher
+                    self.error = f"задание {job['id']} удалено: {e}"
+                    broken.append(job["id"])
+                    continue
+                self._push(job)
+                loaded += 1
+        for job_id in broken:
+            db.delete_job(job_id)
+        return loaded
+
+    def _cron(self, expr: str) -> Cron:
+        cron = self._crons.get(expr)
+        if cron is None:
+            cron = self._crons[expr] = Cron(expr)
+        return cron
+
+    def add(
+        self,
+        home: str,
+        action: Optional[str],
+        params: Dict[str, Any],
+        label: Optional[str] = None,
+        due: Optional[float] = None,
+        cron: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Persist and queue a job: once at `due` (unix time), or on every `cron` match."""
+        if cron is not None:
+            cron = self._cron(cron).expr
+            due = self._cron(cron).next_after(time.time())
+        elif due is None:
+            raise ValueError("нужно время срабатывания или расписание")
+        elif not valid_due(due, time.time()):
+            raise ValueError("время срабатывания должно быть не раньше 1970 года и не позже чем через 5 лет")
+        job = db.create_job(home, due, action, params, label, cron=cron)
+        with self._cond:
+            self._push(job)
+        return job
+
+    def cancel(self, home: str, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job["home"] != home:
+                return None
+            self._forget(job)
+            if len(self._heap) > 2 * len(self._jobs) + 1024:
+                # mostly dead entries: rebuild rather than let them pile up
+                self._heap = [(j["due"], i) for i, j in self._jobs.items()]
+                heapq.heapify(self._heap)
+        db.delete_job(job_id)
+        return job
+
+    def jobs(self, home: str) -> List[Dict[str, Any]]:
+        with self._cond:
+            return sorted(self._by_home.get(home, {}).values(), key=lambda job: job["due"])
+
+    def _push(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = job
+        self._by_home.setdefault(job["home"], {})[job["id"]] = job
+        heapq.heappush(self._heap, (job["due"], job["id"]))
+        if self._heap[0][1] == job["id"]:
+            self._cond.notify()
+
+    def _forget(self, job: Dict[str, Any]) -> None:
+        del self._jobs[job["id"]]
+        home = self._by_home[job["home"]]
+        del home[job["id"]]
+        if not home:
+            del self._by_home[job["home"]]
+
+    def _live_head(self) -> Optional[Tuple[float, int]]:
+        # Drop entries of cancelled or rescheduled jobs sitting on top of the heap.
+        heap = self._heap
+        while heap:
+            due, job_id = heap[0]
+            job = self._jobs.get(job_id)
+            if job is not None and job["due"] == due:
+                return heap[0]
+            heapq.heappop(heap)
+        return None
+
+    def _take_due(self) -> Tuple[List[Dict[str, Any]], List[int], List[Tuple[float, int]]]:
+        """Wait for the next due job; pop everything due by then (under _cond)."""
+        while True:
+            head = self._live_head()
+            if head is None:
+                self._cond.wait()
+                continue
+            delay = head[0] - time.time()
+            if delay <= 0:
+                break
+            self._cond.wait(min(delay, _MAX_WAIT))
+        now = time.time()
+        due: List[Dict[str, Any]] = []
+        done: List[int] = []
+        rescheduled: List[Tuple[float, int]] = []
+        while len(due) < self.max_batch:
+            head = self._live_head()
+            if head is None or head[0] > now:
+                break
+            heapq.heappop(self._heap)
+            job = self._jobs[head[1]]
+            self._late_ms.append((now - job["due"]) * 1000)
+            fired = dict(job)
+            due.append(fired)
+            if job["cron"]:
+                try:
+                    job["due"] = self._cron(job["cron"]).next_after(now)
+                except ValueError:
+                    self._forget(job)
+                    done.append(job["id"])
+                    continue
+                heapq.heappush(self._heap, (job["due"], job["id"]))
+                rescheduled.append((job["due"], job["id"]))
+                fired["next_due"] = job["due"]
+            else:
+                self._forget(job)
+                done.append(job["id"])
+        return due, done, rescheduled
+
+    def _drop_head(self) -> Optional[int]:
+        head = self._live_head()
+        if head is None:
+            return None
+        heapq.heappop(self._heap)
+        self._forget(self._jobs[head[1]])
+        return head[1]
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                try:
+                    due, done, rescheduled = self._take_due()
+                except Exception as e:
+                    # One bad entry must not stop every other timer: drop it and go on.
+                    job_id = self._drop_head()
+                    self.error = f"задание {job_id} удалено: {e}"
+                    due = None
+            if due is None:
+                if job_id is not None:
+                    try:
+                        db.delete_job(job_id)
+                    except Exception as e:
+                        self.error = str(e)
+                continue
+            try:
+                self.fire(due)
+                self.error = None
+            except Exception as e:
+                self.error = str(e)
+            try:
+                db.finish_jobs(done, rescheduled)
+            except Exception as e:
+                self.error = str(e)
+            self.fired += len(due)
+            self.rounds += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            late = list(self._late_ms)
+            pending = len(self._jobs)
+            recurring = sum(1 for job in self._jobs.values() if job["cron"])
+            head = self._live_head()
+
+        return {
+            "pending": pending,
+            "recurring": recurring,
+            "next_due": head[0] if head else None,
+            "fired": self.fired,
+            "rounds": self.rounds,
+            "late_ms": percentiles(late),
+            "error": self.error,
+        }
@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Collection, Dict, Iterable, List, Optional, Tuple
+
+from backend.metrics import percentiles
+from backend.validation import is_number
+
+# Bulk sensor ingestion. A batch of readings is validated and appended to the
+# time series store right away (that is just ring and aggregate updates), but
+# it does not touch the dashboard state: only the latest value per (home,
+# room, metric) is remembered. A flush thread hands whatever changed since its
+# last round to `publish` every `interval` seconds, so a thousand readings per
+# second still become at most 1/interval state deltas and SSE broadcasts.
+
+# Metrics that are part of the dashboard state (the "thermometers" section);
+# anything else is only kept as a time series.
+STATE_METRICS = ("temperature", "humidity")
+# Every metric a reading may carry; a sensor cannot invent new series names.
+METRICS = STATE_METRICS + ("co2", "pressure", "illuminance", "pm25", "noise")
+
+
+class SensorIngest:
+    def __init__(
+        self,
+        telemetry,
+        publish: Callable[[Dict[str, Dict[str, Dict[str, float]]]], None],
+        interval: float = 0.25,
+        room_key: Callable[[str], str] = str,
+        rooms: Optional[Callable[[str], Collection[str]]] = None,
+        metrics: Collection[str] = METRICS,
+        lag_window: int = 1000,
+    ):
+        self.telemetry = telemetry
+        self.publish = publish
+        self.interval = interval
+        self.room_key = room_key
+        # home -> the rooms readings are accepted for (canonical names); None accepts any
+        self.rooms = rooms
+        self.metrics = frozenset(metrics)
+        # home -> room -> metric -> latest value
+        self._dirty: Dict[str, Dict[str, Dict[str, float]]] = {}
+        # When the oldest reading in _dirty arrived; its wait is the broadcast lag.
+        self._dirty_since: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._lag_ms: deque = deque(maxlen=lag_window)
+        self.batches = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.broadcasts = 0
+        self.coalesced = 0
+        self.error: Optional[str] = None
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="sensor-ingest", daemon=True).start()
+
+    def submit(self, home: str, readings: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+        """Validate and store a batch for one household; return (accepted, rejected).
+
+        accepted counts stored values (a reading may carry several), which
+        excludes values of new series the store has no room for.
+        """
+        rows: List[Tuple[str, str, str, float, Optional[float]]] = []
+        rejected = 0
+        known = self.rooms(home) if self.rooms is not None else None
+        for reading in readings:
+            parsed = self._parse(home, reading, known)
+            if parsed is None:
+                rejected += 1
+            else:
+                rows.extend(parsed)
+        accepted = self.telemetry.record_many(rows) if rows else 0
+        now = time.monotonic()
+        with self._lock:
+            rooms = self._dirty.setdefault(home, {}) if rows else None
+            for _home, room, metric, value, _ts in rows:
+                if metric in STATE_METRICS:
+                    rooms.setdefault(room, {})[metric] = round(value, 2)
+                    if self._dirty_since is None:
+                        self._dirty_since = now
+            self.batches += 1
+            self.accepted += accepted
+            self.rejected += rejected
+        return accepted, rejected
+
+    def _parse(
+        self, home: str, reading: Any, known: Optional[Collection[str]] = None
+    ) -> Optional[List[Tuple[str, str, str, float, Optional[float]]]]:
+        # {"room": "кухня", "metric": "temperature", "value": 21.5, "ts": 1700000000}
+        # or several metrics at once: {"room": "кухня", "temperature": 21.5, "humidity": 40}
+        if not isinstance(reading, dict):
+            return None
+        room = reading.get("room")
+        if not isinstance(room, str) or not room.strip():
+            return None
+        room = self.room_key(room)
+        if known is not None and room not in known:
+            return None
+        ts = reading.get("ts")
+        if ts is not None and not is_number(ts):
+            return None
+        if "metric" in reading:
+            metrics = [(reading["metric"], reading.get("value"))]
+        else:
+            metrics = [(name, reading[name]) for name in STATE_METRICS if name in reading]
+        if not metrics:
+            return None
+        rows = []
+        for metric, value in metrics:
+            if not isinstance(metric, str) or metric not in self.metrics or not is_number(value):
+                return None
+            rows.append((home, room, metric, float(value), ts))
+        return rows
+
+    def flush(self) -> int:
+        """Publish the latest values received since the last flush; return how many rooms changed."""
+        with self._flush_lock:
+            with self._lock:
+                dirty = {home: rooms for home, rooms in self._dirty.items() if rooms}
+                self._dirty = {}
+                since, self._dirty_since = self._dirty_since, None
+            if not dirty:
+                return 0
+            try:
+                self.publish(dirty)
+            except Exception as e:
+                self.error = str(e)
+                return 0
+            self.error = None
+            self._lag_ms.append((time.monotonic() - since) * 1000)
+            self.broadcasts += 1
+            rooms = sum(len(r) for r in dirty.values())
+            self.coalesced += rooms
+            return rooms
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lag = list(self._lag_ms)
+            return {
+                "interval": self.interval,
+                "batches": self.batches,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "broadcasts": self.broadcasts,
+                "rooms_per_broadcast": round(self.coalesced / self.broadcasts, 1) if self.broadcasts else None,
+                "pending_rooms": sum(len(rooms) for rooms in self._dirty.values()),
+                "broadcast_lag_ms": percentiles(lag),
+                "error": self.error,
+            }
+
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """Current and peak resident memory of this process in MB (Linux /proc; peak elsewhere)."""
+    rss = peak = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith("VmHWM:"):
+                    peak = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        try:
+            import resource
+
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # kilobytes on Linux, bytes on macOS
+            peak = round(maxrss / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+        except (ImportError, AttributeError):
+            pass
+    return {"rss_mb": rss, "peak_rss_mb": peak}
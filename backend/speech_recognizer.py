@@ -1,16 +1,42 @@
+import io
+import math
 import os
-from typing import Optional
+import queue
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
 from pydub import AudioSegment
 from pydub.utils import which
-from faster_whisper import WhisperModel 
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
 
 from backend.fileutils import get_ext, temp_filepath
 
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 30
+
 
 class RecognitionError(Exception):
     pass
 
 
+class RecognizerBusy(RecognitionError):
+    """Admission control rejected the request: too much audio already queued."""
+
+    def __init__(self, queue_depth: int, max_queue: int):
+        super().__init__("Распознаватель перегружен, попробуйте позже")
+        self.queue_depth = queue_depth
+        self.max_queue = max_queue
+
+
+class RecognitionTimeout(RecognitionError):
+    pass
+
+
 def _configure_ffmpeg() -> None:
 
     custom_path = os.getenv("FFMPEG_PATH")
@@ -49,7 +75,7 @@ def _ensure_wav(input_path: str) -> str:
         except Exception as e:
             raise RecognitionError(f"Ошибка декодирования аудио: {e}. Проверьте, что формат поддерживается ffmpeg")
 
-    audio = audio.set_channels(1).set_frame_rate(16000).set_sample_width(2)
+    audio = audio.set_channels(1).set_frame_rate(SAMPLE_RATE).set_sample_width(2)
     try:
         audio.export(output_path, format="wav")
     except Exception as e:
@@ -57,6 +83,20 @@ def _ensure_wav(input_path: str) -> str:
     return output_path
 
 
+def decode_audio_bytes(data: bytes) -> np.ndarray:
+    # PyAV (dependency of faster-whisper) decodes and resamples in-process:
+    # no temp files, no ffmpeg subprocess, no intermediate WAV.
+    if not data:
+        raise RecognitionError("Пустой аудиофайл")
+    try:
+        audio = decode_audio(io.BytesIO(data), sampling_rate=SAMPLE_RATE)
+    except Exception as e:
+        raise RecognitionError(f"Ошибка декодирования аудио: {e}. Проверьте, что формат поддерживается ffmpeg")
+    if audio.size == 0:
+        raise RecognitionError("Аудио не содержит звука")
+    return audio
+
+
 def _normalize_lang_for_whisper(language: Optional[str]) -> Optional[str]:
     if not language:
         return None
@@ -64,38 +104,353 @@ def _normalize_lang_for_whisper(language: Optional[str]) -> Optional[str]:
     return language.split("-")[0].lower()
 
 
+class _ModelPool:
+    """A fixed set of warm WhisperModel replicas; each runs one transcription at a time."""
+
+    def __init__(
+        self,
+        model_size: str,
+        compute_type: str,
+        replicas: int,
+        cpu_threads: int,
+        num_workers: int,
+        max_queue: int = 0,
+    ):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.replicas = max(1, replicas)
+        self.cpu_threads = cpu_threads
+        self.num_workers = max(1, num_workers)
+        self.max_queue = max_queue
+        self._idle: "queue.Queue[WhisperModel]" = queue.Queue()
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._waiting = 0
+        self._loaded = 0
+        self.error: Optional[str] = None
+
+    def load(self) -> None:
+        with self._load_lock:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            for _ in range(self.replicas - self._loaded):
+                model = WhisperModel(
+                    self.model_size,
+                    device="cpu",
+                    compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads,
+                    num_workers=self.num_workers,
+                )
+                self._loaded += 1
+                self._idle.put(model)
+            self.error = None
+            self._ready.set()
+        except Exception as e:
+            self.error = str(e)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None):
+        with self._lock:
+            if self.max_queue and self._waiting >= self.max_queue and self._idle.empty():
+                raise RecognizerBusy(self._waiting, self.max_queue)
+            self._waiting += 1
+        try:
+            model = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise RecognitionTimeout("Распознаватель занят, превышено время ожидания")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        try:
+            yield model
+        finally:
+            self._idle.put(model)
+
+    def status(self) -> Dict[str, Any]:
+        idle = self._idle.qsize()
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "model": self.model_size,
+            "compute_type": self.compute_type,
+            "replicas": self.replicas,
+            "loaded": self._loaded,
+            "busy": self._loaded - idle,
+            "waiting": self._waiting,
+            "max_queue": self.max_queue,
+            "cpu_threads": self.cpu_threads,
+            "num_workers": self.num_workers,
+        }
+
+
+_POOL: Optional[_ModelPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool_from_env() -> _ModelPool:
+    return _ModelPool(
+        model_size=os.getenv("WHISPER_MODEL", "tiny"),
+        compute_type=os.getenv("WHISPER_COMPUTE", "int8").lower(),
+        replicas=int(os.getenv("WHISPER_REPLICAS", "1")),
+        cpu_threads=int(os.getenv("WHISPER_CPU_THREADS", "0")),
+        num_workers=int(os.getenv("WHISPER_NUM_WORKERS", "1")),
+        max_queue=int(os.getenv("WHISPER_QUEUE", "0")),
+    )
+
+
+def init_recognizer(background: bool = True) -> _ModelPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = _pool_from_env()
+        pool = _POOL
+    if not pool.ready:
+        if background:
+            threading.Thread(target=pool.load, name="whisper-warmup", daemon=True).start()
+        else:
+            pool.load()
+    return pool
+
+
+def recognizer_status() -> Dict[str, Any]:
+    pool = _POOL
+    if pool is None:
+        return {"ready": False, "error": None, "loaded": 0}
+    return pool.status()
+
+
+def _get_pool(timeout: Optional[float] = None) -> _ModelPool:
+    pool = _POOL
+    if pool is None or (not pool.ready and pool.error):
+        # Not warmed at startup (or the warm-up failed): load synchronously now.
+        pool = init_recognizer(background=False)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not pool._ready.wait(0.1):
+        if pool.error:
+            raise RecognitionError(f"Модель распознавания не загружена: {pool.error}")
+        if deadline is not None and time.monotonic() > deadline:
+            raise RecognitionTimeout("Модель распознавания ещё загружается")
+    return pool
+
+
+def _transcribe_scored(
+    audio: Union[str, np.ndarray],
+    language: Optional[str],
+    timeout: Optional[float] = None,
+    **options: Any,
+) -> Tuple[str, Optional[float], Optional[float]]:
+    lang = _normalize_lang_for_whisper(language)
+    pool = _get_pool(timeout)
+    with pool.acquire(timeout) as model:
+        try:
+            segments, _info = model.transcribe(audio, language=lang, **options)
+            # segments is a lazy generator: decoding happens here, so keep the replica until done.
+            segments = list(segments)
+        except Exception as e:
+            raise RecognitionError(f"Ошибка распознавания: {e}")
+    text = (" ".join(seg.text for seg in segments)).strip()
+    if not segments:
+        return text, None, None
+    confidence = math.exp(sum(seg.avg_logprob for seg in segments) / len(segments))
+    return text, confidence, max(seg.no_speech_prob for seg in segments)
+
+
+def _transcribe(
+    audio: Union[str, np.ndarray],
+    language: Optional[str],
+    timeout: Optional[float] = None,
+    beam_size: int = 5,
+    vad_filter: bool = True,
+) -> str:
+    text, _confidence, _no_speech = _transcribe_scored(
+        audio, language, timeout, beam_size=beam_size, vad_filter=vad_filter
+    )
+    if not text:
+        raise RecognitionError("Не удалось распознать речь")
+    return text
+
+
+def transcribe_scored(
+    audio: np.ndarray,
+    language: str = "ru-RU",
+    timeout: Optional[float] = None,
+    **options: Any,
+) -> Tuple[str, Optional[float], Optional[float]]:
+    """(text, confidence, no_speech_prob); options go straight to WhisperModel.transcribe.
+
+    confidence is exp of the mean segment avg_logprob; both scores are None
+    when nothing was decoded. Empty text is returned, not raised.
+    """
+    return _transcribe_scored(audio, language, timeout, **options)
+
+
+def transcribe_array(
+    audio: np.ndarray,
+    language: str = "ru-RU",
+    timeout: Optional[float] = None,
+    beam_size: int = 5,
+    vad_filter: bool = True,
+) -> str:
+    return _transcribe(audio, language, timeout, beam_size=beam_size, vad_filter=vad_filter)
+
+
+def recognize_from_bytes(data: bytes, language: str = "ru-RU", timeout: Optional[float] = None) -> str:
+    audio = decode_audio_bytes(data)
+    return _transcribe(audio, language, timeout)
+
+
 def recognize_from_file(file_path: str, language: str = "ru-RU", timeout: Optional[float] = None) -> str:
     if not os.path.exists(file_path):
         raise RecognitionError("Файл не найден")
 
     wav_path = _ensure_wav(file_path)
-
-    lang = _normalize_lang_for_whisper(language)
-
-    global _FW_MODEL
     try:
-        model_size = os.getenv("WHISPER_MODEL", "tiny")
-        compute_type = os.getenv("WHISPER_COMPUTE", "int8").lower()
-
-        if '_FW_MODEL' not in globals() or _FW_MODEL is None:
-            _FW_MODEL = WhisperModel(model_size, device="cpu", compute_type=compute_type)
-
-        segments, _info = _FW_MODEL.transcribe(
-            wav_path,
-            language=lang,
-            vad_filter=True,
-            beam_size=5,
-        )
-        parts = [seg.text for seg in segments]
-        text = (" ".join(parts)).strip()
-        if not text:
-            raise RecognitionError("Не удалось распознать речь")
-        return text
-    except Exception as e:
-        raise RecognitionError(f"Ошибка распознавания: {e}")
+        return _transcribe(wav_path, language, timeout)
     finally:
         if wav_path != file_path and os.path.exists(wav_path):
             try:
                 os.remove(wav_path)
             except OSError:
                 pass
+
+
+def _decode_clip(clip: Union[bytes, str]) -> tuple:
+    t0 = time.perf_counter()
+    if isinstance(clip, str):
+        try:
+            with open(clip, "rb") as f:
+                clip = f.read()
+        except OSError as e:
+            raise RecognitionError(f"Не удалось прочитать файл: {e}")
+    audio = decode_audio_bytes(clip)
+    return audio, (time.perf_counter() - t0) * 1000
+
+
+def _transcribe_group(
+    group: List[tuple],
+    language: Optional[str],
+    beam_size: int,
+    batch_size: int,
+    timeout: Optional[float],
+) -> float:
+    # All clips of the group go into one buffer; clip_timestamps cuts it back
+    # into <=30 s windows, which the pipeline decodes batch_size at a time.
+    # Every window starts at a known offset, so segments map back to clips.
+    pieces, clip_timestamps, starts, owners = [], [], [], []
+    offset = 0
+    for n, (_index, result, audio) in enumerate(group):
+        pieces.append(audio)
+        step = CHUNK_SECONDS * SAMPLE_RATE
+        for begin in range(0, audio.size, step):
+            end = min(audio.size, begin + step)
+            clip_timestamps.append({"start": (offset + begin) / SAMPLE_RATE, "end": (offset + end) / SAMPLE_RATE})
+            starts.append((offset + begin) / SAMPLE_RATE)
+            owners.append(n)
+        offset += audio.size
+        result["duration"] = round(audio.size / SAMPLE_RATE, 3)
+
+    texts = [[] for _ in group]
+    logprobs = [[] for _ in group]
+    no_speech = [[] for _ in group]
+    pool = _get_pool(timeout)
+    t0 = time.perf_counter()
+    with pool.acquire(timeout) as model:
+        try:
+            segments, _info = BatchedInferencePipeline(model).transcribe(
+                np.concatenate(pieces),
+                language=language,
+                beam_size=beam_size,
+                batch_size=batch_size,
+                clip_timestamps=clip_timestamps,
+            )
+            for seg in segments:
+                n = owners[max(0, bisect_right(starts, seg.start + 1e-3) - 1)]
+                texts[n].append(seg.text)
+                logprobs[n].append(seg.avg_logprob)
+                no_speech[n].append(seg.no_speech_prob)
+        except Exception as e:
+            raise RecognitionError(f"Ошибка распознавания: {e}")
+    inference_ms = (time.perf_counter() - t0) * 1000
+
+    for n, (_index, result, _audio) in enumerate(group):
+        result["text"] = " ".join(t.strip() for t in texts[n] if t.strip())
+        if logprobs[n]:
+            result["confidence"] = round(math.exp(sum(logprobs[n]) / len(logprobs[n])), 4)
+            result["no_speech_prob"] = round(max(no_speech[n]), 4)
+        if not result["text"]:
+            result["error"] = "Не удалось распознать речь"
+        result["inference_ms"] = round(inference_ms, 1)
+        result["batch_clips"] = len(group)
+    return inference_ms
+
+
+def transcribe_batch(
+    clips: Iterable[Union[bytes, str]],
+    language: str = "ru-RU",
+    beam_size: int = 5,
+    batch_size: int = 8,
+    decode_workers: int = 4,
+    timeout: Optional[float] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Transcribe many clips (raw bytes or file paths); yields one dict per clip, in input order.
+
+    Decoding runs in a thread pool ahead of inference; inference runs through
+    faster-whisper's BatchedInferencePipeline, holding a replica only for one
+    group of ``batch_size`` clips at a time so live requests can interleave.
+    A clip that fails to decode or has no speech gets an ``error`` and does not
+    stop the batch.
+    """
+    lang = _normalize_lang_for_whisper(language)
+    batch_size = max(1, batch_size)
+    window = max(batch_size * 2, decode_workers)
+    clips = iter(clips)
+    pending: deque = deque()
+    index = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, decode_workers), thread_name_prefix="whisper-decode") as executor:
+        def refill():
+            nonlocal index
+            while len(pending) < window:
+                try:
+                    clip = next(clips)
+                except StopIteration:
+                    return
+                pending.append((index, executor.submit(_decode_clip, clip)))
+                index += 1
+
+        refill()
+        while pending:
+            group: List[tuple] = []
+            while pending and len(group) < batch_size:
+                i, future = pending.popleft()
+                result: Dict[str, Any] = {
+                    "index": i,
+                    "text": "",
+                    "confidence": None,
+                    "no_speech_prob": None,
+                    "duration": None,
+                    "decode_ms": None,
+                    "inference_ms": None,
+                    "batch_clips": None,
+                    "error": None,
+                }
+                try:
+                    audio, decode_ms = future.result()
+                    result["decode_ms"] = round(decode_ms, 1)
+                except RecognitionError as e:
+                    audio = None
+                    result["error"] = str(e)
+                group.append((i, result, audio))
+                refill()
+            decoded = [item for item in group if item[2] is not None]
+            if decoded:
+                _transcribe_group(decoded, lang, beam_size, batch_size, timeout)
+            for _i, result, _audio in group:
+                yield result
@@ -0,0 +1,125 @@
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# A change is (section, key, value): put `value` at state[section][key], or
+# delete the key when value is None. Sections are "lights", "thermometers",
+# "devices" (keyed by device id) and "timers" (pending jobs, keyed by job id).
+# Besides changes, a delta can carry events: things that happened (a timer
+# went off) rather than state, so they are in no snapshot, only in deltas.
+Change = Tuple[str, Any, Any]
+
+
+def sse_frame(event: str, seq: int, data: str) -> str:
+    return f"id: {seq}\nevent: {event}\ndata: {data}\n\n"
+
+
+class StateStore:
+    """Versioned copy of the dashboard state that emits compact deltas.
+
+    Every applied batch of changes gets the next sequence number and is
+    serialized once into a ready-to-send SSE frame. The last `history` frames
+    are kept so a reconnecting client (Last-Event-ID) can be caught up with just
+    what it missed; older gaps fall back to a full snapshot.
+    """
+
+    def __init__(self, history: int = 512):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._state: Dict[str, Dict[Any, Any]] = {"lights": {}, "thermometers": {}, "devices": {}, "timers": {}}
+        self._history: "deque[Tuple[int, str]]" = deque(maxlen=history)
+        self._snapshot_frame: Optional[Tuple[int, str]] = None
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def reset(self, snapshot: Dict[str, Any], seq: Optional[int] = None) -> None:
+        """Replace the whole state; a replica passes the seq of the snapshot it copied."""
+        with self._lock:
+            self._state = {
+                "lights": dict(snapshot.get("lights", {})),
+                "thermometers": {k: dict(v) for k, v in snapshot.get("thermometers", {}).items()},
+                "devices": {d["id"]: d for d in snapshot.get("devices", [])},
+                "timers": {t["id"]: t for t in snapshot.get("timers", [])},
+            }
+            self._seq = self._seq + 1 if seq is None else seq
+            self._history.clear()
+            self._snapshot_frame = None
+
+    def apply(self, changes: Iterable[Change], events: Iterable[Dict[str, Any]] = ()) -> Optional[Tuple[int, str]]:
+        """Apply changes; return (seq, SSE frame) or None if nothing changed and there are no events."""
+        with self._lock:
+            ops = []
+            for section, key, value in changes:
+                current = self._state.setdefault(section, {})
+                if value is None:
+                    if key in current:
+                        del current[key]
+                        ops.append({"op": "del", "path": [section, key]})
+                elif current.get(key) != value:
+                    current[key] = value
+                    ops.append({"op": "put", "path": [section, key], "value": value})
+            events = list(events)
+            if not ops and not events:
+                return None
+            self._seq += 1
+            delta: Dict[str, Any] = {"seq": self._seq, "ops": ops}
+            if events:
+                delta["events"] = events
+            frame = sse_frame("delta", self._seq, json.dumps(delta, ensure_ascii=False))
+            self._history.append((self._seq, frame))
+            return self._seq, frame
+
+    def follow(self, seq: int, frame: str) -> bool:
+        """Replay a delta frame made by the primary StateStore of this state.
+
+        Returns False, changing nothing, if seq does not directly follow ours:
+        the replica missed something and has to reset from a fresh snapshot.
+        """
+        with self._lock:
+            if seq != self._seq + 1:
+                return False
+            data = json.loads(frame[frame.index("\ndata: ") + 7:])
+            for op in data["ops"]:
+                section, key = op["path"]
+                current = self._state.setdefault(section, {})
+                if op["op"] == "del":
+                    current.pop(key, None)
+                else:
+                    current[key] = op["value"]
+            self._seq = seq
+            self._history.append((seq, frame))
+            return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._snapshot_locked()
+
+    def _snapshot_locked(self) -> Dict[str, Any]:
+        devices, timers = self._state["devices"], self._state["timers"]
+        return {
+            "seq": self._seq,
+            "lights": dict(self._state["lights"]),
+            "thermometers": {k: dict(v) for k, v in self._state["thermometers"].items()},
+            "devices": [devices[i] for i in sorted(devices)],
+            "timers": [timers[i] for i in sorted(timers)],
+        }
+
+    def snapshot_frame(self) -> Tuple[int, str]:
+        with self._lock:
+            cached = self._snapshot_frame
+            if cached is None or cached[0] != self._seq:
+                data = json.dumps(self._snapshot_locked(), ensure_ascii=False)
+                cached = self._snapshot_frame = (self._seq, sse_frame("snapshot", self._seq, data))
+            return cached
+
+    def since(self, last_seq: int) -> Optional[List[Tuple[int, str]]]:
+        """Delta frames after last_seq, or None if they're no longer all in history."""
+        with self._lock:
+            if last_seq == self._seq:
+                return []
+            if last_seq > self._seq or not self._history or self._history[0][0] > last_seq + 1:
+                return None
+            return [(seq, frame) for seq, frame in self._history if seq > last_seq]
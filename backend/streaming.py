@@ -0,0 +1,274 @@
+import functools
+import io
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import av
+import numpy as np
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.server import ServerConnection, serve
+
+from backend.command_parser import is_complete, parse_command
+from backend.speech_recognizer import SAMPLE_RATE, RecognitionError, transcribe_array
+
+# Push-to-talk over WebSocket. The client streams audio while the user is still
+# talking; every STREAM_STEP seconds the rolling buffer is run through VAD and a
+# greedy transcription, the partial text is sent back, and the command is executed
+# as soon as two consecutive passes agree on a complete parse.
+#
+# Client -> server:
+#   {"type": "start", "format": "webm" | "pcm_f32le", "language": "ru-RU"}   (optional)
+#   binary frames: MediaRecorder chunks (webm/ogg) or raw 16 kHz mono float32 PCM
+#   {"type": "stop"}
+# Server -> client:
+#   {"type": "partial", "text": ...}
+#   {"type": "result", "text": ..., "parsed": ..., "response": ...}
+#   {"type": "error", "error": ...}
+# A session longer than STREAM_MAX_SECONDS of audio or STREAM_MAX_BYTES of
+# input gets an error and the connection is closed.
+
+STREAM_STEP = float(os.getenv("STREAM_STEP", "0.5"))
+STREAM_WINDOW = float(os.getenv("STREAM_WINDOW", "15"))
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", "30"))
+STREAM_MAX_BYTES = int(os.getenv("STREAM_MAX_BYTES", str(4 * 1024 * 1024)))
+# A decoder waiting this long for more input gives up on the session.
+STREAM_IDLE = 60.0
+
+_VAD = VadOptions(min_silence_duration_ms=300, speech_pad_ms=200)
+
+
+class StreamLimitError(RecognitionError):
+    pass
+
+
+class _Pipe(io.RawIOBase):
+    """Blocking file-like input for a demuxer: reads wait until chunks arrive or the input ends."""
+
+    def __init__(self):
+        self._chunks: deque = deque()
+        self._cond = threading.Condition()
+        self._ended = False
+
+    def readable(self) -> bool:
+        return True
+
+    def write_chunk(self, chunk: bytes) -> None:
+        with self._cond:
+            self._chunks.append(bytes(chunk))
+            self._cond.notify()
+
+    def end(self) -> None:
+        with self._cond:
+            self._ended = True
+            self._cond.notify()
+
+    def readinto(self, buffer) -> int:
+        with self._cond:
+            if not self._chunks and not self._ended:
+                self._cond.wait_for(lambda: self._chunks or self._ended, STREAM_IDLE)
+            if not self._chunks:
+                return 0
+            chunk = self._chunks.popleft()
+            n = min(len(buffer), len(chunk))
+            buffer[:n] = chunk[:n]
+            if n < len(chunk):
+                self._chunks.appendleft(chunk[n:])
+            return n
+
+
+class _StreamDecoder:
+    """Decodes a growing webm/ogg upload once, as it arrives.
+
+    Container chunks are not decodable on their own, so a thread runs one
+    PyAV demuxer over the whole stream (fed through a _Pipe) and hands every
+    decoded 16 kHz frame to `sink`.
+    """
+
+    def __init__(self, sink: Callable[[np.ndarray], None]):
+        self.sink = sink
+        self.error: Optional[str] = None
+        self._pipe = _Pipe()
+        self._thread = threading.Thread(target=self._run, name="stream-decode", daemon=True)
+        self._thread.start()
+
+    def write(self, chunk: bytes) -> None:
+        self._pipe.write_chunk(chunk)
+
+    def finish(self, timeout: float = 10.0) -> None:
+        """End the input and wait for the rest of it to be decoded."""
+        self._pipe.end()
+        self._thread.join(timeout)
+
+    def close(self) -> None:
+        self._pipe.end()
+
+    def _run(self) -> None:
+        # Small probe: the demuxer must start on the first chunk, not wait for megabytes.
+        try:
+            with av.open(self._pipe, mode="r", options={"probesize": "32", "analyzeduration": "0"}) as container:
+                resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+                for frame in container.decode(audio=0):
+                    self._emit(resampler.resample(frame))
+                self._emit(resampler.resample(None))
+        except Exception as e:
+            self.error = str(e)
+
+    def _emit(self, frames) -> None:
+        for frame in frames:
+            self.sink(frame.to_ndarray().reshape(-1).astype(np.float32) / 32768.0)
+
+
+class _Session:
+    def __init__(self, fmt: str = "webm", language: str = "ru-RU"):
+        self.fmt = fmt
+        self.language = language
+        self.received = 0
+        # Decoded audio so far; sized for the longest session allowed, written once per sample.
+        self._pcm = np.empty(int(STREAM_MAX_SECONDS * SAMPLE_RATE), dtype=np.float32)
+        self._samples = 0
+        self._overflow = False
+        self._pcm_tail = b""
+        self._decoder = None if fmt == "pcm_f32le" else _StreamDecoder(self._append)
+        self.last_parsed: Optional[Dict[str, Any]] = None
+        self.done = False
+
+    def _append(self, samples: np.ndarray) -> None:
+        n = min(samples.size, self._pcm.size - self._samples)
+        self._pcm[self._samples:self._samples + n] = samples[:n]
+        self._samples += n
+        if n < samples.size:
+            self._overflow = True
+
+    def feed(self, chunk: bytes) -> None:
+        self.received += len(chunk)
+        if self.received > STREAM_MAX_BYTES:
+            raise StreamLimitError(f"Слишком длинная запись: больше {STREAM_MAX_BYTES // 1024} КБ")
+        if self._decoder is None:
+            data = self._pcm_tail + chunk
+            usable = len(data) - len(data) % 4
+            self._pcm_tail = data[usable:]
+            self._append(np.frombuffer(data[:usable], dtype="<f4"))
+        else:
+            self._decoder.write(chunk)
+        if self._overflow:
+            raise StreamLimitError(f"Слишком длинная запись: больше {STREAM_MAX_SECONDS:g} сек")
+
+    def audio(self) -> np.ndarray:
+        return self._pcm[:self._samples]
+
+    def close(self) -> None:
+        if self._decoder is not None:
+            self._decoder.close()
+
+    def partial_text(self) -> Optional[str]:
+        audio = self.audio()[-int(STREAM_WINDOW * SAMPLE_RATE):]
+        if audio.size < SAMPLE_RATE // 4:
+            return None
+        speech = get_speech_timestamps(audio, _VAD)
+        if not speech:
+            return None
+        voiced = audio[speech[0]["start"]:speech[-1]["end"]]
+        try:
+            return transcribe_array(voiced, self.language, beam_size=1, vad_filter=False)
+        except RecognitionError:
+            return None
+
+    def final_text(self) -> str:
+        if self._decoder is not None:
+            self._decoder.finish()
+            if not self._samples:
+                if self._decoder.error:
+                    raise RecognitionError(f"Ошибка декодирования аудио: {self._decoder.error}")
+                raise RecognitionError("Пустой аудиофайл")
+        return transcribe_array(self.audio(), self.language)
+
+
+def _same_command(a: Optional[Dict[str, Any]], b: Dict[str, Any]) -> bool:
+    return a is not None and a.get("action") == b.get("action") and a.get("params") == b.get("params")
+
+
+class SpeechStream:
+    """Transport-independent push-to-talk state machine.
+
+    feed() takes one incoming message (str control frame or audio bytes) and
+    returns the payloads to send back plus whether the exchange is over. It does
+    the CPU-heavy work inline, so async transports run it in an executor, and
+    call close() when the connection goes away.
+    """
+
+    def __init__(self, on_text: Callable[[str], Dict[str, Any]]):
+        self.on_text = on_text
+        self.session = _Session()
+        self.last_pass = time.monotonic()
+
+    def feed(self, message) -> Tuple[List[Dict[str, Any]], bool]:
+        try:
+            return self._feed(message)
+        except StreamLimitError as e:
+            self.close()
+            return [{"type": "error", "error": str(e)}], True
+        except RecognitionError as e:
+            return [{"type": "error", "error": str(e)}], False
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _feed(self, message) -> Tuple[List[Dict[str, Any]], bool]:
+        session = self.session
+        if isinstance(message, str):
+            try:
+                msg = json.loads(message)
+            except ValueError:
+                return [{"type": "error", "error": "Некорректное сообщение"}], False
+            if msg.get("type") == "start":
+                session.close()
+                self.session = _Session(msg.get("format", "webm"), msg.get("language", "ru-RU"))
+            elif msg.get("type") == "stop":
+                if session.done:
+                    return [], True
+                return [{"type": "result", **self.on_text(session.final_text())}], True
+            return [], False
+
+        session.feed(message)
+        if session.done or time.monotonic() - self.last_pass < STREAM_STEP:
+            return [], False
+
+        text = session.partial_text()
+        self.last_pass = time.monotonic()
+        if not text:
+            return [], False
+        out = [{"type": "partial", "text": text}]
+
+        parsed = parse_command(text)
+        if is_complete(parsed) and _same_command(session.last_parsed, parsed):
+            session.done = True
+            out.append({"type": "result", **self.on_text(text)})
+        session.last_parsed = parsed
+        return out, False
+
+
+def _handle(ws: ServerConnection, on_text: Callable[[str], Dict[str, Any]]) -> None:
+    stream = SpeechStream(on_text)
+    try:
+        for message in ws:
+            replies, finished = stream.feed(message)
+            for payload in replies:
+                ws.send(json.dumps(payload, ensure_ascii=False))
+            if finished:
+                break
+    except ConnectionClosed:
+        pass
+    finally:
+        stream.close()
+
+
+def start_stream_server(on_text: Callable[[str], Dict[str, Any]], host: str = "0.0.0.0", port: int = 5001) -> threading.Thread:
+    server = serve(functools.partial(_handle, on_text=on_text), host, port, max_size=4 * 1024 * 1024)
+    thread = threading.Thread(target=server.serve_forever, name="speech-stream", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,262 @@
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from backend import db
+
+# Sensor time series. Raw readings live only in memory, in one fixed-size
+# numpy ring per (home, room, metric): appending is two array stores, and the
+# recent window is a slice. Every reading also updates the 1-minute and
+# 1-hour buckets it falls into; those partial aggregates (count, sum, min,
+# max) are merged into SQLite by a flush thread in one transaction, with an
+# additive upsert, so late readings and restarts just add to their bucket.
+# History queries read the rollup table plus whatever is not flushed yet.
+
+RESOLUTIONS = {"1m": 60, "1h": 3600}
+# Longest span answered at 1-minute resolution when the caller says "auto".
+AUTO_MINUTE_SPAN = 6 * 3600
+
+
+class _Ring:
+    __slots__ = ("ts", "values", "start", "size")
+
+    def __init__(self, capacity: int):
+        self.ts = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float32)
+        self.start = 0
+        self.size = 0
+
+    def append(self, ts: float, value: float) -> None:
+        capacity = self.ts.size
+        i = (self.start + self.size) % capacity
+        self.ts[i] = ts
+        self.values[i] = value
+        if self.size < capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % capacity
+
+    def last(self) -> Optional[Tuple[float, float]]:
+        if not self.size:
+            return None
+        i = (self.start + self.size - 1) % self.ts.size
+        return float(self.ts[i]), float(self.values[i])
+
+    def window(self, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        idx = (self.start + np.arange(self.size)) % self.ts.size
+        ts, values = self.ts[idx], self.values[idx]
+        mask = (ts >= start) & (ts <= end)
+        return ts[mask], values[mask]
+
+
+class TimeSeriesStore:
+    def __init__(
+        self,
+        capacity: int = 4096,
+        flush_interval: float = 10.0,
+        retention: Optional[Dict[str, float]] = None,
+        max_series: int = 5000,
+    ):
+        self.capacity = capacity
+        # Every series holds a ring of `capacity` readings; past this many, new
+        # series are refused rather than growing memory without bound.
+        self.max_series = max_series
+        self.flush_interval = flush_interval
+        self.retention = retention or {"1m": 7 * 86400, "1h": 400 * 86400}
+        self._series: Dict[Tuple[str, str, str], _Ring] = {}
+        # (home, room, resolution, bucket, metric) -> [count, sum, min, max] since the last flush
+        self._pending: Dict[Tuple[str, str, int, int, str], List[float]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.readings = 0
+        self.series_rejected = 0
+        self.flushed_rows = 0
+        self.last_flush_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="telemetry-flush", daemon=True).start()
+
+    # writes
+
+    def record(self, home: str, room: str, metric: str, value: float, ts: Optional[float] = None) -> None:
+        self.record_many([(home, room, metric, value, ts)])
+
+    def record_many(self, readings: Iterable[Tuple[str, str, str, float, Optional[float]]]) -> int:
+        """Store (home, room, metric, value, ts or None for now) readings; return how many.
+
+        Readings of a new series are dropped once max_series series exist.
+        """
+        now = time.time()
+        count = 0
+        with self._lock:
+            for home, room, metric, value, ts in readings:
+                ts = now if ts is None else float(ts)
+                value = float(value)
+                ring = self._series.get((home, room, metric))
+                if ring is None:
+                    if len(self._series) >= self.max_series:
+                        self.series_rejected += 1
+                        continue
+                    ring = self._series[(home, room, metric)] = _Ring(self.capacity)
+                ring.append(ts, value)
+                for resolution in RESOLUTIONS.values():
+                    key = (home, room, resolution, int(ts // resolution) * resolution, metric)
+                    agg = self._pending.get(key)
+                    if agg is None:
+                        self._pending[key] = [1, value, value, value]
+                    else:
+                        agg[0] += 1
+                        agg[1] += value
+                        if value < agg[2]:
+                            agg[2] = value
+                        if value > agg[3]:
+                            agg[3] = value
+                count += 1
+            self.readings += count
+        return count
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            t0 = time.perf_counter()
+            rows = [(*key, *agg) for key, agg in pending.items()]
+            try:
+                db.upsert_rollups(rows)
+            except Exception as e:
+                # Put the aggregates back so the next flush retries them.
+                self.error = str(e)
+                with self._lock:
+                    for key, agg in pending.items():
+                        self._merge_into(self._pending, key, agg)
+                return 0
+            self.error = None
+            self.flushed_rows += len(rows)
+            self.last_flush_ms = round((time.perf_counter() - t0) * 1000, 2)
+            return len(rows)
+
+    @staticmethod
+    def _merge_into(target: Dict, key: tuple, agg: List[float]) -> None:
+        current = target.get(key)
+        if current is None:
+            target[key] = list(agg)
+        else:
+            current[0] += agg[0]
+            current[1] += agg[1]
+            current[2] = min(current[2], agg[2])
+            current[3] = max(current[3], agg[3])
+
+    def expire(self) -> None:
+        now = time.time()
+        for name, resolution in RESOLUTIONS.items():
+            keep = self.retention.get(name)
+            if keep:
+                db.delete_rollups_before(resolution, int(now - keep))
+
+    def _run(self) -> None:
+        last_expire = 0.0
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            if time.monotonic() - last_expire > 3600:
+                try:
+                    self.expire()
+                    last_expire = time.monotonic()
+                except Exception as e:
+                    self.error = str(e)
+
+    # reads
+
+    def latest(self, home: str, room: str) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            found = {metric: ring.last() for (h, r, metric), ring in self._series.items() if h == home and r == room}
+        return {metric: {"t": last[0], "value": round(last[1], 2)} for metric, last in found.items() if last}
+
+    def last_values(self, home: str) -> Dict[str, Dict[str, float]]:
+        """room -> metric -> newest value of a home: from the rings, else the newest flushed minute."""
+        values: Dict[str, Dict[str, float]] = {}
+        for room, metric, value in db.latest_rollups(home, RESOLUTIONS["1m"]):
+            values.setdefault(room, {})[metric] = round(value, 2)
+        with self._lock:
+            found = [(room, metric, ring.last()) for (h, room, metric), ring in self._series.items() if h == home]
+        for room, metric, last in found:
+            if last:
+                values.setdefault(room, {})[metric] = round(last[1], 2)
+        return values
+
+    def history(
+        self,
+        home: str,
+        room: str,
+        metric: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: str = "auto",
+    ) -> Dict[str, Any]:
+        end = time.time() if end is None else end
+        start = end - 24 * 3600 if start is None else start
+        if resolution == "raw":
+            return self._raw_history(home, room, metric, start, end)
+        if resolution == "auto":
+            resolution = "1m" if end - start <= AUTO_MINUTE_SPAN else "1h"
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}, raw or auto")
+        step = RESOLUTIONS[resolution]
+        first, last = int(start // step) * step, int(end // step) * step
+
+        buckets: Dict[Tuple[int, str], List[float]] = {}
+        # Under the flush lock, so no aggregate is in between memory and the table.
+        with self._flush_lock:
+            for bucket, name, count, total, lo, hi in db.query_rollups(home, room, step, first, last, metric):
+                buckets[(bucket, name)] = [count, total, lo, hi]
+            with self._lock:
+                unflushed = [
+                    (key, list(agg)) for key, agg in self._pending.items()
+                    if key[0] == home and key[1] == room and key[2] == step and first <= key[3] <= last
+                    and (metric is None or key[4] == metric)
+                ]
+        for (_home, _room, _res, bucket, name), agg in unflushed:
+            self._merge_into(buckets, (bucket, name), agg)
+
+        series: Dict[str, List[Dict[str, Any]]] = {}
+        for (bucket, name), (count, total, lo, hi) in sorted(buckets.items()):
+            series.setdefault(name, []).append({
+                "t": bucket,
+                "avg": round(total / count, 2),
+                "min": round(lo, 2),
+                "max": round(hi, 2),
+                "n": int(count),
+            })
+        return {"room": room, "resolution": resolution, "from": first, "to": last + step, "series": series}
+
+    def _raw_history(self, home: str, room: str, metric: Optional[str], start: float, end: float) -> Dict[str, Any]:
+        # Only what is still in the in-memory rings (the last `capacity` readings per series).
+        series: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            windows = {
+                name: ring.window(start, end) for (h, r, name), ring in self._series.items()
+                if h == home and r == room and (metric is None or name == metric)
+            }
+        for name, (ts, values) in windows.items():
+            order = np.argsort(ts, kind="stable")
+            series[name] = [{"t": float(t), "value": round(float(v), 2)} for t, v in zip(ts[order], values[order])]
+        return {"room": room, "resolution": "raw", "from": start, "to": end, "series": series}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "series": len(self._series),
+                "max_series": self.max_series,
+                "series_rejected": self.series_rejected,
+                "readings": self.readings,
+                "pending_buckets": len(self._pending),
+                "flushed_rows": self.flushed_rows,
+                "last_flush_ms": self.last_flush_ms,
+                "ring_capacity": self.capacity,
+                "error": self.error,
+            }
@@ -0,0 +1,7 @@
+import math
+from typing import Any
+
+
+def is_number(value: Any) -> bool:
+    """A real, finite int or float: not a bool, a numeric string, NaN or infinity."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
@@ -0,0 +1,61 @@
+"""parse_command throughput on a corpus of real command phrases, before and after.
+
+    python -m benchmarks.bench_parse_command [--corpus FILE] [--seconds S]
+"""
+import argparse
+import json
+import os
+import time
+
+from backend import command_parser
+from benchmarks import legacy_parser
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "commands_ru.txt")
+
+
+def load_corpus(path: str = CORPUS):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parses_per_sec(parse, corpus, seconds: float) -> float:
+    n = 0
+    t0 = time.perf_counter()
+    deadline = t0 + seconds
+    while True:
+        for text in corpus:
+            parse(text)
+        n += len(corpus)
+        now = time.perf_counter()
+        if now >= deadline:
+            return n / (now - t0)
+
+
+def run(corpus, seconds: float = 1.0) -> dict:
+    mismatches = [
+        {"text": text, "before": before, "after": after}
+        for text in corpus
+        for before, after in [(legacy_parser.parse_command(text), command_parser.parse_command(text))]
+        if before != after
+    ]
+    before = parses_per_sec(legacy_parser.parse_command, corpus, seconds)
+    after = parses_per_sec(command_parser.parse_command, corpus, seconds)
+    return {
+        "phrases": len(corpus),
+        "before_parses_per_sec": round(before),
+        "after_parses_per_sec": round(after),
+        "speedup": round(after / before, 2),
+        "mismatches": mismatches,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", default=CORPUS)
+    ap.add_argument("--seconds", type=float, default=1.0)
+    args = ap.parse_args()
+    print(json.dumps(run(load_corpus(args.corpus), args.seconds), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compare the legacy temp-file/pydub speech path with the in-memory one.
+
+    python -m benchmarks.bench_speech_pipeline [clip ...] [--repeat N] [--decode-only]
+
+Without clip paths, synthetic webm/opus clips are generated in memory.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from backend.fileutils import get_ext, temp_filepath
+from backend import speech_recognizer as sr
+from benchmarks.clips import load_clips, make_clips
+
+
+def old_path(name: str, data: bytes, decode_only: bool):
+    # What api_speech_to_action did before: save upload, pydub -> temp WAV, path to whisper.
+    path = temp_filepath("." + (get_ext(name) or "webm"))
+    with open(path, "wb") as f:
+        f.write(data)
+    wav_path = None
+    try:
+        wav_path = sr._ensure_wav(path)
+        if not decode_only:
+            sr._transcribe(wav_path, "ru-RU")
+    finally:
+        for p in {path, wav_path}:
+            if p and os.path.exists(p):
+                os.remove(p)
+
+
+def new_path(name: str, data: bytes, decode_only: bool):
+    audio = sr.decode_audio_bytes(data)
+    if not decode_only:
+        sr._transcribe(audio, "ru-RU")
+
+
+def _measure(fn, clips, repeat, decode_only):
+    per_clip = {}
+    for name, data in clips:
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(name, data, decode_only)
+            samples.append((time.perf_counter() - t0) * 1000)
+        per_clip[name] = {"median_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3)}
+    return per_clip
+
+
+def run(clips, repeat: int = 5, decode_only: bool = False) -> dict:
+    result = {"repeat": repeat, "decode_only": decode_only, "clips": [n for n, _ in clips]}
+    if not decode_only:
+        pool = sr.init_recognizer(background=False)
+        if not pool.ready:
+            result["model_error"] = pool.error
+            decode_only = result["decode_only"] = True
+
+    for label, fn in (("old", old_path), ("new", new_path)):
+        try:
+            result[label] = _measure(fn, clips, repeat, decode_only)
+        except sr.RecognitionError as e:
+            result[label] = {"skipped": str(e)}
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("clips", nargs="*")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--decode-only", action="store_true", help="skip Whisper, time decoding only")
+    args = ap.parse_args()
+    clips = load_clips(args.clips) if args.clips else make_clips()
+    print(json.dumps(run(clips, args.repeat, args.decode_only), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import glob
+import io
+import os
+from typing import List, Tuple
+
+import av
+import numpy as np
+
+RECORDED_DIR = os.path.join(os.path.dirname(__file__), "data", "recorded")
+
+
+def synth_signal(seconds: float, rate: int = 48000, seed: int = 0) -> np.ndarray:
+    # Speech-like fixture: a few harmonics with a syllable-rate envelope plus noise.
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    f0 = 110 + 40 * rng.random()
+    voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t))
+    noise = 0.05 * rng.standard_normal(t.size)
+    signal = 0.2 * voice * envelope + noise
+    return np.clip(signal, -1, 1).astype(np.float32)
+
+
+def encode(signal: np.ndarray, fmt: str = "webm", rate: int = 48000) -> bytes:
+    codec = {"webm": "libopus", "ogg": "libopus", "wav": "pcm_s16le", "mp3": "libmp3lame"}[fmt]
+    buf = io.BytesIO()
+    container = av.open(buf, "w", format=fmt)
+    stream = container.add_stream(codec, rate=rate)
+    stream.layout = "mono"
+    frame = av.AudioFrame.from_ndarray(signal[None, :], format="flt", layout="mono")
+    frame.sample_rate = rate
+    for packet in stream.encode(frame):
+        container.mux(packet)
+    for packet in stream.encode(None):
+        container.mux(packet)
+    container.close()
+    return buf.getvalue()
+
+
+def make_clips(durations=(1.0, 2.0, 3.0, 5.0), fmt: str = "webm") -> List[Tuple[str, bytes]]:
+    clips = []
+    for i, seconds in enumerate(durations):
+        clips.append((f"synth_{seconds:g}s.{fmt}", encode(synth_signal(seconds, seed=i), fmt)))
+    return clips
+
+
+def load_clips(paths: List[str]) -> List[Tuple[str, bytes]]:
+    clips = []
+    for path in paths:
+        with open(path, "rb") as f:
+            clips.append((os.path.basename(path), f.read()))
+    return clips
+
+
+def recorded_clips() -> List[Tuple[str, bytes]]:
+    return load_clips(sorted(glob.glob(os.path.join(RECORDED_DIR, "*.*"))))
+
+
+def dithered(data: bytes, seed: int, rate: int = 16000) -> bytes:
+    # The same clip with inaudible noise added, re-encoded as WAV: new bytes, so
+    # the server's transcript cache (keyed by the file hash) cannot answer it.
+    from backend.speech_recognizer import decode_audio_bytes
+
+    signal = decode_audio_bytes(data)
+    noise = 1e-4 * np.random.default_rng(seed).standard_normal(signal.size)
+    return encode(np.clip(signal + noise, -1, 1).astype(np.float32), "wav", rate)
@@ -0,0 +1,71 @@
+"""Compare two benchmarks.suite results, number by number.
+
+    python -m benchmarks.compare base.json new.json [--threshold 10]
+
+Prints every numeric result present in both files as base, new and change in
+percent, largest changes first; --threshold hides changes smaller than that
+many percent. Whether up is better depends on the number (ops_per_sec vs _ms).
+"""
+import argparse
+import json
+
+
+def flatten(node, prefix: str = ""):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(node, (int, float)) and not isinstance(node, bool) and not prefix.endswith(".n"):
+        # sample counts (.n) are not results
+        yield prefix, node
+
+
+def compare(base: dict, new: dict, threshold: float = 0.0) -> dict:
+    before = dict(flatten(base.get("scenarios", {})))
+    after = dict(flatten(new.get("scenarios", {})))
+    rows = []
+    for path, old in before.items():
+        if path not in after:
+            continue
+        change = round((after[path] - old) / old * 100, 1) if old else None
+        if change is None or abs(change) >= threshold:
+            rows.append((path, {"base": old, "new": after[path], "change_pct": change}))
+    rows.sort(key=lambda row: -abs(row[1]["change_pct"] or 0))
+    return {
+        "base": base.get("meta", {}).get("commit"),
+        "new": new.get("meta", {}).get("commit"),
+        "results": dict(rows),
+        # scenarios (or levels) measured by one run only
+        "only_in_base": _missing(before, after),
+        "only_in_new": _missing(after, before),
+    }
+
+
+def _missing(ours: dict, theirs: dict) -> list:
+    """The shortest prefixes of our paths that the other run has nothing under."""
+    present = {path.rsplit(".", i)[0] for path in theirs for i in range(path.count(".") + 1)}
+    missing = set()
+    for path in set(ours) - set(theirs):
+        parts = path.split(".")
+        for i in range(1, len(parts) + 1):
+            prefix = ".".join(parts[:i])
+            if prefix not in present:
+                missing.add(prefix)
+                break
+    return sorted(missing)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("base")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=0.0, help="hide changes below this many percent")
+    args = ap.parse_args()
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    print(json.dumps(compare(base, new, args.threshold), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
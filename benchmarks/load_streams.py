@@ -0,0 +1,131 @@
+"""Connection capacity and command latency under many idle dashboard streams.
+
+Start a server, then point this at it:
+
+    python app.py            # threaded WSGI server
+    python asgi.py           # asyncio server
+    python -m benchmarks.load_streams --url http://127.0.0.1:5000 --streams 500 --commands 50
+
+It opens N SSE connections to /api/devices/stream and keeps them open, then
+sends text commands and measures their latency and how long each delta takes
+to reach every open stream. Raise `ulimit -n` for large N.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+COMMANDS = ["включи свет на кухне", "выключи свет на кухне"]
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 2), "n": len(ordered)}
+
+
+class StreamClient:
+    def __init__(self):
+        self.connected = False
+        self.last_seq = 0
+        self.seen = asyncio.Event()
+        self.writer = None
+
+    async def run(self, host: str, port: int, timeout: float):
+        reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        self.writer.write(
+            f"GET /api/devices/stream HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+        buf = b""
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            buf += data
+            while b"\n\n" in buf:
+                frame, buf = buf.split(b"\n\n", 1)
+                for line in frame.split(b"\n"):
+                    if line.startswith(b"id: "):
+                        self.last_seq = int(line[4:])
+                        self.connected = True
+                        self.seen.set()
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+async def http_post(host: str, port: int, path: str, payload: dict) -> float:
+    body = json.dumps(payload).encode()
+    t0 = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    await reader.read()
+    writer.close()
+    return (time.perf_counter() - t0) * 1000
+
+
+async def run(url: str, streams: int, commands: int, connect_timeout: float) -> dict:
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    clients = [StreamClient() for _ in range(streams)]
+    tasks = [asyncio.create_task(c.run(host, port, connect_timeout)) for c in clients]
+
+    t0 = time.perf_counter()
+    deadline = t0 + connect_timeout
+    while time.perf_counter() < deadline and sum(c.connected for c in clients) < streams:
+        await asyncio.sleep(0.05)
+    connected = [c for c in clients if c.connected]
+    connect_s = time.perf_counter() - t0
+
+    latencies, fanout = [], []
+    for i in range(commands):
+        for c in connected:
+            c.seen.clear()
+        sent = time.perf_counter()
+        latencies.append(await http_post(host, port, "/api/text_command", {"text": COMMANDS[i % len(COMMANDS)]}))
+        waits = [asyncio.wait_for(c.seen.wait(), 5) for c in connected]
+        results = await asyncio.gather(*waits, return_exceptions=True)
+        if all(r is True for r in results):
+            fanout.append((time.perf_counter() - sent) * 1000)
+
+    for c in clients:
+        c.close()
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        "url": url,
+        "streams_requested": streams,
+        "streams_connected": len(connected),
+        "connect_seconds": round(connect_s, 2),
+        "command_latency_ms": percentiles(latencies),
+        "delivered_to_all_ms": percentiles(fanout),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:5000")
+    ap.add_argument("--streams", type=int, default=200)
+    ap.add_argument("--commands", type=int, default=20)
+    ap.add_argument("--connect-timeout", type=float, default=30.0)
+    args = ap.parse_args()
+    result = asyncio.run(run(args.url, args.streams, args.commands, args.connect_timeout))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
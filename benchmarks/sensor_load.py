@@ -0,0 +1,222 @@
+"""Sensor ingestion under N virtual homes x M devices.
+
+Start a server, then:
+
+    python app.py
+    python -m benchmarks.sensor_load --url http://127.0.0.1:5000 --homes 100 --devices 20 --duration 30
+
+Every home is a household of its own ("sim007") with a hub that reports all
+of its devices in one POST /api/sensors/batch?home=... every `--period`
+seconds (start times are spread over the period). Each device is its own
+room ("s03", registered as a thermometer before the run, since readings for
+rooms a home does not know are rejected) with a temperature and a humidity
+reading. Meanwhile
+`--streams` SSE clients listen on /api/devices/stream?home=... of the first
+homes; for every temperature that shows up in a delta the client looks up
+when that value was sent, which gives the broadcast lag as a dashboard sees
+it (values the server coalesced away are never matched).
+Ingest and memory numbers come from /api/sensors/ingest before and after.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.load_streams import percentiles
+
+
+async def http_request(host: str, port: int, method: str, path: str, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    t0 = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, data = raw.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1]) if head else 0
+    return status, data, (time.perf_counter() - t0) * 1000
+
+
+class LagProbe:
+    """SSE client matching temperatures in deltas against their send times."""
+
+    def __init__(self, home: str, sent: dict):
+        self.home = home
+        self.sent = sent
+        self.lag_ms = []
+        self.frames = 0
+        self.connected = asyncio.Event()
+        self.writer = None
+
+    async def run(self, host: str, port: int):
+        reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(
+            f"GET /api/devices/stream?home={self.home} HTTP/1.1\r\nHost: {host}\r\n"
+            "Accept: text/event-stream\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+        buf = b""
+        while True:
+            data = await reader.read(262144)
+            if not data:
+                return
+            buf += data
+            while b"\n\n" in buf:
+                frame, buf = buf.split(b"\n\n", 1)
+                self.connected.set()
+                self._on_frame(frame)
+
+    def _on_frame(self, frame: bytes):
+        if b"event: delta" not in frame:
+            return
+        now = time.perf_counter()
+        self.frames += 1
+        for line in frame.split(b"\n"):
+            if not line.startswith(b"data: "):
+                continue
+            for op in json.loads(line[6:]).get("ops", []):
+                section, room = op["path"]
+                if section != "thermometers" or op["op"] != "put":
+                    continue
+                sent_at = self.sent.get((self.home, room, op["value"].get("temperature")))
+                if sent_at is not None:
+                    self.lag_ms.append((now - sent_at) * 1000)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+class Home:
+    def __init__(self, index: int, devices: int, sent: dict):
+        self.home = home_id(index)
+        self.rooms = [f"s{d:02d}" for d in range(devices)]
+        self.sent = sent
+        self.posts = 0
+        self.readings = 0
+        self.accepted = 0
+        self.errors = 0
+        self.latency_ms = []
+
+    async def install(self, host: str, port: int, limit: asyncio.Semaphore):
+        for room in self.rooms:
+            async with limit:
+                # 409 on a second run: the thermometer is already there
+                await http_request(
+                    host, port, "POST", f"/api/devices?home={self.home}",
+                    {"name": f"thermometer:{room}", "room": room, "type": "thermometer"},
+                )
+
+    async def run(self, host: str, port: int, period: float, until: float, limit: asyncio.Semaphore):
+        await asyncio.sleep(random.uniform(0, period))
+        while time.perf_counter() < until:
+            started = time.perf_counter()
+            readings = []
+            for room in self.rooms:
+                temperature = round(random.uniform(18, 28), 2)
+                readings.append({"room": room, "temperature": temperature, "humidity": round(random.uniform(30, 70), 1)})
+                self.sent[(self.home, room, temperature)] = started
+            async with limit:
+                try:
+                    status, body, ms = await http_request(
+                        host, port, "POST", f"/api/sensors/batch?home={self.home}", {"readings": readings}
+                    )
+                except OSError:
+                    status, body, ms = 0, b"", 0.0
+            self.posts += 1
+            self.readings += 2 * len(readings)  # temperature + humidity
+            if status == 202:
+                self.accepted += json.loads(body)["accepted"]
+                self.latency_ms.append(ms)
+            else:
+                self.errors += 1
+            await asyncio.sleep(max(0.0, period - (time.perf_counter() - started)))
+
+
+def home_id(index: int) -> str:
+    return f"sim{index:03d}"
+
+
+async def ingest_stats(host: str, port: int) -> dict:
+    status, body, _ms = await http_request(host, port, "GET", "/api/sensors/ingest")
+    return json.loads(body) if status == 200 else {}
+
+
+async def run(url: str, homes: int, devices: int, period: float, duration: float, streams: int, concurrency: int) -> dict:
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    sent: dict = {}
+    before = await ingest_stats(host, port)
+
+    for i in range(min(streams, homes)):
+        # streams of a home nobody created yet are a 404
+        await http_request(host, port, "POST", f"/api/homes?home={home_id(i)}")
+    probes = [LagProbe(home_id(i % homes), sent) for i in range(streams)]
+    probe_tasks = [asyncio.create_task(p.run(host, port)) for p in probes]
+    await asyncio.wait_for(asyncio.gather(*(p.connected.wait() for p in probes)), 30)
+
+    limit = asyncio.Semaphore(concurrency)
+    fleet = [Home(i, devices, sent) for i in range(homes)]
+    await asyncio.gather(*(h.install(host, port, limit) for h in fleet))
+    t0 = time.perf_counter()
+    await asyncio.gather(*(h.run(host, port, period, t0 + duration, limit) for h in fleet))
+    elapsed = time.perf_counter() - t0
+    await asyncio.sleep(1.0)  # let the last broadcast arrive
+
+    after = await ingest_stats(host, port)
+    for p in probes:
+        p.close()
+    for t in probe_tasks:
+        t.cancel()
+    await asyncio.gather(*probe_tasks, return_exceptions=True)
+
+    accepted = sum(h.accepted for h in fleet)
+    ingest_before, ingest_after = before.get("ingest", {}), after.get("ingest", {})
+    broadcasts = ingest_after.get("broadcasts", 0) - ingest_before.get("broadcasts", 0)
+    return {
+        "url": url,
+        "homes": homes,
+        "devices_per_home": devices,
+        "period_s": period,
+        "seconds": round(elapsed, 2),
+        "posts": sum(h.posts for h in fleet),
+        "post_errors": sum(h.errors for h in fleet),
+        "readings_sent": sum(h.readings for h in fleet),
+        "readings_accepted": accepted,
+        "ingest_readings_per_s": round(accepted / elapsed, 1),
+        "post_latency_ms": percentiles([ms for h in fleet for ms in h.latency_ms]),
+        "broadcasts": broadcasts,
+        "broadcasts_per_s": round(broadcasts / elapsed, 2),
+        "delta_frames_per_stream": round(sum(p.frames for p in probes) / max(1, streams), 1),
+        "broadcast_lag_ms": percentiles([ms for p in probes for ms in p.lag_ms]),
+        "server_broadcast_lag_ms": ingest_after.get("broadcast_lag_ms"),
+        "memory_before": before.get("memory"),
+        "memory_after": after.get("memory"),
+        "telemetry_series": after.get("telemetry", {}).get("series"),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:5000")
+    ap.add_argument("--homes", type=int, default=50)
+    ap.add_argument("--devices", type=int, default=20, help="devices per home")
+    ap.add_argument("--period", type=float, default=1.0, help="seconds between reports of one home")
+    ap.add_argument("--duration", type=float, default=20.0)
+    ap.add_argument("--streams", type=int, default=2, help="SSE clients measuring broadcast lag (one per home)")
+    ap.add_argument("--concurrency", type=int, default=32, help="max POSTs in flight")
+    args = ap.parse_args()
+    result = asyncio.run(run(
+        args.url, args.homes, args.devices, args.period, args.duration, args.streams, args.concurrency,
+    ))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
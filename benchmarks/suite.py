@@ -0,0 +1,547 @@
+"""The whole command pipeline, scenario by scenario, as one JSON document.
+
+    python -m benchmarks.suite --out benchmarks/results/$(git rev-parse --short HEAD).json
+    python -m benchmarks.suite --scenarios parse,db,snapshot          # in-process only, no server
+    python -m benchmarks.suite --url http://127.0.0.1:5000 --scenarios fanout
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+
+Scenarios:
+
+    parse     parse_command on the phrase corpus (single commands, and scenes /
+              several commands in one phrase): parses per second, per-phrase latency
+    db        backend/db.py against a fresh SQLite file: reads, single-device
+              writes and 20-device transactions per second
+    snapshot  StateStore with 10 ... 10000 devices: snapshot serialization
+              cost and size, cached snapshot frame, one- and twenty-change deltas
+    fanout    scripted SSE clients on /api/devices/stream, 1 ... 500 of them:
+              text command -> delta on every stream
+    e2e       text command -> response -> delta, and speech upload -> action
+              for synthetic clips, benchmarks/data/recorded/* and --clips files;
+              per-stage server timings come from /api/metrics
+
+fanout and e2e need a server: without --url one is started from app.py on a
+free port with an empty database in a temporary directory (--server asgi
+starts asgi.py instead). The speech part waits for the Whisper model and is
+reported as skipped if it does not load. Every speech clip is sent once as a
+new file (dithered, so the transcript cache cannot answer) and once more as
+the same bytes (a cache hit).
+
+The output carries the commit, Python version and machine, so runs from
+different commits can be compared with benchmarks.compare.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from benchmarks.bench_parse_command import CORPUS, load_corpus, parses_per_sec
+from benchmarks.load_streams import percentiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MULTI_CORPUS = os.path.join(os.path.dirname(__file__), "data", "commands_multi_ru.txt")
+SCENARIOS = ("parse", "db", "snapshot", "fanout", "e2e")
+SERVER_SCENARIOS = ("fanout", "e2e")
+TOGGLE = ("включи свет на кухне", "выключи свет на кухне")
+
+
+def timed(fn, seconds: float) -> dict:
+    """Call fn() repeatedly for `seconds`: calls per second and per-call latency in microseconds."""
+    samples = []
+    t0 = time.perf_counter()
+    deadline = t0 + seconds
+    while True:
+        start = time.perf_counter()
+        fn()
+        end = time.perf_counter()
+        samples.append((end - start) * 1e6)
+        if end >= deadline:
+            break
+    return {"ops_per_sec": round(len(samples) / (end - t0)), "latency_us": percentiles(samples)}
+
+
+# in-process scenarios
+
+
+def bench_parse(seconds: float) -> dict:
+    from backend.command_parser import parse_command
+
+    result = {}
+    for name, path in (("single", CORPUS), ("multi", MULTI_CORPUS)):
+        corpus = load_corpus(path)
+        samples = []
+        for _ in range(20):
+            for text in corpus:
+                t0 = time.perf_counter()
+                parse_command(text)
+                samples.append((time.perf_counter() - t0) * 1e6)
+        result[name] = {
+            "phrases": len(corpus),
+            "parses_per_sec": round(parses_per_sec(parse_command, corpus, seconds)),
+            "latency_us": percentiles(samples),
+        }
+    return result
+
+
+def bench_db(seconds: float, devices: int) -> dict:
+    from backend import db
+
+    tmp = tempfile.mkdtemp(prefix="bench-db-")
+    saved = db.DB_PATH
+    db.close_all()
+    db.DB_PATH = os.path.join(tmp, "bench.sqlite3")
+    try:
+        db.init_db()
+        home = "bench"
+        rooms = [f"r{i:05d}" for i in range(devices)]
+        db.create_many(({"name": f"light:{room}", "room": room, "type": "light"} for room in rooms), home)
+        state = {"n": 0}
+
+        def toggle():
+            state["n"] += 1
+            db.ensure_device(rooms[state["n"] % devices], "light", state["n"] % 2 == 0, home=home)
+
+        def toggle_many():
+            state["n"] += 1
+            start = state["n"] * 20 % devices
+            db.ensure_many([(room, "light", state["n"] % 2 == 0) for room in rooms[start:start + 20]], home)
+
+        result = {
+            "devices": devices,
+            "get_device_by_room_and_type": timed(
+                lambda: db.get_device_by_room_and_type(rooms[len(rooms) // 2], "light", home), seconds,
+            ),
+            "ensure_device_write": timed(toggle, seconds),
+            "ensure_many_20_write": timed(toggle_many, seconds),
+            "list_devices": timed(lambda: db.list_devices(home), seconds),
+        }
+        result["ensure_many_20_write"]["devices_per_sec"] = result["ensure_many_20_write"]["ops_per_sec"] * 20
+        return result
+    finally:
+        db.close_all()
+        db.DB_PATH = saved
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_snapshot(counts, repeat: int) -> dict:
+    from backend.state_store import StateStore
+
+    result = {}
+    for n in counts:
+        rooms = [f"r{i:05d}" for i in range(n)]
+        snapshot = {
+            "lights": {room: False for room in rooms},
+            "thermometers": {room: {"temperature": 21.5, "humidity": 40.0} for room in rooms[:min(n, 100)]},
+            "devices": [
+                {"id": i + 1, "name": f"light:{room}", "room": room, "type": "light", "is_on": False}
+                for i, room in enumerate(rooms)
+            ],
+        }
+        store = StateStore()
+        store.reset(snapshot)
+        serialize, cached, one, twenty = [], [], [], []
+        size = 0
+        for r in range(repeat):
+            t0 = time.perf_counter()
+            store.apply([("lights", rooms[r % n], r % 2 == 0)])
+            t1 = time.perf_counter()
+            _seq, frame = store.snapshot_frame()
+            t2 = time.perf_counter()
+            store.snapshot_frame()
+            t3 = time.perf_counter()
+            store.apply([("lights", room, r % 2 == 1) for room in rooms[:20]])
+            t4 = time.perf_counter()
+            one.append((t1 - t0) * 1000)
+            serialize.append((t2 - t1) * 1000)
+            cached.append((t3 - t2) * 1000)
+            twenty.append((t4 - t3) * 1000)
+            size = len(frame.encode())
+        result[str(n)] = {
+            "snapshot_bytes": size,
+            "snapshot_serialize_ms": round(statistics.median(serialize), 4),
+            "snapshot_cached_ms": round(statistics.median(cached), 4),
+            "delta_1_change_ms": round(statistics.median(one), 4),
+            "delta_20_changes_ms": round(statistics.median(twenty), 4),
+        }
+    return result
+
+
+# server scenarios
+
+
+class Server:
+    """The server under test: the one at --url, or app.py / asgi.py started on a free port."""
+
+    def __init__(self, url=None, kind: str = "app", preload: bool = False):
+        self.url = url
+        self.kind = kind
+        self.preload = preload
+        self.proc = None
+        self.tmp = None
+        self.log = None
+
+    def __enter__(self) -> "Server":
+        if self.url:
+            return self
+        self.tmp = tempfile.mkdtemp(prefix="bench-server-")
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        env = dict(os.environ, DEVICES_DB=os.path.join(self.tmp, "devices.sqlite3"), HOST="127.0.0.1", PORT=str(port))
+        env.setdefault("STREAM_ENABLED", "0")
+        env.setdefault("CLASSIFIER_TRAINING", "0")
+        env.setdefault("WHISPER_PRELOAD", "1" if self.preload else "0")
+        if self.kind == "asgi":
+            cmd = [sys.executable, "asgi.py"]
+        else:
+            cmd = [sys.executable, "-c", "import sys, app; app.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)", str(port)]
+        self.log = open(os.path.join(self.tmp, "server.log"), "wb")
+        self.proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+        self.url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                break
+            try:
+                status, _body, _ms = asyncio.run(request(self.url, "GET", "/api/health"))
+                if status == 200:
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.2)
+        tail = self.tail()
+        self.__exit__(None, None, None)
+        raise RuntimeError(f"server did not start:\n{tail}")
+
+    def tail(self, lines: int = 20) -> str:
+        if not self.tmp:
+            return ""
+        with open(os.path.join(self.tmp, "server.log"), "rb") as f:
+            return b"\n".join(f.read().splitlines()[-lines:]).decode(errors="replace")
+
+    def __exit__(self, *exc) -> None:
+        if self.proc is not None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+            self.proc = None
+        if self.log is not None:
+            self.log.close()
+        if self.tmp:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+async def request(url: str, method: str, path: str, body: bytes = b"", content_type: str = "application/json"):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    t0 = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, data = raw.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1]) if head else 0
+    return status, data, (time.perf_counter() - t0) * 1000
+
+
+async def get_json(url: str, path: str) -> dict:
+    status, body, _ms = await request(url, "GET", path)
+    return json.loads(body) if status == 200 else {}
+
+
+async def post_json(url: str, path: str, payload: dict):
+    status, body, ms = await request(url, "POST", path, json.dumps(payload).encode())
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = {}
+    return status, data, ms
+
+
+async def post_audio(url: str, path: str, name: str, data: bytes):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"audio\"; filename=\"{name}\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n".encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    )
+    status, raw, ms = await request(url, "POST", path, body, f"multipart/form-data; boundary={boundary}")
+    try:
+        payload = json.loads(raw)
+    except ValueError:
+        payload = {}
+    return status, payload, ms
+
+
+class SSEClient:
+    """A dashboard stream: remembers when each frame (by seq) arrived."""
+
+    def __init__(self, home: str):
+        self.home = home
+        self.seq = 0
+        self.arrived = []  # (seq, perf_counter)
+        self.frame = asyncio.Event()
+        self.writer = None
+
+    async def run(self, url: str) -> None:
+        parts = urlsplit(url)
+        reader, self.writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        self.writer.write(
+            f"GET /api/devices/stream?home={self.home} HTTP/1.1\r\nHost: {parts.hostname}\r\n"
+            "Accept: text/event-stream\r\n\r\n".encode()
+        )
+        await self.writer.drain()
+        buf = b""
+        while True:
+            data = await reader.read(262144)
+            if not data:
+                return
+            buf += data
+            while b"\n\n" in buf:
+                chunk, buf = buf.split(b"\n\n", 1)
+                for line in chunk.split(b"\n"):
+                    if line.startswith(b"id: "):
+                        self.seq = int(line[4:])
+                        self.arrived.append((self.seq, time.perf_counter()))
+                        self.frame.set()
+
+    async def after(self, seq: int, timeout: float):
+        """When the first frame past seq arrived, or None after timeout."""
+        deadline = time.perf_counter() + timeout
+        while self.seq <= seq:
+            self.frame.clear()
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                return None
+            try:
+                await asyncio.wait_for(self.frame.wait(), left)
+            except asyncio.TimeoutError:
+                return None
+        return next(t for s, t in self.arrived if s > seq)
+
+    def close(self) -> None:
+        if self.writer:
+            self.writer.close()
+
+
+async def open_streams(url: str, home: str, n: int, timeout: float = 30.0):
+    await request(url, "POST", f"/api/homes?home={home}")
+    clients = [SSEClient(home) for _ in range(n)]
+    tasks = [asyncio.create_task(c.run(url)) for c in clients]
+    await asyncio.wait_for(asyncio.gather(*(c.frame.wait() for c in clients)), timeout)
+    return clients, tasks
+
+
+async def prime(url: str, home: str, clients) -> None:
+    # A new home starts with demo devices in random states: switch the light off
+    # once so that every measured TOGGLE command changes something.
+    before = {c: c.seq for c in clients}
+    await post_json(url, f"/api/text_command?home={home}", {"text": TOGGLE[1]})
+    await asyncio.gather(*(c.after(before[c], 1) for c in clients))
+
+
+async def close_streams(clients, tasks) -> None:
+    for c in clients:
+        c.close()
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def bench_fanout(url: str, levels, commands: int) -> dict:
+    result = {}
+    for n in levels:
+        home = f"bench-fanout-{n}-{uuid.uuid4().hex[:6]}"
+        clients, tasks = await open_streams(url, home, n)
+        latency, first, everyone, each = [], [], [], []
+        missed = 0
+        try:
+            await prime(url, home, clients)
+            for i in range(commands):
+                before = {c: c.seq for c in clients}
+                sent = time.perf_counter()
+                status, _data, ms = await post_json(url, f"/api/text_command?home={home}", {"text": TOGGLE[i % 2]})
+                latency.append(ms)
+                arrived = await asyncio.gather(*(c.after(before[c], 10) for c in clients))
+                delivered = [(t - sent) * 1000 for t in arrived if t is not None]
+                missed += len(arrived) - len(delivered)
+                if delivered:
+                    first.append(min(delivered))
+                    each.extend(delivered)
+                if len(delivered) == len(clients):
+                    everyone.append(max(delivered))
+        finally:
+            await close_streams(clients, tasks)
+        result[str(n)] = {
+            "command_ms": percentiles(latency),
+            "first_delivery_ms": percentiles(first),
+            "all_delivered_ms": percentiles(everyone),
+            "per_stream_delivery_ms": percentiles(each),
+            "missed_deliveries": missed,
+        }
+    health = await get_json(url, "/api/health")
+    return {"broadcast_window_ms": health.get("broadcast", {}).get("window_ms"), "subscribers": result}
+
+
+async def bench_e2e(url: str, commands: int, clips, repeat: int, model_timeout: float) -> dict:
+    from benchmarks.clips import dithered
+
+    home = f"bench-e2e-{uuid.uuid4().hex[:6]}"
+    clients, tasks = await open_streams(url, home, 1)
+    stream = clients[0]
+    try:
+        await prime(url, home, clients)
+        text = {"command_ms": [], "delta_ms": []}
+        for i in range(commands):
+            before = stream.seq
+            sent = time.perf_counter()
+            _status, _data, ms = await post_json(url, f"/api/text_command?home={home}", {"text": TOGGLE[i % 2]})
+            text["command_ms"].append(ms)
+            arrived = await stream.after(before, 5)
+            if arrived is not None:
+                text["delta_ms"].append((arrived - sent) * 1000)
+        result = {"text": {key: percentiles(values) for key, values in text.items()}}
+        result["speech"] = await _speech(url, home, stream, clips, repeat, model_timeout, dithered)
+    finally:
+        await close_streams(clients, tasks)
+    return result
+
+
+async def _speech(url, home, stream, clips, repeat, model_timeout, dithered) -> dict:
+    deadline = time.monotonic() + model_timeout
+    health = await get_json(url, "/api/health")
+    while not health.get("ready") and time.monotonic() < deadline and not health.get("recognizer", {}).get("error"):
+        await asyncio.sleep(1)
+        health = await get_json(url, "/api/health")
+    if not health.get("ready"):
+        return {"skipped": health.get("recognizer", {}).get("error") or "модель распознавания не загрузилась"}
+
+    result = {}
+    for name, data in clips:
+        new, cached, delta, statuses, texts = [], [], [], {}, set()
+        for r in range(repeat):
+            fresh = dithered(data, seed=r)
+            for bucket, body in ((new, fresh), (cached, fresh)):
+                before = stream.seq
+                sent = time.perf_counter()
+                status, payload, ms = await post_audio(url, f"/api/speech_to_action?home={home}", "clip.wav", body)
+                bucket.append(ms)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status == 200:
+                    texts.add(payload.get("text", ""))
+                    if payload.get("parsed", {}).get("action") not in (None, "unknown"):
+                        # only commands that change something produce a delta
+                        arrived = await stream.after(before, 1)
+                        if arrived is not None:
+                            delta.append((arrived - sent) * 1000)
+        result[name] = {
+            "bytes": len(data),
+            "statuses": statuses,
+            "texts": sorted(texts),
+            "new_file_ms": percentiles(new),
+            "cached_ms": percentiles(cached),
+            "to_delta_ms": percentiles(delta),
+        }
+    return result
+
+
+async def run_server_scenarios(url: str, scenarios, args, clips) -> dict:
+    result = {}
+    if "fanout" in scenarios:
+        result["fanout"] = await bench_fanout(url, args.subscribers, args.commands)
+    if "e2e" in scenarios:
+        result["e2e"] = await bench_e2e(url, args.commands, clips, args.repeat, args.model_timeout)
+    metrics = await get_json(url, "/api/metrics?format=json")
+    # server-side view of the same run, per stage (upload, decode, parse, apply, db, broadcast_*)
+    result["server_stages"] = {
+        key.split("=", 1)[-1]: value for key, value in metrics.get("histograms", {}).get("stage_seconds", {}).items()
+    }
+    return result
+
+
+def meta(args) -> dict:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=ROOT, capture_output=True, text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k != "out"},
+    }
+
+
+def _ints(text: str):
+    return [int(x) for x in text.split(",") if x]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated: {','.join(SCENARIOS)}")
+    ap.add_argument("--out", help="write the JSON here instead of stdout")
+    ap.add_argument("--seconds", type=float, default=1.0, help="time per throughput measurement")
+    ap.add_argument("--devices", type=int, default=1000, help="devices in the db scenario")
+    ap.add_argument("--snapshot-devices", type=_ints, default=[10, 100, 1000, 10000])
+    ap.add_argument("--subscribers", type=_ints, default=[1, 10, 100, 500])
+    ap.add_argument("--commands", type=int, default=20, help="text commands per fanout level / in e2e")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--clips", nargs="*", default=[], help="extra audio files for e2e")
+    ap.add_argument("--url", help="use a running server instead of starting one")
+    ap.add_argument("--server", choices=("app", "asgi"), default="app")
+    ap.add_argument("--model-timeout", type=float, default=300.0, help="seconds to wait for the Whisper model")
+    args = ap.parse_args()
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    result = {"meta": meta(args), "scenarios": {}}
+    out = result["scenarios"]
+    if "parse" in scenarios:
+        out["parse"] = bench_parse(args.seconds)
+    if "db" in scenarios:
+        out["db"] = bench_db(args.seconds, args.devices)
+    if "snapshot" in scenarios:
+        out["snapshot"] = bench_snapshot(args.snapshot_devices, args.repeat * 4)
+    if any(s in scenarios for s in SERVER_SCENARIOS):
+        clips = []
+        if "e2e" in scenarios:
+            from benchmarks.clips import load_clips, make_clips, recorded_clips
+
+            clips = make_clips((1.0, 3.0)) + recorded_clips() + load_clips(args.clips)
+        with Server(args.url, args.server, preload="e2e" in scenarios) as server:
+            result["meta"]["server"] = server.url if args.url else args.server
+            out.update(asyncio.run(run_server_scenarios(server.url, scenarios, args, clips)))
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -34,52 +34,159 @@ document.addEventListener('DOMContentLoaded', function() {
     function loadStatus() {
         fetch('/api/devices')
         .then(response => response.json())
-        .then(data => {
-            if (data.devices && data.devices.length > 0) {
+        .then(data => renderStatus(data.devices))
+        .catch(error => {
+            deviceStatusP.textContent = 'Ошибка загрузки статуса';
+        });
+    }
 
-                const rooms = {};
-                data.devices.forEach(dev => {
-                    const room = dev.room || 'без комнаты';
-                    if (!rooms[room]) rooms[room] = {};
-                    rooms[room][dev.type] = dev;
-                });
+    function renderStatus(devices) {
+        if (devices && devices.length > 0) {
 
-                let thermometers = window.lastThermometers || {};
+            const rooms = {};
+            devices.forEach(dev => {
+                const room = dev.room || 'без комнаты';
+                if (!rooms[room]) rooms[room] = {};
+                rooms[room][dev.type] = dev;
+            });
+
+            let thermometers = window.lastThermometers || {};
+
+            deviceStatusP.innerHTML = Object.keys(rooms).map(room => {
+                let light = rooms[room].light ? (rooms[room].light.is_on ? 'включен' : 'выключен') : '-';
+
+                let temp = '-';
+                let hum = '-';
+                if (thermometers[room]) {
+                    temp = thermometers[room].temperature + '°C';
+                    hum = thermometers[room].humidity + '💧';
+                }
+                return `<b>${room}</b><br>Свет: ${light}<br>Температура: ${temp}<br>Влажность: ${hum}<br>`;
+            }).join('<hr>');
+        } else {
+            deviceStatusP.textContent = 'Нет устройств';
+        }
+    }
 
-                deviceStatusP.innerHTML = Object.keys(rooms).map(room => {
-                    let light = rooms[room].light ? (rooms[room].light.is_on ? 'включен' : 'выключен') : '-';
+    // Live state: a full snapshot first, then deltas ({seq, ops: [{op, path: [section, key], value}], events?}).
+    // EventSource resends the last id on reconnect, so the server only replays what we missed.
+    let liveState = null;
 
-                    let temp = '-';
-                    let hum = '-';
-                    if (thermometers[room]) {
-                        temp = thermometers[room].temperature + '°C';
-                        hum = thermometers[room].humidity + '💧';
-                    }
-                    return `<b>${room}</b><br>Свет: ${light}<br>Температура: ${temp}<br>Влажность: ${hum}<br>`;
-                }).join('<hr>');
+    function applyDelta(state, delta) {
+        delta.ops.forEach(op => {
+            const [section, key] = op.path;
+            if (section === 'devices' || section === 'timers') {
+                // lists of {id, ...}
+                const list = state[section] = state[section] || [];
+                const idx = list.findIndex(d => d.id === key);
+                if (op.op === 'del') {
+                    if (idx >= 0) list.splice(idx, 1);
+                } else if (idx >= 0) {
+                    list[idx] = op.value;
+                } else {
+                    list.push(op.value);
+                }
             } else {
-                deviceStatusP.textContent = 'Нет устройств';
+                state[section] = state[section] || {};
+                if (op.op === 'del') delete state[section][key];
+                else state[section][key] = op.value;
             }
-        })
-        .catch(error => {
-            deviceStatusP.textContent = 'Ошибка загрузки статуса';
         });
     }
 
+    function renderLive() {
+        window.lastThermometers = liveState.thermometers || {};
+        renderStatus(liveState.devices);
+    }
+
     if (typeof EventSource !== 'undefined') {
         const sse = new EventSource('/api/devices/stream');
-        sse.onmessage = (e) => {
+        sse.addEventListener('snapshot', (e) => {
             try {
-                const state = JSON.parse(e.data);
-                window.lastThermometers = state.thermometers || {};
-                loadStatus();
+                liveState = JSON.parse(e.data);
+                renderLive();
             } catch (err) {}
-        };
+        });
+        sse.addEventListener('delta', (e) => {
+            if (!liveState) return;
+            try {
+                const delta = JSON.parse(e.data);
+                applyDelta(liveState, delta);
+                renderLive();
+                (delta.events || []).forEach(ev => {
+                    if (ev.type === 'timer') responseP.textContent = '⏰ ' + (ev.label || 'Таймер сработал');
+                });
+            } catch (err) {}
+        });
     }
 
-    let mediaRecorder, chunks = [], blob = null, isRecording = false;
+    let mediaRecorder, chunks = [], blob = null, isRecording = false, speechSocket = null;
     const voiceRecordBtn = document.getElementById('voice-record');
     const voiceOut = document.getElementById('voice-out');
+    const STREAM_PORT = window.SPEECH_STREAM_PORT || 5001;
+
+    function speechSocketUrls() {
+        // asgi.py serves the stream on the same origin; app.py runs it on a separate port.
+        const proto = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        return [`${proto}//${location.host}/ws/speech`, `${proto}//${location.hostname}:${STREAM_PORT}/speech`];
+    }
+
+    function tryOpenSocket(url, mime) {
+        // Resolves with an open socket, or null if nothing answers at url.
+        return new Promise(resolve => {
+            let ws;
+            try {
+                ws = new WebSocket(url);
+            } catch (err) {
+                resolve(null);
+                return;
+            }
+            const timer = setTimeout(() => { ws.close(); resolve(null); }, 1500);
+            ws.onopen = () => {
+                clearTimeout(timer);
+                ws.send(JSON.stringify({ type: 'start', format: mime.includes('ogg') ? 'ogg' : 'webm', language: 'ru-RU' }));
+                resolve(ws);
+            };
+            ws.onerror = () => { clearTimeout(timer); resolve(null); };
+        });
+    }
+
+    async function openSpeechSocket(mime) {
+        for (const url of speechSocketUrls()) {
+            const ws = await tryOpenSocket(url, mime);
+            if (ws) return ws;
+        }
+        return null;
+    }
+
+    function finishVoice() {
+        voiceRecordBtn.textContent = 'Записать голосовую команду';
+        isRecording = false;
+    }
+
+    async function sendRecording() {
+        blob = new Blob(chunks, { type: (chunks[0] && chunks[0].type) || blob?.type || 'audio/webm' });
+
+        const mime = blob.type || '';
+        let ext = 'webm';
+        if (mime.includes('ogg')) ext = 'ogg';
+        else if (mime.includes('wav')) ext = 'wav';
+        else if (mime.includes('mp4')) ext = 'm4a';
+        else if (mime.includes('aac')) ext = 'aac';
+        else if (mime.includes('mp3')) ext = 'mp3';
+
+        const fileBlob = new File([blob], `recording.${ext}`, { type: mime || `audio/${ext}` });
+        const form = new FormData();
+        form.append('audio', fileBlob);
+        const res = await fetch('/api/speech_to_action', {
+            method: 'POST',
+            body: form
+        });
+        let json;
+        try { json = await res.json(); } catch(e) { json = { error: 'Не удалось распарсить ответ сервера' }; }
+        voiceOut.textContent = JSON.stringify(json, null, 2);
+        finishVoice();
+    }
 
     async function startVoiceRecording() {
         if (isRecording) return;
@@ -101,32 +208,42 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         mediaRecorder = new MediaRecorder(stream);
         chunks = [];
-        mediaRecorder.ondataavailable = e => chunks.push(e.data);
-        mediaRecorder.onstop = async () => {
-            blob = new Blob(chunks, { type: (chunks[0] && chunks[0].type) || blob?.type || 'audio/webm' });
-
-            const mime = blob.type || '';
-            let ext = 'webm';
-            if (mime.includes('ogg')) ext = 'ogg';
-            else if (mime.includes('wav')) ext = 'wav';
-            else if (mime.includes('mp4')) ext = 'm4a';
-            else if (mime.includes('aac')) ext = 'aac';
-            else if (mime.includes('mp3')) ext = 'mp3';
-
-            const fileBlob = new File([blob], `recording.${ext}`, { type: mime || `audio/${ext}` });
-            const form = new FormData();
-            form.append('audio', fileBlob);
-            const res = await fetch('/api/speech_to_action', {
-                method: 'POST',
-                body: form
-            });
-            let json;
-            try { json = await res.json(); } catch(e) { json = { error: 'Не удалось распарсить ответ сервера' }; }
-            voiceOut.textContent = JSON.stringify(json, null, 2);
-            voiceRecordBtn.textContent = 'Записать голосовую команду';
-            isRecording = false;
-        };
-        mediaRecorder.start();
+        speechSocket = await openSpeechSocket(mediaRecorder.mimeType || '');
+
+        if (speechSocket) {
+            // Streaming mode: chunks go out while the user is still talking.
+            const ws = speechSocket;
+            ws.onmessage = (e) => {
+                let msg;
+                try { msg = JSON.parse(e.data); } catch (err) { return; }
+                if (msg.type === 'partial') {
+                    voiceOut.textContent = msg.text + ' …';
+                } else if (msg.type === 'result') {
+                    voiceOut.textContent = JSON.stringify({ text: msg.text, parsed: msg.parsed, response: msg.response }, null, 2);
+                    if (isRecording) stopVoiceRecording();
+                } else if (msg.type === 'error') {
+                    voiceOut.textContent = JSON.stringify({ error: msg.error }, null, 2);
+                }
+            };
+            ws.onclose = () => { if (speechSocket === ws) speechSocket = null; };
+            mediaRecorder.ondataavailable = e => {
+                chunks.push(e.data);
+                if (ws.readyState === WebSocket.OPEN) ws.send(e.data);
+            };
+            mediaRecorder.onstop = () => {
+                stream.getTracks().forEach(track => track.stop());
+                if (ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ type: 'stop' }));
+                finishVoice();
+            };
+            mediaRecorder.start(250);
+        } else {
+            mediaRecorder.ondataavailable = e => chunks.push(e.data);
+            mediaRecorder.onstop = () => {
+                stream.getTracks().forEach(track => track.stop());
+                sendRecording();
+            };
+            mediaRecorder.start();
+        }
         voiceRecordBtn.textContent = 'Идет запись... Нажмите снова, чтобы отправить';
         isRecording = true;
     }
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import db  # noqa: E402
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """Point backend.db at an empty database in tmp_path, never at the tracked one."""
+    db.close_all()
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "devices.sqlite3"))
+    yield db
+    db.close_all()
@@ -0,0 +1,84 @@
+import pytest
+
+from backend.command_parser import extract_rooms, is_complete, normalize, parse_command
+
+
+def _on(room):
+    return {"action": "turn_on_light", "params": {"room": room}}
+
+
+def _off(room):
+    return {"action": "turn_off_light", "params": {"room": room}}
+
+
+@pytest.mark.parametrize("text, action, params", [
+    ("включи свет на кухне", "turn_on_light", {"room": "кухня"}),
+    ("Выключи свет в спальне", "turn_off_light", {"room": "спальня"}),
+    ("поставь температуру 23 в зале", "set_temperature", {"room": "зал", "value": 23}),
+    ("поставь влажность 40 в спальне", "set_humidity", {"room": "спальня", "value": 40}),
+    ("сделай громкость 30", "set_volume", {"value": 30}),
+    ("открой браузер", "open_app", {"target": "браузер"}),
+    ("спокойной ночи", "run_scene", {"scene": "night"}),
+    ("абракадабра", "unknown", {}),
+])
+def test_single_command(text, action, params):
+    parsed = parse_command(text)
+    assert parsed["action"] == action
+    assert parsed["params"] == params
+    assert parsed["raw"] == text
+
+
+@pytest.mark.parametrize("text, actions", [
+    # a verb-only clause borrows the object of the previous clause, never its verb
+    ("включи свет в зале и выключи на кухне", [_on("зал"), _off("кухня")]),
+    ("включи свет в зале и выключи", [_on("зал"), _off("зал")]),
+    ("Включи свет на кухне, затем выключи в спальне", [_on("кухня"), _off("спальня")]),
+    ("выключи свет в зале и поставь температуру 20", [
+        _off("зал"),
+        {"action": "set_temperature", "params": {"room": "зал", "value": 20}},
+    ]),
+    ("включи свет в зале а потом поставь таймер на 10 минут", [
+        _on("зал"),
+        {"action": "set_timer", "params": {"value": 10, "unit": "минут"}},
+    ]),
+    ("включи свет в зале и открой браузер", [
+        _on("зал"),
+        {"action": "open_app", "params": {"target": "браузер"}},
+    ]),
+])
+def test_multiple_commands(text, actions):
+    parsed = parse_command(text)
+    assert parsed["action"] == "multiple"
+    assert parsed["params"]["actions"] == actions
+    assert is_complete(parsed)
+
+
+def test_second_room_joins_the_same_command():
+    parsed = parse_command("включи свет на кухне и в зале")
+    assert parsed["action"] == "turn_on_light"
+    assert parsed["params"]["rooms"] == ["кухня", "зал"]
+
+
+def test_clause_without_an_object_is_dropped():
+    assert parse_command("включи свет в зале и открой")["params"] == {"room": "зал"}
+
+
+def test_unresolved_clause_with_a_room_makes_the_command_incomplete():
+    # "включи" has nothing to borrow from a timer: it must not be guessed
+    parsed = parse_command("поставь таймер на 5 минут и включи на кухне")
+    assert parsed["action"] == "multiple"
+    assert [c["action"] for c in parsed["params"]["actions"]] == ["set_timer", "unknown"]
+    assert not is_complete(parsed)
+
+
+@pytest.mark.parametrize("text", ["включи свет", "абракадабра"])
+def test_incomplete(text):
+    assert not is_complete(parse_command(text))
+
+
+def test_extract_rooms_prefers_the_longest_form():
+    assert extract_rooms("в детской комнате и в зале") == ["детская", "зал"]
+
+
+def test_normalize():
+    assert normalize("  Включи  СВЕТ! ") == "включи свет!"
@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from backend.db import DEFAULT_HOME, MIGRATIONS
+
+
+def test_fresh_database(fresh_db):
+    fresh_db.init_db()
+    assert fresh_db.schema_version() == len(MIGRATIONS)
+    fresh_db.init_db()
+    assert fresh_db.schema_version() == len(MIGRATIONS)
+    assert fresh_db.list_devices() == []
+    assert fresh_db.pending_jobs() == []
+
+
+def test_upgrade_keeps_data(fresh_db):
+    # a database as it was before households and the jobs table
+    conn = sqlite3.connect(fresh_db.DB_PATH)
+    for statements in MIGRATIONS[:1]:
+        for sql in statements:
+            conn.execute(sql)
+    conn.executemany("INSERT INTO devices(name, room, type, is_on) VALUES(?,?,?,?)", [
+        ("Свет зал", "зал", "light", 1),
+        ("Свет зал", "зал", "light", 0),  # duplicate from the old get-then-create race
+        ("Колонка", "зал", "speaker", 0),
+        ("Колонка", "зал", "speaker", 0),
+    ])
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+
+    fresh_db.init_db()
+    assert fresh_db.schema_version() == len(MIGRATIONS)
+    devices = fresh_db.list_devices(DEFAULT_HOME)
+    assert [(d["type"], d["is_on"]) for d in devices] == [("light", True), ("speaker", False), ("speaker", False)]
+    with pytest.raises(sqlite3.IntegrityError):
+        with fresh_db.transaction() as conn:
+            conn.execute("INSERT INTO devices(name, room, type, home) VALUES('x', 'зал', 'light', ?)", (DEFAULT_HOME,))
+    with fresh_db.transaction() as conn:
+        conn.execute("INSERT INTO devices(name, room, type, home) VALUES('x', 'зал', 'light', 'other')")
+    assert fresh_db.list_homes() == [DEFAULT_HOME, "other"]
+
+
+def test_rollups_move_to_the_default_home(fresh_db):
+    conn = sqlite3.connect(fresh_db.DB_PATH)
+    for statements in MIGRATIONS[:4]:
+        for sql in statements:
+            conn.execute(sql)
+    conn.execute("INSERT INTO sensor_rollups VALUES('зал', 60, 100, 'temperature', 2, 44.0, 21.5, 22.5)")
+    conn.execute("PRAGMA user_version = 4")
+    conn.commit()
+    conn.close()
+
+    fresh_db.init_db()
+    assert fresh_db.latest_rollups(DEFAULT_HOME, 60) == [("зал", "temperature", 22.0)]
@@ -0,0 +1,14 @@
+from backend.metrics import percentiles
+from backend.validation import is_number
+
+
+def test_percentiles_nearest_rank():
+    assert percentiles(range(1, 101)) == {"n": 100, "p50": 50, "p95": 95, "p99": 99, "max": 100}
+    assert percentiles([0.0012, 0.0031], scale=1000, digits=2) == {"n": 2, "p50": 1.2, "p95": 3.1, "p99": 3.1, "max": 3.1}
+    assert percentiles([]) == {"n": 0, "p50": None, "p95": None, "p99": None, "max": None}
+
+
+def test_is_number():
+    assert is_number(20) and is_number(21.5) and is_number(-3)
+    for value in (True, "20", None, float("nan"), float("inf")):
+        assert not is_number(value)
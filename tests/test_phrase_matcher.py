@@ -0,0 +1,30 @@
+from backend.phrase_matcher import PhraseAutomaton, tokenize
+
+ROOMS = [("детской", "детская"), ("детской комнате", "детская"), ("комнате", "комната"), ("зале", "зал")]
+
+
+def test_tokenize():
+    assert tokenize("В детской комнате, и в Зале!") == ["в", "детской", "комнате", "и", "в", "зале"]
+
+
+def test_iter_matches_reports_every_occurrence():
+    matches = PhraseAutomaton(ROOMS).iter_matches(tokenize("в детской комнате"))
+    assert sorted(matches) == [(1, 2, "детская"), (1, 3, "детская"), (2, 3, "комната")]
+
+
+def test_find_keeps_leftmost_longest():
+    assert PhraseAutomaton(ROOMS).find("в детской комнате и в зале") == [(1, 3, "детская"), (5, 6, "зал")]
+
+
+def test_matches_whole_words_only():
+    assert PhraseAutomaton([("зал", "зал")]).find("залить цветы") == []
+
+
+def test_failure_links_find_overlapping_phrases():
+    automaton = PhraseAutomaton([("a b c", 1), ("b c d", 2), ("c", 3)])
+    assert sorted(automaton.iter_matches("a b c d".split())) == [(0, 3, 1), (1, 4, 2), (2, 3, 3)]
+    assert automaton.find("a b c d") == [(0, 3, 1)]
+
+
+def test_empty_automaton():
+    assert PhraseAutomaton().find("включи свет") == []
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from backend.pubsub import RESYNC, Hub, SubscriptionClosed
+
+
+def test_fan_out():
+    hub = Hub(maxsize=4)
+    a, b = hub.subscribe(), hub.subscribe()
+    hub.publish("x")
+    assert a.get_nowait() == b.get_nowait() == "x"
+    assert a.get_nowait() is None
+    assert hub.stats()["published"] == 1
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Hub(policy="block")
+
+
+def test_drop_oldest():
+    hub = Hub(maxsize=2, policy="drop_oldest")
+    slow = hub.subscribe()
+    for item in "abc":
+        hub.publish(item)
+    assert [slow.get_nowait(), slow.get_nowait(), slow.get_nowait()] == ["b", "c", None]
+    assert slow.dropped == hub.stats()["dropped"] == 1
+
+
+def test_coalesce_asks_for_a_resync():
+    hub = Hub(maxsize=2, policy="coalesce")
+    slow, fast = hub.subscribe(), hub.subscribe()
+    hub.publish("a")
+    assert fast.get_nowait() == "a"
+    hub.publish("b")
+    hub.publish("c")
+    assert fast.get_nowait() == "b"
+    assert fast.get_nowait() == "c"
+    # the backlog and the overflowing frame are gone; the snapshot replaces them
+    assert slow.get_nowait() is RESYNC
+    assert slow.get_nowait() is None
+    hub.publish("d")
+    assert slow.get_nowait() == "d"
+    assert hub.stats()["dropped"] == 3
+    assert len(hub) == 2
+
+
+def test_evict_closes_the_slow_consumer():
+    hub = Hub(maxsize=1, policy="evict")
+    slow, fast = hub.subscribe(), hub.subscribe()
+    hub.publish("a")
+    assert fast.get_nowait() == "a"
+    hub.publish("b")
+    assert fast.get_nowait() == "b"
+    with pytest.raises(SubscriptionClosed):
+        slow.get_nowait()
+    stats = hub.stats()
+    assert stats["evicted"] == 1 and stats["subscribers"] == 1
+
+
+def test_get_waits_and_wakes():
+    hub = Hub()
+    sub = hub.subscribe()
+    woken = []
+    sub.wakeup = lambda: woken.append(True)
+    assert sub.get(timeout=0.01) is None
+    threading.Timer(0.05, hub.publish, ("x",)).start()
+    assert sub.get(timeout=5) == "x"
+    assert woken
+
+
+def test_close_all():
+    hub = Hub()
+    sub = hub.subscribe()
+    hub.close_all()
+    with pytest.raises(SubscriptionClosed):
+        sub.get(timeout=5)
+    assert len(hub) == 0
+    hub.publish("x")
+    assert hub.stats()["total_subscribed"] == 1
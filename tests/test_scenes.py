@@ -0,0 +1,65 @@
+from backend.scenes import ALL_ROOMS, SCENES, Step, compile_plan, invalid_commands, scene_list
+
+
+def rooms_for(action):
+    return ["зал", "кухня"] if action.endswith("light") else ["спальня"]
+
+
+def test_single_command():
+    parsed = {"action": "turn_on_light", "params": {"room": "зал"}}
+    assert compile_plan(parsed, rooms_for) == [Step("turn_on_light", "зал", {"room": "зал"})]
+
+
+def test_several_rooms():
+    params = {"room": "кухня", "rooms": ["кухня", "зал"]}
+    plan = compile_plan({"action": "turn_off_light", "params": params}, rooms_for)
+    assert [(s.action, s.room) for s in plan] == [("turn_off_light", "кухня"), ("turn_off_light", "зал")]
+
+
+def test_scene_expands_all_rooms_in_order():
+    plan = compile_plan({"action": "run_scene", "params": {"scene": "night"}}, rooms_for)
+    assert [(s.action, s.room) for s in plan] == [
+        ("turn_off_light", "зал"),
+        ("turn_off_light", "кухня"),
+        ("set_temperature", "спальня"),
+    ]
+    assert plan[-1].params["value"] == 20
+
+
+def test_multiple_skips_what_changes_no_device():
+    parsed = {"action": "multiple", "params": {"actions": [
+        {"action": "set_timer", "params": {"value": 5, "unit": "минут"}},
+        {"action": "turn_on_light", "params": {"room": "зал"}},
+        {"action": "set_temperature", "params": {"room": "зал", "value": None}},
+        {"action": "turn_on_light", "params": {"room": None}},
+        "not a command",
+    ]}}
+    assert compile_plan(parsed, rooms_for) == [Step("turn_on_light", "зал", {"room": "зал"})]
+
+
+def test_unknown_scene_yields_nothing():
+    assert compile_plan({"action": "run_scene", "params": {"scene": "party"}}, rooms_for) == []
+
+
+def test_self_referencing_scene_stops(monkeypatch):
+    monkeypatch.setitem(SCENES, "loop", SCENES["night"]._replace(
+        name="loop", steps=(("run_scene", {"scene": "loop"}), ("turn_on_light", {"room": "зал"})),
+    ))
+    plan = compile_plan({"action": "run_scene", "params": {"scene": "loop"}}, rooms_for)
+    assert plan and all(step == Step("turn_on_light", "зал", {"room": "зал"}) for step in plan)
+
+
+def test_invalid_commands():
+    bad = {"action": "set_humidity", "params": {"room": "зал", "value": "много"}}
+    parsed = {"action": "multiple", "params": {"actions": [
+        {"action": "set_temperature", "params": {"room": "зал", "value": 21.5}},
+        bad,
+    ]}}
+    assert invalid_commands(parsed) == [bad]
+    assert invalid_commands({"action": "set_temperature", "params": {"value": True}})
+
+
+def test_scene_list():
+    night = next(scene for scene in scene_list() if scene["name"] == "night")
+    assert "спокойной ночи" in night["phrases"]
+    assert night["steps"][0] == {"action": "turn_off_light", "params": {"room": ALL_ROOMS}}
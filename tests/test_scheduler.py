@@ -0,0 +1,90 @@
+import math
+import time
+from datetime import datetime
+
+import pytest
+
+from backend.scheduler import MAX_AHEAD, Cron, Scheduler, valid_due
+
+
+def ts(*args):
+    return datetime(*args).timestamp()
+
+
+@pytest.mark.parametrize("expr, after, expected", [
+    ("0 23 * * *", ts(2026, 3, 10, 12, 0), ts(2026, 3, 10, 23, 0)),
+    ("0 23 * * *", ts(2026, 3, 10, 23, 0), ts(2026, 3, 11, 23, 0)),
+    ("*/15 * * * *", ts(2026, 3, 10, 12, 7, 30), ts(2026, 3, 10, 12, 15)),
+    ("30 8-18/2 * * *", ts(2026, 3, 10, 9, 0), ts(2026, 3, 10, 10, 30)),
+    ("0 0 1 * *", ts(2026, 1, 31, 12, 0), ts(2026, 2, 1, 0, 0)),
+    ("0 9 * * 1-5", ts(2026, 3, 13, 10, 0), ts(2026, 3, 16, 9, 0)),  # Friday -> Monday
+    ("0 9 * * 7", ts(2026, 3, 13, 10, 0), ts(2026, 3, 15, 9, 0)),  # 7 is Sunday too
+    # both day fields restricted: either one matches
+    ("0 12 20 * 1", ts(2026, 3, 10, 13, 0), ts(2026, 3, 16, 12, 0)),
+    ("0 0 29 2 *", ts(2026, 1, 1, 0, 0), ts(2028, 2, 29, 0, 0)),
+])
+def test_cron_next_after(expr, after, expected):
+    assert Cron(expr).next_after(after) == expected
+
+
+@pytest.mark.parametrize("expr", ["* * * *", "60 * * * *", "* 24 * * *", "a * * * *", "*/0 * * * *", "5-1 * * * *"])
+def test_cron_rejects(expr):
+    with pytest.raises(ValueError):
+        Cron(expr)
+
+
+def test_cron_that_never_fires():
+    with pytest.raises(ValueError):
+        Cron("0 0 31 2 *").next_after(time.time())
+
+
+def test_valid_due():
+    now = time.time()
+    assert valid_due(now + 60, now)
+    assert valid_due(0, now)
+    for due in (-1, now + MAX_AHEAD + 1, math.inf, math.nan):
+        assert not valid_due(due, now)
+
+
+@pytest.fixture
+def scheduler(fresh_db):
+    fresh_db.init_db()
+    return Scheduler(fire=lambda jobs: None)
+
+
+@pytest.mark.parametrize("due", [None, -1.0, math.inf, math.nan, 1e300])
+def test_add_rejects_bad_due(scheduler, due):
+    with pytest.raises(ValueError):
+        scheduler.add("default", "turn_on_light", {"room": "зал"}, due=due)
+    assert scheduler.jobs("default") == []
+
+
+def test_add_cancel_and_persist(scheduler, fresh_db):
+    later = scheduler.add("default", None, {}, label="чай", due=time.time() + 600)
+    sooner = scheduler.add("default", "turn_on_light", {"room": "зал"}, due=time.time() + 60)
+    scheduler.add("other", None, {}, cron="0 23 * * *")
+    assert [job["id"] for job in scheduler.jobs("default")] == [sooner["id"], later["id"]]
+    assert scheduler.cancel("other", sooner["id"]) is None
+    assert scheduler.cancel("default", sooner["id"])["id"] == sooner["id"]
+    assert {job["id"] for job in fresh_db.pending_jobs()} == {later["id"]} | {j["id"] for j in scheduler.jobs("other")}
+
+    restarted = Scheduler(fire=lambda jobs: None)
+    assert restarted.load(owns=lambda home: home == "default") == 1
+    assert restarted.jobs("default")[0]["label"] == "чай"
+
+
+def test_take_due_pops_one_shots_and_reschedules_crons(scheduler):
+    now = time.time()
+    once = scheduler.add("default", None, {}, due=now - 1)
+    every = scheduler.add("default", None, {}, cron="* * * * *")
+    scheduler.add("default", None, {}, due=now + 3600)
+    with scheduler._cond:
+        # as if the dispatcher had been busy when the minute came
+        every["due"] = now - 2
+        scheduler._push(every)
+        due, done, rescheduled = scheduler._take_due()
+    assert [job["id"] for job in due] == [every["id"], once["id"]]
+    assert done == [once["id"]]
+    assert rescheduled == [(every["due"], every["id"])] and every["due"] > now
+    assert due[0]["next_due"] == every["due"]
+    assert scheduler.stats()["pending"] == 2
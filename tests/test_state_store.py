@@ -0,0 +1,81 @@
+import json
+
+from backend.state_store import StateStore
+
+
+def delta(frame):
+    assert frame.startswith("id: ") and frame.endswith("\n\n")
+    return json.loads(frame[frame.index("\ndata: ") + 7:])
+
+
+def test_apply_emits_only_real_changes():
+    store = StateStore()
+    seq, frame = store.apply([("lights", "зал", True), ("lights", "кухня", False)])
+    assert seq == store.seq == 1
+    assert delta(frame) == {"seq": 1, "ops": [
+        {"op": "put", "path": ["lights", "зал"], "value": True},
+        {"op": "put", "path": ["lights", "кухня"], "value": False},
+    ]}
+    assert store.apply([("lights", "зал", True), ("lights", "спальня", None)]) is None
+    assert store.seq == 1
+    seq, frame = store.apply([("lights", "кухня", None)], events=[{"type": "timer", "id": 3}])
+    assert seq == 2
+    assert delta(frame)["ops"] == [{"op": "del", "path": ["lights", "кухня"]}]
+    assert delta(frame)["events"] == [{"type": "timer", "id": 3}]
+    assert store.snapshot()["lights"] == {"зал": True}
+
+
+def test_since_resumes_from_history():
+    store = StateStore(history=3)
+    frames = [store.apply([("lights", "зал", i % 2 == 0)]) for i in range(5)]
+    assert store.since(5) == []
+    assert store.since(3) == frames[3:]
+    assert store.since(2) == frames[2:]
+    # seq 2 fell out of the history: the client needs a snapshot
+    assert store.since(1) is None
+    assert store.since(6) is None
+
+
+def test_reset_takes_the_snapshot_seq():
+    store = StateStore()
+    store.apply([("lights", "зал", True)])
+    store.reset({"lights": {"кухня": True}, "devices": [{"id": 2}, {"id": 1}]}, seq=40)
+    assert store.seq == 40
+    assert store.since(39) is None
+    snapshot = store.snapshot()
+    assert snapshot["seq"] == 40
+    assert snapshot["lights"] == {"кухня": True}
+    assert snapshot["devices"] == [{"id": 1}, {"id": 2}]
+    store.reset({})
+    assert store.seq == 41
+
+
+def test_replica_follows_primary():
+    primary, replica = StateStore(), StateStore()
+    primary.apply([("devices", 1, {"id": 1, "is_on": False})])
+    replica.reset(primary.snapshot(), seq=primary.seq)
+    updates = [
+        primary.apply([("devices", 1, {"id": 1, "is_on": True}), ("thermometers", "зал", {"temperature": 21})]),
+        primary.apply([("devices", 1, None)]),
+    ]
+    for seq, frame in updates:
+        assert replica.follow(seq, frame)
+    assert replica.snapshot() == primary.snapshot()
+    assert replica.since(1) == updates
+
+
+def test_follow_refuses_a_gap():
+    primary, replica = StateStore(), StateStore()
+    primary.apply([("lights", "зал", True)])
+    seq, frame = primary.apply([("lights", "зал", False)])
+    assert not replica.follow(seq, frame)
+    assert replica.seq == 0 and replica.snapshot()["lights"] == {}
+
+
+def test_snapshot_frame_is_cached_per_seq():
+    store = StateStore()
+    first = store.snapshot_frame()
+    assert store.snapshot_frame() is first
+    store.apply([("lights", "зал", True)])
+    seq, frame = store.snapshot_frame()
+    assert seq == 1 and frame.startswith("id: 1\nevent: snapshot\n")